@@ -0,0 +1,230 @@
+"""
+Alert history fed by Alertmanager's webhook (/api/alerts/webhook).
+
+Alertmanager repeats every active alert of a group in each notification, so
+incoming alerts are merged in memory by (fingerprint, startsAt) and a storm
+collapses to one pending row per firing. A background thread writes the
+buffer in batched transactions (one SELECT of the rows that already exist,
+then bulk INSERT/UPDATE) every `interval` seconds, or as soon as `batch`
+rows are pending. Request threads never touch the database; when the buffer
+is full the webhook answers 503 and Alertmanager retries later.
+"""
+import atexit, datetime, hashlib, json, logging, re, threading, time
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import and_, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from backend.models import AlertEvent
+from backend.telemetry import ALERT_BUFFER, ALERT_EVENTS
+
+log = logging.getLogger(__name__)
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+_TS = re.compile(r"^(\d{4}-\d\d-\d\d[T ]\d\d:\d\d:\d\d)(\.\d+)?(Z|[+-]\d\d:\d\d)?$")
+_Key = Tuple[str, datetime.datetime]
+
+class BufferFull(Exception):
+    pass
+
+def parse_time(value: Any) -> Optional[datetime.datetime]:
+    """RFC 3339 (nanoseconds allowed) or unix seconds -> naive UTC; None for empty or Go's zero time."""
+    if value in (None, ""):
+        return None
+    if isinstance(value, (int, float)) or re.match(r"^\d+(\.\d+)?$", str(value)):
+        try:
+            return datetime.datetime.utcfromtimestamp(float(value))
+        except (OverflowError, OSError):
+            raise ValueError(f"timestamp out of range {value!r}")
+    m = _TS.match(str(value).strip())
+    if not m:
+        raise ValueError(f"invalid timestamp {value!r}")
+    if m.group(1).startswith("0001-"):
+        return None
+    zone = m.group(3) or "Z"
+    dt = datetime.datetime.fromisoformat(m.group(1) + (m.group(2) or "")[:7] + ("+00:00" if zone == "Z" else zone))
+    return dt.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+def parse_notification(payload: Any) -> List[Dict[str, Any]]:
+    """Alertmanager webhook body (version 4) -> row dicts; raises ValueError if it is not one."""
+    if not isinstance(payload, dict) or not isinstance(payload.get("alerts"), list):
+        raise ValueError("expected an Alertmanager webhook payload with an 'alerts' list")
+    now = datetime.datetime.utcnow()
+    events = []
+    for a in payload["alerts"]:
+        if not isinstance(a, dict):
+            raise ValueError("every alert must be an object")
+        labels = a.get("labels") or {}
+        starts = parse_time(a.get("startsAt"))
+        if not isinstance(labels, dict) or starts is None:
+            raise ValueError("every alert needs labels and startsAt")
+        status = "resolved" if a.get("status") == "resolved" else "firing"
+        fingerprint = a.get("fingerprint") or hashlib.sha1(
+            json.dumps(labels, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+        if not isinstance(fingerprint, str):
+            raise ValueError("an alert's fingerprint must be a string")
+        events.append({
+            "fingerprint": fingerprint, "alertname": labels.get("alertname", ""),
+            "instance": labels.get("instance", ""), "severity": labels.get("severity"), "status": status,
+            "starts_at": starts,
+            # A firing alert's endsAt is only Alertmanager's expiry guess
+            "ends_at": (parse_time(a.get("endsAt")) or now) if status == "resolved" else None,
+            "last_seen": now,
+            "labels": json.dumps(labels, sort_keys=True, separators=(",", ":")),
+            "annotations": json.dumps(a.get("annotations") or {}, sort_keys=True, separators=(",", ":")),
+        })
+    return events
+
+def _merge(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    """`new` wins, except that a resolved firing stays resolved (retries can deliver a stale 'firing')."""
+    out = dict(new)
+    if old["status"] == "resolved" and new["status"] != "resolved":
+        out["status"], out["ends_at"] = "resolved", old["ends_at"]
+    out["last_seen"] = max(old["last_seen"], new["last_seen"])
+    return out
+
+class AlertHistory:
+    def __init__(self, engine, interval: float = 1.0, batch: int = 1000, max_pending: int = 50000):
+        self.engine = engine
+        self.interval = interval
+        self.batch = batch
+        self.max_pending = max_pending
+        self._pending: Dict[_Key, Dict[str, Any]] = {}
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()  # the flusher thread and flush() at exit
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(self, payload: Any) -> Dict[str, int]:
+        """Buffer one notification; returns {"alerts", "merged"}. Raises ValueError or BufferFull."""
+        events = parse_notification(payload)
+        merged = 0
+        with self._cond:
+            fresh = {(e["fingerprint"], e["starts_at"]) for e in events} - self._pending.keys()
+            if len(self._pending) + len(fresh) > self.max_pending:
+                ALERT_EVENTS.labels("rejected").inc(len(events))
+                raise BufferFull(f"{len(self._pending)} alerts waiting to be written")
+            for e in events:
+                key = (e["fingerprint"], e["starts_at"])
+                old = self._pending.get(key)
+                if old is not None:
+                    merged += 1
+                    e = _merge(old, e)
+                self._pending[key] = e
+            ALERT_BUFFER.set(len(self._pending))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="alert-history", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+            if len(self._pending) >= self.batch:
+                self._cond.notify()
+        ALERT_EVENTS.labels("received").inc(len(events))
+        ALERT_EVENTS.labels("merged").inc(merged)
+        return {"alerts": len(events), "merged": merged}
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._pending)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                if len(self._pending) < self.batch:
+                    self._cond.wait(self.interval)
+            self.flush()
+
+    def flush(self):
+        """Write everything buffered so far; on failure it goes back into the buffer for the next round."""
+        with self._write_lock:
+            with self._cond:
+                events, self._pending = list(self._pending.values()), {}
+            for i in range(0, len(events), self.batch):
+                chunk = events[i:i + self.batch]
+                try:
+                    self._write(chunk)
+                except Exception as e:
+                    log.warning("Writing %d alert events failed, will retry: %s", len(events) - i, e)
+                    self._requeue(events[i:])
+                    time.sleep(self.interval)
+                    break
+                ALERT_EVENTS.labels("written").inc(len(chunk))
+            with self._cond:
+                ALERT_BUFFER.set(len(self._pending))
+
+    def _requeue(self, events: List[Dict[str, Any]]):
+        with self._cond:
+            for e in events:
+                key = (e["fingerprint"], e["starts_at"])
+                newer = self._pending.get(key)
+                self._pending[key] = _merge(e, newer) if newer is not None else e
+
+    def _write(self, events: List[Dict[str, Any]]):
+        for attempt in (1, 2):
+            try:
+                return self._upsert(events)
+            except IntegrityError:
+                if attempt == 2:  # another worker inserted the same firing meanwhile; second pass updates it
+                    raise
+
+    def _upsert(self, events: List[Dict[str, Any]]):
+        with Session(self.engine) as s:
+            rows = s.execute(select(AlertEvent.id, AlertEvent.fingerprint, AlertEvent.starts_at, AlertEvent.status,
+                                    AlertEvent.ends_at, AlertEvent.last_seen)
+                             .where(AlertEvent.fingerprint.in_({e["fingerprint"] for e in events}),
+                                    AlertEvent.starts_at >= min(e["starts_at"] for e in events)))
+            existing = {(r.fingerprint, r.starts_at): r for r in rows}
+            fresh, changed = [], []
+            for e in events:
+                row = existing.get((e["fingerprint"], e["starts_at"]))
+                if row is None:
+                    fresh.append(e)
+                else:
+                    e = _merge({"status": row.status, "ends_at": row.ends_at, "last_seen": row.last_seen}, e)
+                    changed.append(dict(e, id=row.id))
+            if fresh:
+                s.execute(insert(AlertEvent), fresh)
+            if changed:
+                s.execute(update(AlertEvent), changed)
+            s.commit()
+
+def _cursor(row: Dict[str, Any]) -> str:
+    return f"{row['starts_at']}|{row['id']}"
+
+def history(engine, alertname: Optional[str] = None, instance: Optional[str] = None, status: Optional[str] = None,
+            since: Optional[datetime.datetime] = None, until: Optional[datetime.datetime] = None,
+            after: Optional[str] = None, limit: int = PAGE_SIZE) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Alert firings that started in [since, until), newest first, and the cursor
+    for the next page. Keyset pagination on (starts_at, id) walks one of the
+    alert_events indexes, so deep pages cost the same as the first.
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    stmt = select(AlertEvent)
+    if alertname:
+        stmt = stmt.where(AlertEvent.alertname == alertname)
+    if instance:
+        stmt = stmt.where(AlertEvent.instance == instance)
+    if status:
+        stmt = stmt.where(AlertEvent.status == status)
+    if since:
+        stmt = stmt.where(AlertEvent.starts_at >= since)
+    if until:
+        stmt = stmt.where(AlertEvent.starts_at < until)
+    if after:
+        when, _, last_id = after.rpartition("|")
+        try:
+            when, last_id = datetime.datetime.fromisoformat(when), int(last_id)
+        except ValueError:
+            raise ValueError("invalid cursor")
+        stmt = stmt.where(or_(AlertEvent.starts_at < when, and_(AlertEvent.starts_at == when, AlertEvent.id < last_id)))
+    stmt = stmt.order_by(AlertEvent.starts_at.desc(), AlertEvent.id.desc()).limit(limit + 1)
+    now = datetime.datetime.utcnow()
+    with Session(engine) as s:
+        rows = [{"id": e.id, "fingerprint": e.fingerprint, "alertname": e.alertname, "instance": e.instance,
+                 "severity": e.severity, "status": e.status, "starts_at": e.starts_at, "ends_at": e.ends_at,
+                 "duration_s": round(((e.ends_at or now) - e.starts_at).total_seconds(), 1),
+                 "last_seen": e.last_seen, "labels": json.loads(e.labels), "annotations": json.loads(e.annotations)}
+                for e in s.execute(stmt).scalars()]
+    more = len(rows) > limit
+    rows = rows[:limit]
+    return rows, (_cursor(rows[-1]) if more else None)
@@ -1,59 +1,277 @@
-import json, os, requests
-from flask import Flask, render_template, request, redirect, url_for, flash, abort, jsonify
+import hmac, json, logging, math, threading, time
+from typing import Any, Callable, Dict, Optional
+from flask import Flask, Response, render_template, request, redirect, url_for, flash, abort, jsonify, g
 from flask_wtf import FlaskForm
 from flask_wtf.csrf import CSRFProtect, CSRFError
 from wtforms import StringField, PasswordField, SubmitField, SelectField, IntegerField
 from wtforms.validators import DataRequired, Email, Length, NumberRange
 from flask_login import LoginManager, login_user, logout_user, current_user, login_required
-from sqlalchemy import create_engine, select
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from backend.config import Settings
-from backend.models import Base, User
-from backend.grafana_api import ensure_prometheus_datasource, ensure_folder, upsert_dashboard, list_datasources, list_dashboards
-from backend.prom_alerts import build_rules_yaml, write_rules_and_reload
-from flask_cors import CORS  # Optional if serving frontend elsewhere
-import requests
+from backend.models import User
+from backend.db import get_engine
+from backend.users import (list_users, create_user, import_users, export_users, parse_rows, ensure_default_admin,
+                           PAGE_SIZE as USERS_PAGE_SIZE)
+from backend.login_throttle import LoginThrottle, LoginThrottled, make_store
+from backend import telemetry
+# The Grafana, Prometheus, rule-file and live-metrics modules (requests, urllib3, PyYAML) are imported
+# where they are first used, so a worker that only serves login and user pages never loads them.
 
 settings = Settings()
-app = Flask(__name__)
-# If your HTML is served from the same Flask app, you can remove CORS.
-CORS(app)
-app = Flask(__name__, template_folder="../templates", static_folder="../static")
-app.config["SECRET_KEY"] = settings.SECRET_KEY
-# Keep CSRF enabled globally for security, but can disable via .env if needed
-app.config["WTF_CSRF_ENABLED"] = True  # can toggle via .env below
-# CSRFProtect(app)
-csrf = CSRFProtect(app)
-
-@app.errorhandler(CSRFError)
+log = logging.getLogger(__name__)  # same logger as app.logger (the app is named after this module)
+csrf = CSRFProtect()
+login_manager = LoginManager()
+login_manager.login_view = "login"
+
+# Routes and error handlers are collected here and attached to each app by create_app()
+_views = []
+_error_handlers = []
+
+def route(rule: str, **options):
+    def decorator(f):
+        _views.append((rule, options, f))
+        return f
+    return decorator
+
+def errorhandler(code_or_exception):
+    def decorator(f):
+        _error_handlers.append((code_or_exception, f))
+        return f
+    return decorator
+
+def create_app(config: Optional[Dict[str, Any]] = None) -> Flask:
+    """
+    Build the Flask app. This is cheap: the database, Grafana and Prometheus
+    clients, health probes, rule publisher and live-metrics poller are
+    created on first use (see the getters below), not here.
+    """
+    if not settings.GRAFANA_TOKEN:
+        # Login, users and thresholds work without it; Grafana routes fail with this same message
+        log.warning("GRAFANA_TOKEN is not set. Export your service account token.")
+    if not settings.ALERT_WEBHOOK_TOKEN:
+        log.warning("ALERT_WEBHOOK_TOKEN is not set: /api/alerts/webhook accepts notifications from anyone "
+                    "who can reach SRD.")
+    app = Flask(__name__, template_folder="../templates", static_folder="../static")
+    app.config["SECRET_KEY"] = settings.SECRET_KEY
+    # Keep CSRF enabled globally for security, but can disable via .env if needed
+    app.config["WTF_CSRF_ENABLED"] = True  # can toggle via .env below
+    app.config.update(config or {})
+    csrf.init_app(app)
+    login_manager.init_app(app)
+    for code_or_exception, handler in _error_handlers:
+        app.register_error_handler(code_or_exception, handler)
+    for rule, options, view in _views:
+        app.add_url_rule(rule, view_func=view, **options)
+    app.before_request(_start_timer)
+    app.after_request(_observe_request)
+    if settings.PROXY_FIX_X_FOR:
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=settings.PROXY_FIX_X_FOR)
+    return app
+
+def _start_timer():
+    g.request_start = time.perf_counter()
+
+def _observe_request(response):
+    """Per-route latency and status counts for /metrics (endpoint name, never the raw path)."""
+    start = g.pop("request_start", None)
+    if start is not None:
+        endpoint = request.endpoint or "unmatched"
+        telemetry.HTTP_DURATION.labels(request.method, endpoint).observe(time.perf_counter() - start)
+        telemetry.HTTP_REQUESTS.labels(request.method, endpoint, str(response.status_code)).inc()
+    return response
+
+def _once(factory: Callable[[], Any]) -> Callable[[], Any]:
+    """Getter that builds the object on its first call (once per process, thread-safe)."""
+    lock = threading.Lock()
+    box = []
+
+    def get():
+        if not box:
+            with lock:
+                if not box:
+                    box.append(factory())
+        return box[0]
+    get.__name__ = factory.__name__
+    get.__doc__ = factory.__doc__
+    return get
+
+@_once
+def get_app() -> Flask:
+    """The process-wide app behind `backend.app:app` (gunicorn) and backend/asgi.py."""
+    app = create_app()
+    if settings.CAPACITY_COLLECT:
+        try:
+            capacity_store()  # starts the background collector (one process per store directory collects)
+        except ImportError:
+            log.warning("Capacity collection is off: numpy is not installed.")
+    return app
+
+def __getattr__(name):
+    if name == "app":
+        return get_app()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+@errorhandler(CSRFError)
 def handle_csrf_error(e):
     return render_template("index.html") + f"<pre class='codeblock'>CSRF error: {e.description}</pre>", 400
 # CSRFProtect(app)  # Enable CSRF protection globally
 
-@app.errorhandler(500)
+@errorhandler(500)
 def internal_error(e):
-    app.logger.exception("Unhandled 500", exc_info=e)
+    log.exception("Unhandled 500", exc_info=e)
     # Render a simple page that extends index.html (1 block only)
     return render_template("error.html", error=e), 500
 
-GRAFANA_URL = os.environ.get("GRAFANA_URL", "http://localhost:3001")
-GRAFANA_TOKEN = os.environ.get("GRAFANA_TOKEN")  # REQUIRED
+# --- Subsystems, each built on first use ---
 
-if not GRAFANA_TOKEN:
-  # Fail fast so you know to set it
-  raise RuntimeError("GRAFANA_TOKEN is not set. Export your service account token.")
+@_once
+def db_engine():
+    engine = get_engine()
+    log.info("SRD database -> %s", engine.url.render_as_string(hide_password=True))
+    # Create the default admin only once (first ever run), when the process first needs the database
+    if ensure_default_admin(engine):
+        log.warning("Default admin created: admin@srd.local / ChangeMe123! (please change)")
+    return engine
 
-engine = create_engine("sqlite:///srd_users.db", echo=False, future=True)
-Base.metadata.create_all(engine)
+@_once
+def configured_backends():
+    """Prometheus shards (and their Grafanas) that status, rule publishing and provisioning fan out to."""
+    from backend.backends import load_backends
+    return load_backends(settings)
 
-login_manager = LoginManager()
-login_manager.login_view = "login"
-login_manager.init_app(app)
+def grafana_backends():
+    backends = [b for b in configured_backends() if b.grafana_url]
+    if not backends:
+        raise ValueError("no configured backend has a grafana_url")
+    return backends
+
+_dashboard_stores = {}
+
+def dashboard_store(grafana_url=None):
+    """Hashes of what we last pushed to a Grafana (default GRAFANA_URL), so unchanged dashboards are not re-uploaded."""
+    from backend.provisioning import DashboardHashStore
+    url = grafana_url or settings.GRAFANA_URL
+    store = _dashboard_stores.get(url)
+    if store is None:
+        store = _dashboard_stores.setdefault(url, DashboardHashStore(db_engine(), url))
+    return store
+
+@_once
+def dashboard_sources():
+    """Dashboards are edited as versioned JSON Patch revisions in the database, seeded from backend/grafana."""
+    from backend.dashboard_sources import DashboardSources
+    return DashboardSources(db_engine(), snapshot_every=settings.DASHBOARD_SNAPSHOT_EVERY,
+                            check_interval=settings.DASHBOARD_CHECK_INTERVAL)
+
+@_once
+def health():
+    """Backend health is probed in the background; /api/status only reads the cached result."""
+    from backend.health import HealthMonitor
+    monitor = HealthMonitor(interval=settings.HEALTH_PROBE_INTERVAL, ttl=settings.HEALTH_TTL,
+                            timeout=settings.HEALTH_PROBE_TIMEOUT)
+    for b in configured_backends():
+        timeout = min(settings.HEALTH_PROBE_TIMEOUT, b.timeout)
+        monitor.add_probe(b.prom_probe, b.prometheus_url, timeout=timeout)
+        if b.grafana_probe:
+            monitor.add_probe(b.grafana_probe, f"{b.grafana_url}/api/health", headers=_grafana_headers(b.grafana_token),
+                              timeout=timeout)
+    monitor.start()
+    return monitor
+
+def backend_status():
+    """
+    Last probe results per backend. The top-level "prometheus"/"grafana" flags
+    are only true when every backend's is up; "status" is ok, partial or down.
+    """
+    probes = health().status()
+    per = {}
+    for b in configured_backends():
+        per[b.name] = {"prometheus": probes.get(b.prom_probe, False)}
+        if b.grafana_probe:
+            per[b.name]["grafana"] = probes.get(b.grafana_probe, False)
+    grafanas = [s["grafana"] for s in per.values() if "grafana" in s]
+    ups = [up for s in per.values() for up in s.values()]
+    return {"prometheus": all(s["prometheus"] for s in per.values()), "grafana": bool(grafanas) and all(grafanas),
+            "status": "ok" if all(ups) else ("partial" if any(ups) else "down"), "backends": per}
+
+@_once
+def rule_publisher():
+    """Rule files are written atomically; reloads of every backend are coalesced off the request thread."""
+    from backend.prom_alerts import RulePublisher
+    return RulePublisher(db_engine(), configured_backends(), window=settings.RULES_RELOAD_WINDOW,
+                         lock_path=settings.RULES_LOCK_FILE or f"{settings.PROM_RULES_PATH}.lock")
+
+@_once
+def host_targets():
+    """file_sd shards of the host inventory; brought in line with the database on first use."""
+    from backend.file_sd import TargetFiles
+    targets = TargetFiles(db_engine(), settings.HOST_SD_DIR, group_label=settings.ALERT_GROUP_LABEL)
+    targets.sync()
+    return targets
+
+@_once
+def capacity_store():
+    """Local 5-minute capacity aggregates; the collector runs in whichever worker takes the store's lock."""
+    from backend.capacity import CapacityStore, CapacityCollector
+    from backend.prom_alerts import UTILISATION_RULES
+    store = CapacityStore(settings.CAPACITY_DIR, retention_days=settings.CAPACITY_RETENTION_DAYS,
+                          group_label=settings.ALERT_GROUP_LABEL)
+    proxy = prom_proxy()
+    store.collector = CapacityCollector(
+        store, lambda expr, start, end, step: proxy.fetch_range(expr, start, end, step, timeout=settings.CAPACITY_TIMEOUT),
+        {metric: rule for metric, (rule, _) in UTILISATION_RULES.items()}, interval=settings.CAPACITY_INTERVAL,
+        backfill_days=settings.CAPACITY_BACKFILL_DAYS)
+    if settings.CAPACITY_COLLECT:
+        store.collector.start()
+    return store
+
+@_once
+def alert_history():
+    """Buffers Alertmanager webhook notifications and writes them to alert_events in batches."""
+    from backend.alert_history import AlertHistory
+    return AlertHistory(db_engine(), interval=settings.ALERT_FLUSH_INTERVAL, batch=settings.ALERT_FLUSH_BATCH,
+                        max_pending=settings.ALERT_BUFFER_MAX)
+
+@_once
+def prom_proxy():
+    """Cached PromQL proxy for the dashboard's own queries (user_home)."""
+    from backend.prom_query import PromQueryProxy
+    return PromQueryProxy(settings.PROMETHEUS_URL, {}, scrape_interval=settings.PROM_SCRAPE_INTERVAL,
+                          max_entries=settings.PROM_QUERY_CACHE_SIZE)
+
+@_once
+def live_hub():
+    """One poller feeds every /api/metrics/stream subscriber (deltas only)."""
+    from backend.prom_query import PromQueryProxy
+    from backend.live_metrics import LiveMetricsHub, LIVE_SERIES
+    return LiveMetricsHub(PromQueryProxy(settings.PROMETHEUS_URL, LIVE_SERIES,
+                                         scrape_interval=settings.PROM_SCRAPE_INTERVAL).query,
+                          interval=settings.LIVE_METRICS_INTERVAL, status=backend_status)
+
+@_once
+def user_cache():
+    """Authenticated requests resolve the session's user from memory; see backend/user_cache.py."""
+    from backend.user_cache import UserCache
+    return UserCache(db_engine(), ttl=settings.USER_CACHE_TTL, marker_path=settings.USER_CACHE_MARKER)
+
+@_once
+def login_throttle():
+    """Rejects login floods per IP/account before any password hashing, and caps concurrent hash checks."""
+    return LoginThrottle(make_store(settings.LOGIN_THROTTLE_STORE),
+                         ip_per_min=settings.LOGIN_IP_PER_MIN, ip_burst=settings.LOGIN_IP_BURST,
+                         account_per_min=settings.LOGIN_ACCOUNT_PER_MIN,
+                         account_burst=settings.LOGIN_ACCOUNT_BURST,
+                         max_hashes=settings.LOGIN_HASH_CONCURRENCY, hash_wait=settings.LOGIN_HASH_WAIT)
+
+def _grafana_headers(token=None):
+    return {"Authorization": f"Bearer {token or settings.GRAFANA_TOKEN}", "Content-Type": "application/json"}
 
 @login_manager.user_loader
 def load_user(user_id):
-    with Session(engine) as s:
-        return s.get(User, int(user_id))
+    user = user_cache().get(int(user_id))
+    return user if user is not None and user.is_active else None
 
 class LoginForm(FlaskForm):
     # Disable CSRF for this form only (keeps CSRF enabled elsewhere)
@@ -85,12 +303,15 @@ def require_admin():
     if not current_user.is_authenticated or current_user.role != "admin":
         abort(403)
 
-def _grafana_headers():
-    return {"Authorization": f"Bearer {settings.GRAFANA_TOKEN}", "Content-Type": "application/json"}
+def grafana_inventory():
+  """Cached datasources/folders/dashboards of our Grafana (see backend/grafana_inventory.py)."""
+  from backend.grafana_api import get_inventory
+  return get_inventory(settings.GRAFANA_URL, settings.GRAFANA_TOKEN)
 
 def gf(path, method="GET", body=None, params=None):
-  url = f"{GRAFANA_URL}{path}"
-  resp = requests.request(method, url, headers=g_headers(), json=body, params=params, timeout=30)
+  import requests
+  from backend.grafana_api import get_client
+  resp = get_client(settings.GRAFANA_URL, settings.GRAFANA_TOKEN).request(method, path, json=body, params=params, timeout=30)
   # Raise for non-2xx to catch in try/except for clearer errors
   if not resp.ok:
     # Try to extract Grafana error message
@@ -109,15 +330,16 @@ def ensure_datasource(ds_payload):
   """
   Try to create the datasource. If it already exists, return its info.
   """
+  import requests
+  from backend.grafana_inventory import MISS_RELIST
   try:
     created = gf("/api/datasources", method="POST", body=ds_payload)
+    grafana_inventory().note_datasource(created.get("datasource") or {})
     return {"created": True, "data": created}
   except requests.HTTPError as e:
-    # Datasource may already exist; try to GET by name
+    # Datasource may already exist; find it by name in the inventory
     if "409" in str(e) or "already exists" in str(e).lower():
-      # List and find by name
-      all_ds = gf("/api/datasources")
-      match = next((d for d in all_ds if d.get("name") == ds_payload.get("name")), None)
+      match = grafana_inventory().datasource_by_name(ds_payload.get("name"), miss_relist=MISS_RELIST)
       if match:
         return {"created": False, "data": match}
     # Unexpected error
@@ -127,14 +349,16 @@ def ensure_folder(title):
   """
   Create folder (POST /api/folders). If exists, return existing by title.
   """
+  import requests
+  from backend.grafana_inventory import MISS_RELIST
   try:
     created = gf("/api/folders", method="POST", body={"title": title})
+    grafana_inventory().note_folder(created)
     return {"created": True, "data": created}
   except requests.HTTPError as e:
-    # If already exists, list and return the one with matching title
+    # If already exists, return the one with matching title from the inventory
     if "409" in str(e) or "already exists" in str(e).lower():
-      folders = gf("/api/folders")
-      match = next((f for f in folders if f.get("title") == title), None)
+      match = grafana_inventory().folder_by_title(title, miss_relist=MISS_RELIST)
       if match:
         return {"created": False, "data": match}
     raise
@@ -159,17 +383,20 @@ def upsert_dashboard(dashboard_payload, folder_uid):
     "folderUid": folder_uid,
     "overwrite": True
   }
-  return gf("/api/dashboards/db", method="POST", body=body)
+  res = gf("/api/dashboards/db", method="POST", body=body)
+  grafana_inventory().note_dashboard(res.get("uid"), base_dashboard["title"], res.get("url"), folder_uid,
+                                     res.get("version"))
+  return res
 
 # --- Routes ---
 
-@app.route("/")
+@route("/")
 def index():
     if current_user.is_authenticated:
         return redirect(url_for("admin_home" if current_user.role=="admin" else "user_home"))
     return redirect(url_for("login"))
 
-'''@app.route("/login", methods=["GET","POST"])               # removed to disable login for now
+'''@route("/login", methods=["GET","POST"])               # removed to disable login for now
 def login():
     # Create default admin only once (first ever run)
     with Session(engine) as s:
@@ -201,27 +428,37 @@ def login():
 
 # Login (CSRF exempt so it won’t block)
 @csrf.exempt
-@app.route("/login", methods=["GET","POST"])
+@route("/login", methods=["GET","POST"])
 def login():
-    # Create default admin only once (first ever run)
-    with Session(engine) as s:
-        if s.query(User).count() == 0:
-            admin = User(email="admin@srd.local", name="Admin", role="admin")
-            admin.set_password("ChangeMe123!")
-            s.add(admin); s.commit()
-            flash("Default admin created: admin@srd.local / ChangeMe123! (please change)", "warning")
-
     form = LoginForm()
 
     if request.method == "POST":
         # No CSRF/email hurdles here; just authenticate
-        email = (form.email.data or "").strip().lower()
+        email = (form.email.data or "").strip()
         pwd   = form.password.data or ""
-        with Session(engine) as s:
-            user = s.execute(select(User).where(User.email == form.email.data)).scalar_one_or_none()
-            if user and user.is_active and user.check_password(form.password.data):
-                login_user(user)
-                return redirect(url_for("index"))
+        try:
+            login_throttle().check(request.remote_addr or "", email)
+            generation = user_cache().generation()
+            with Session(db_engine()) as s:
+                user = s.execute(select(User).where(User.email == email)).scalar_one_or_none()
+                if user is not None:
+                    s.expunge(user)  # don't hold a pooled connection while waiting for a hash slot
+            if user and user.is_active:
+                with login_throttle().verifying():
+                    with telemetry.LOGIN_HASH_DURATION.time():
+                        ok = user.check_password(pwd)
+                if ok:
+                    telemetry.LOGIN_ATTEMPTS.labels("success").inc()
+                    login_throttle().succeeded(email)
+                    user_cache().put(user, generation)
+                    login_user(user)
+                    return redirect(url_for("index"))
+        except LoginThrottled as e:
+            telemetry.LOGIN_ATTEMPTS.labels("throttled").inc()
+            retry = max(1, round(e.retry_after))
+            flash(f"{str(e).capitalize()}. Try again in {retry} s.", "danger")
+            return render_template("login.html", form=form), 429, {"Retry-After": str(retry)}
+        telemetry.LOGIN_ATTEMPTS.labels("failure").inc()
         flash("Invalid credentials or inactive account.", "danger")
         # PRG: redirect so the form is a fresh GET (fields empty)
         return render_template("login.html", form=form)
@@ -230,69 +467,142 @@ def login():
     form.process(formdata=None)
     return render_template("login.html", form=form)
 
-@app.route("/logout")
+@route("/logout")
 @login_required
 def logout():
     logout_user()
     return redirect(url_for("login"))
 
+def _bearer_ok(token: str) -> bool:
+    """Whether the request carries `Authorization: Bearer <token>` (constant-time; an empty token allows all)."""
+    if not token:
+        return True
+    sent = request.headers.get("Authorization", "").encode("utf-8")
+    return hmac.compare_digest(sent, f"Bearer {token}".encode("utf-8"))
+
+# --- Prometheus scrape endpoint (no session; optional bearer token) ---
+@route("/metrics")
+def metrics():
+    if not _bearer_ok(settings.METRICS_TOKEN):
+        abort(401)
+    body, content_type = telemetry.render()
+    return Response(body, content_type=content_type)
+
 # --- JSON status endpoint ---
-@app.route("/api/status")
+@route("/api/status")
 @login_required
 def api_status():
-    status = {"prometheus": False, "grafana": False}
-    try:
-        r = requests.get(settings.PROMETHEUS_URL, timeout=2)
-        status["prometheus"] = (r.status_code == 200)
-    except Exception:
-        status["prometheus"] = False
-    try:
-        r = requests.get(f"{settings.GRAFANA_URL}/api/health", headers=_grafana_headers(), timeout=2)
-        status["grafana"] = (r.status_code == 200)
-    except Exception:
-        status["grafana"] = False
-    return jsonify(status)
+    return jsonify(backend_status())
 
 # --- Admin area ---
-@app.route("/admin")
+@route("/admin")
 @login_required
 def admin_home():
     require_admin()
     return render_template("admin_home.html", prom_ok=True, graf_ok=True, settings=settings)
 
 
-@app.route("/admin/users", methods=["GET","POST"])
+def _user_filters(args):
+    active = args.get("active", "")
+    return {"q": args.get("q") or None, "role": args.get("role") or None,
+            "active": None if active == "" else active in ("1", "true", "yes")}
+
+@route("/admin/users", methods=["GET","POST"])
 @login_required
 def manage_users():
     require_admin()
     form = UserForm()
     created = None
     if form.validate_on_submit():
-        with Session(engine) as s:
-            if s.execute(select(User).where(User.email==form.email.data)).first():
-                flash("Email already exists", "danger")
-            else:
-                u = User(email=form.email.data, name=form.name.data, role=form.role.data)
-                u.set_password(form.password.data)
-                s.add(u); s.commit()
-                created = u
-                flash("User created", "success")
-    with Session(engine) as s:
-        users = s.query(User).all()
-    return render_template("manage_users.html", users=users, form=form, created=created)
+        try:
+            created = create_user(db_engine(), form.email.data, form.name.data, form.role.data, form.password.data)
+            flash("User created", "success")
+        except ValueError as e:
+            flash(str(e), "danger")
+    filters = _user_filters(request.args)
+    users, next_cursor = list_users(db_engine(), after=request.args.get("after") or None, **filters)
+    return render_template("manage_users.html", users=users, form=form, created=created,
+                           filters=request.args, next_cursor=next_cursor)
+
+@route("/api/users")
+@login_required
+def api_users():
+    """?q=&role=&active=&after=<cursor>&limit= -> {users, next}; pass `next` back as `after`."""
+    require_admin()
+    try:
+        limit = int(request.args.get("limit", USERS_PAGE_SIZE))
+    except ValueError:
+        return jsonify({"ok": False, "error": "limit must be an integer"}), 400
+    users, next_cursor = list_users(db_engine(), after=request.args.get("after") or None, limit=limit,
+                                    **_user_filters(request.args))
+    return jsonify({"users": users, "next": next_cursor})
 
-@app.route("/admin/users/<int:user_id>/toggle")
+@route("/api/users/export")
+@login_required
+def api_users_export():
+    """?format=csv|jsonl[&hashes=1] -- streamed; hashes=1 adds password_hash for migrating to another SRD."""
+    require_admin()
+    fmt = request.args.get("format", "csv")
+    try:
+        body = export_users(db_engine(), fmt, include_hashes=request.args.get("hashes") == "1")
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    mimetype = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    return Response(body, mimetype=mimetype,
+                    headers={"Content-Disposition": f"attachment; filename=srd_users.{fmt}"})
+
+def _upload():
+    """Records from an uploaded file (form field `file`) or the raw body; format from ?format= or the name."""
+    upload = request.files.get("file")
+    name = upload.filename if upload else ""
+    fmt = request.args.get("format") or request.form.get("format") or (
+        "jsonl" if name.endswith((".jsonl", ".ndjson")) or "ndjson" in (request.content_type or "") else "csv")
+    data = (upload.read() if upload else request.get_data()).decode("utf-8-sig")
+    return parse_rows(data, fmt)
+
+def _import_request():
+    """Users to import from the request (see _upload)."""
+    return import_users(db_engine(), _upload(), batch_size=settings.USER_IMPORT_BATCH)
+
+@route("/api/users/import", methods=["POST"])
+@login_required
+def api_users_import():
+    """CSV (header: email,name,role,is_active,password|password_hash) or JSONL; 207 if some records were rejected."""
+    require_admin()
+    try:
+        summary = _import_request()
+    except (ValueError, UnicodeDecodeError) as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    return jsonify(summary), (200 if summary["ok"] else 207)
+
+@route("/admin/users/import", methods=["POST"])
+@login_required
+def import_users_form():
+    require_admin()
+    try:
+        summary = _import_request()
+    except (ValueError, UnicodeDecodeError) as e:
+        flash(f"Import failed: {e}", "danger")
+        return redirect(url_for("manage_users"))
+    flash(f"Imported {summary['created']} users, skipped {summary['skipped']} existing.",
+          "success" if summary["ok"] else "warning")
+    for err in summary["errors"][:10]:
+        flash(f"Line {err['line']}: {err['error']}", "danger")
+    return redirect(url_for("manage_users"))
+
+@route("/admin/users/<int:user_id>/toggle")
 @login_required
 def toggle_user(user_id):
     require_admin()
-    with Session(engine) as s:
+    with Session(db_engine()) as s:
         u = s.get(User, user_id)
         if not u: abort(404)
         u.is_active = not u.is_active
         s.commit()
+    user_cache().invalidate(user_id)  # a deactivated user is locked out on their next request
     return redirect(url_for("manage_users"))
 
-@app.route("/admin/provision", methods=["POST"])
+@route("/admin/provision", methods=["POST"])
 @login_required
 def provision():
   """
@@ -303,6 +613,7 @@ def provision():
     "dashboard": { uid, title, panels? }
   }
   """
+  import requests
   try:
     payload = request.get_json(force=True) or {}
     ds_payload = payload.get("datasource") or {
@@ -327,7 +638,7 @@ def provision():
 
     return jsonify({
       "ok": True,
-      "grafana_url": GRAFANA_URL,
+      "grafana_url": settings.GRAFANA_URL,
       "datasource": ds_result,
       "folder": folder_result,
       "dashboard": dash_result
@@ -338,54 +649,121 @@ def provision():
   except Exception as e:
     return jsonify({"ok": False, "error": str(e)}), 500
 
-@app.route("/admin/provision-all", methods=["POST"])
+@route("/admin/provision-all", methods=["POST"])
 @login_required
 def provision_all():
+    """Provision the default dashboard on every backend's Grafana at once (see fanned_out for the result)."""
+    from backend.backends import fan_out
     require_admin()
+    force = request.args.get("force") == "1" or bool((request.get_json(silent=True) or {}).get("force"))
+    started = time.perf_counter()
+    try:
+        backends = grafana_backends()
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    results = fan_out(backends, lambda b: provision_all_on(b, force), "provision")
+    telemetry.PROVISION_DURATION.labels("all").observe(time.perf_counter() - started)
+    status, payload = fanned_out(results)
+    return jsonify(payload), status
 
-    # 1) Ensure Prometheus datasource
-    prom_uid, _ = ensure_prometheus_datasource(settings.GRAFANA_URL, settings.GRAFANA_TOKEN, settings.PROMETHEUS_URL)
+def provision_all_on(b, force=False, template=None):
+    """Push one dashboard source (default: the main dashboard) to backend `b`'s Grafana."""
+    from backend import grafana_api
+    from backend.provisioning import DEFAULT_TEMPLATE, datasource_name, render_dashboard, push_dashboard, with_suffix
+
+    # 1) Ensure this backend's Prometheus datasource
+    prom_uid, _ = grafana_api.ensure_prometheus_datasource(b.grafana_url, b.grafana_token, b.prometheus_url,
+                                                           name=datasource_name(b.suffix), is_default=not b.suffix)
 
     # 2) Ensure folder
-    folder_uid = ensure_folder(settings.GRAFANA_URL, settings.GRAFANA_TOKEN, settings.GRAFANA_FOLDER_TITLE)
-
-    # 3) Load dashboard JSON and inject datasource UID
-    path = os.path.join(os.path.dirname(__file__), "grafana", "dashboard_http_api.json")
-    with open(path, "r", encoding="utf-8") as f:
-        dash = json.load(f)
-        
-    def inject(obj):
-        if isinstance(obj, dict):
-            for k,v in list(obj.items()):
-                obj[k] = inject(v)
-            if obj.get("type")=="prometheus" and obj.get("uid")=="__PROM__":
-                obj["uid"] = prom_uid
-            return obj
-        if isinstance(obj, list):
-            return [inject(x) for x in obj]
-        return obj
-    
-    dash = inject(dash)
-    dash["title"] = settings.GRAFANA_DASHBOARD_TITLE
+    folder_uid = grafana_api.ensure_folder(b.grafana_url, b.grafana_token, settings.GRAFANA_FOLDER_TITLE)
 
-    # 4) Upsert via Grafana HTTP API
-    res = upsert_dashboard(settings.GRAFANA_URL, settings.GRAFANA_TOKEN, folder_uid, dash, overwrite=True)
+    # 3) Latest version of the dashboard, with the datasource UID injected
+    template = template or DEFAULT_TEMPLATE
+    title = settings.GRAFANA_DASHBOARD_TITLE if template == DEFAULT_TEMPLATE else None
+    dash = with_suffix(render_dashboard(dashboard_sources().template(template), prom_uid, title=title), b.suffix)
 
+    # 4) Upsert via Grafana HTTP API, unless Grafana already has exactly this content
+    store = dashboard_store(b.grafana_url)
+    res, entry = push_dashboard(b.grafana_url, b.grafana_token, folder_uid, dash, store=store, force=force)
+    if entry:
+        store.record([entry])
+    return provision_all_payload(res, b.grafana_url, dash.get("title"))
+
+def provision_all_payload(res, grafana_url=None, title=None):
     # Grafana typically returns {"status":"success","uid":"...","url":"/d/uid/slug","version":...}
+    grafana_url = grafana_url or settings.GRAFANA_URL
     dash_url_path = res.get("url") or ""
-    full_url = f"{settings.GRAFANA_URL}{dash_url_path}" if dash_url_path else settings.GRAFANA_URL
-    return jsonify({
+    full_url = f"{grafana_url}{dash_url_path}" if dash_url_path else grafana_url
+    return {
         "ok": True,
-        "message": "Dashboard provisioned successfully.",
+        "message": "Dashboard unchanged; nothing to provision." if res["skipped"] else "Dashboard provisioned successfully.",
         "grafana_dashboard_url": full_url,
         "grafana_folder": settings.GRAFANA_FOLDER_TITLE,
-        "grafana_dashboard_title": settings.GRAFANA_DASHBOARD_TITLE,
+        "grafana_dashboard_title": title or settings.GRAFANA_DASHBOARD_TITLE,
         "raw": res
-    })
+    }
+
+def fanned_out(results):
+    """
+    (HTTP status, payload) for a provisioning run fanned out to several
+    backends: the first successful backend's result at the top level (so a
+    single backend answers as before), every backend's under "backends", and
+    "status" ok / partial / failed. 200 when all succeeded, 207 when some did, 502 otherwise.
+    """
+    per = {name: dict(r["result"], elapsed_ms=r["elapsed_ms"]) if r["ok"]
+           else {"ok": False, "error": r["error"], "elapsed_ms": r["elapsed_ms"]} for name, r in results.items()}
+    first = next((r["result"] for r in results.values() if r["ok"]), None)
+    ok = all(p["ok"] for p in per.values())
+    payload = dict(first or {}, ok=ok, status="ok" if ok else ("partial" if first else "failed"), backends=per)
+    if first is None:
+        payload["error"] = "; ".join(f"{name}: {p['error']}" for name, p in per.items())
+    return (200 if ok else (207 if first else 502)), payload
+
+def publish_rules(save=None):
+    """
+    Run save(engine) (the threshold change), regenerate rules.yml from the stored thresholds and
+    schedule a reload; returns the publish ticket. All of it holds the rules lock, so concurrent
+    submits (in any worker) cannot leave an older rules.yml behind a newer database state.
+    """
+    from backend.prom_alerts import build_rules_yaml
+    from backend.thresholds import load_thresholds
+    publisher = rule_publisher()
+    with publisher.locked():
+        if save is not None:
+            save(db_engine())
+        glob, overrides = load_thresholds(db_engine())
+        yaml_text = build_rules_yaml(glob, overrides, group_label=settings.ALERT_GROUP_LABEL)
+        return publisher.publish(yaml_text)
+
+@route("/admin/provision-bulk", methods=["POST"])
+@login_required
+def provision_bulk_route():
+    """
+    Expects a manifest of folders x dashboards (see provisioning.provision_bulk):
+    { "folders": [ { "title", "dashboards": [ { template?, title?, uid?, dashboard? } ] } ], "force"? }
+    The manifest is applied to every backend's Grafana at once.
+    """
+    from backend.backends import fan_out
+    from backend.provisioning import manifest_folders, provision_bulk
+    require_admin()
+    manifest = request.get_json(force=True, silent=True) or {}
+    try:
+        manifest_folders(manifest)
+        backends = grafana_backends()
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    results = fan_out(backends, lambda b: provision_bulk(
+        b.grafana_url, b.grafana_token, b.prometheus_url, manifest, max_workers=settings.PROVISION_WORKERS,
+        store=dashboard_store(b.grafana_url), force=bool(manifest.get("force")), suffix=b.suffix,
+        templates=dashboard_sources().template), "provision")
+    status, payload = fanned_out(results)
+    return jsonify(payload), status
 
-@app.route("/api/alerts/update", methods=["POST"])
+@route("/api/alerts/update", methods=["POST"])
 @login_required
 def api_alerts_update():
+    from backend.thresholds import save_global
     require_admin()
     data = request.get_json(force=True, silent=True) or {}
     try:
@@ -397,54 +775,424 @@ def api_alerts_update():
                 raise ValueError("threshold out of range")
     except Exception as e:
         return jsonify({"error": f"Invalid thresholds: {e}"}), 400
-    yaml_text = build_rules_yaml({"cpu": cpu, "memory": memory, "disk": disk})
-    write_rules_and_reload(settings.PROM_RULES_PATH, yaml_text, settings.PROM_RELOAD_URL, settings.ALERTMANAGER_RELOAD_URL)
-    return jsonify({"status": "ok", "cpu": cpu, "memory": memory, "disk": disk})
+    ticket = publish_rules(lambda engine: save_global(engine, {"cpu": cpu, "memory": memory, "disk": disk}))
+    return jsonify({"status": "ok", "cpu": cpu, "memory": memory, "disk": disk, "publish": ticket,
+                    "publish_url": url_for("api_alerts_publish_status", ticket_id=ticket["id"])}), 202
 
-@app.route("/admin/edit-dashboard", methods=["GET","POST"])
+@route("/api/alerts/thresholds", methods=["GET","POST"])
+@login_required
+def api_alert_thresholds():
+    """
+    GET: global thresholds and overrides.
+    POST: { "overrides": [ { metric, scope: "instance"|"group", match, value|null } ] }
+    (value null removes the override), then republishes the rules.
+    """
+    from backend.thresholds import load_thresholds, save_overrides
+    require_admin()
+    if request.method == "POST":
+        data = request.get_json(force=True, silent=True) or {}
+        try:
+            ticket = publish_rules(lambda engine: save_overrides(engine, data.get("overrides") or []))
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": f"Invalid overrides: {e}"}), 400
+        glob, overrides = load_thresholds(db_engine())
+        return jsonify({"global": glob, "overrides": overrides, "publish": ticket,
+                        "publish_url": url_for("api_alerts_publish_status", ticket_id=ticket["id"])}), 202
+    glob, overrides = load_thresholds(db_engine())
+    return jsonify({"global": glob, "overrides": overrides, "group_label": settings.ALERT_GROUP_LABEL})
+
+@route("/api/alerts/backtest", methods=["POST"])
+@login_required
+def api_alerts_backtest():
+    """
+    { cpu?, memory?, disk?, days?, step?, overrides? } -> alerts the proposed global thresholds
+    would have raised over the last `days` days, next to the current ones. Overrides default
+    to the stored ones. Nothing is saved or reloaded.
+    """
+    from backend.backtest import run_backtest
+    from backend.prom_query import PromQueryError
+    from backend.thresholds import load_thresholds
+    require_admin()
+    data = request.get_json(force=True, silent=True) or {}
+    current, overrides = load_thresholds(db_engine())
+    try:
+        proposed = {m: int(data.get(m, current[m])) for m in ("cpu", "memory", "disk")}
+        if any(v < 10 or v > 100 for v in proposed.values()):
+            raise ValueError("threshold out of range")
+        days = float(data.get("days", 7))
+        if not (math.isfinite(days) and 0 < days <= settings.BACKTEST_MAX_DAYS):
+            raise ValueError(f"days must be in (0, {settings.BACKTEST_MAX_DAYS:g}]")
+        step = max(float(data.get("step", settings.BACKTEST_STEP)), settings.PROM_SCRAPE_INTERVAL)
+        if not (math.isfinite(step) and step <= days * 86400):  # max() passes nan through
+            raise ValueError("step must be a number of seconds no longer than the backtested range")
+        if data.get("overrides") is not None:
+            overrides = [{"metric": o["metric"], "scope": o["scope"], "match": str(o["match"]), "value": int(o["value"])}
+                         for o in data["overrides"]]
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid backtest: {e}"}), 400
+    proxy = prom_proxy()
+    try:
+        report = run_backtest(lambda expr, start, end, st: proxy.fetch_range(expr, start, end, st,
+                                                                             timeout=settings.BACKTEST_TIMEOUT),
+                              proposed, current, overrides, days=days, step=step,
+                              group_label=settings.ALERT_GROUP_LABEL, chunk_points=settings.BACKTEST_CHUNK_POINTS,
+                              workers=settings.BACKTEST_WORKERS)
+    except PromQueryError as e:
+        return jsonify({"error": str(e)}), e.status
+    except ImportError:
+        return jsonify({"error": "backtests need numpy (pip install -r backend/requirements.txt)"}), 501
+    return jsonify(report)
+
+@route("/api/alerts/publish/<int:ticket_id>")
+@login_required
+def api_alerts_publish_status(ticket_id):
+    require_admin()
+    ticket = rule_publisher().ticket(ticket_id)
+    if not ticket:
+        abort(404)
+    return jsonify(ticket)
+
+# --- Host inventory -> Prometheus file_sd ---
+@route("/api/hosts")
+@login_required
+def api_hosts():
+    """?q=&group=&enabled=&after=<cursor>&limit= -> {hosts, next}; pass `next` back as `after`."""
+    from backend.hosts import list_hosts, PAGE_SIZE as HOSTS_PAGE_SIZE
+    require_admin()
+    enabled = request.args.get("enabled", "")
+    try:
+        limit = int(request.args.get("limit", HOSTS_PAGE_SIZE))
+    except ValueError:
+        return jsonify({"ok": False, "error": "limit must be an integer"}), 400
+    hosts, next_cursor = list_hosts(db_engine(), q=request.args.get("q") or None,
+                                    group=request.args.get("group") or None,
+                                    enabled=None if enabled == "" else enabled in ("1", "true", "yes"),
+                                    after=request.args.get("after") or None, limit=limit)
+    return jsonify({"hosts": hosts, "next": next_cursor})
+
+@route("/api/hosts/groups")
+@login_required
+def api_host_groups():
+    from backend.hosts import group_counts
+    require_admin()
+    return jsonify({"groups": group_counts(db_engine()), "group_label": settings.ALERT_GROUP_LABEL})
+
+@route("/api/hosts/import", methods=["POST"])
+@login_required
+def api_hosts_import():
+    """
+    Upsert hosts from CSV (header: address,group,labels,enabled; labels as k=v;k=v) or
+    JSONL, then rewrite the file_sd shards of the groups that changed. 207 if some records were rejected.
+    """
+    from backend.hosts import import_hosts
+    require_admin()
+    try:
+        summary = import_hosts(db_engine(), _upload(), batch_size=settings.HOST_IMPORT_BATCH,
+                               default_port=settings.HOST_DEFAULT_PORT)
+    except (ValueError, UnicodeDecodeError) as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    summary["file_sd"] = host_targets().sync(summary["groups"])
+    return jsonify(summary), (200 if summary["ok"] else 207)
+
+@route("/api/hosts/delete", methods=["POST"])
+@login_required
+def api_hosts_delete():
+    """{ "addresses": [ "host:port", ... ] }"""
+    from backend.hosts import delete_hosts
+    require_admin()
+    data = request.get_json(force=True, silent=True) or {}
+    addresses = data.get("addresses")
+    if not isinstance(addresses, list):
+        return jsonify({"ok": False, "error": "addresses must be a list"}), 400
+    deleted, groups = delete_hosts(db_engine(), addresses)
+    return jsonify({"ok": True, "deleted": deleted, "groups": groups, "file_sd": host_targets().sync(groups)})
+
+@route("/api/hosts/sync", methods=["POST"])
+@login_required
+def api_hosts_sync():
+    """Re-render every shard and drop files of vanished groups (e.g. after editing the hosts table by hand)."""
+    require_admin()
+    return jsonify(host_targets().sync())
+
+# --- Capacity reports (local store, no Prometheus queries) ---
+@route("/api/capacity/report")
+@login_required
+def api_capacity_report():
+    """
+    ?metric=cpu|memory|disk&days=30&stat=avg|min|max|p95&threshold=80&min_above=50&sort=above|p95|p50|mean|max
+    &group=&instance=&limit=50 -> per-series share of time over the threshold, percentiles and peaks.
+    """
+    require_admin()
+    args = request.args
+    try:
+        store = capacity_store()
+        metric = args.get("metric", "cpu")
+        if metric not in ("cpu", "memory", "disk"):
+            raise ValueError("metric must be cpu, memory or disk")
+        report = store.report(metric, days=max(1, min(int(args.get("days", 30)), settings.CAPACITY_RETENTION_DAYS)),
+                              stat=args.get("stat", "avg"), threshold=float(args.get("threshold", 80)),
+                              min_above=float(args.get("min_above", 0)), sort=args.get("sort", "above"),
+                              group=args.get("group") or None, instance=args.get("instance") or None,
+                              limit=min(int(args.get("limit", 50)), 1000))
+    except ImportError:
+        return jsonify({"error": "capacity reports need numpy (pip install -r backend/requirements.txt)"}), 501
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    report["collected_until"] = store.collector.state()
+    report["collector_error"] = store.collector.last_error
+    return jsonify(report)
+
+@route("/api/capacity/series")
+@login_required
+def api_capacity_series():
+    """?metric=&instance=&volume=&days=7 -> one series' min/avg/max/p95 (5-minute, hourly beyond 2 days)."""
+    require_admin()
+    args = request.args
+    try:
+        data = capacity_store().timeline(args.get("metric", "cpu"), args.get("instance", ""), args.get("volume", ""),
+                                         days=max(1, min(int(args.get("days", 7)), settings.CAPACITY_RETENTION_DAYS)))
+    except ImportError:
+        return jsonify({"error": "capacity reports need numpy (pip install -r backend/requirements.txt)"}), 501
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except KeyError as e:
+        return jsonify({"error": e.args[0]}), 404
+    return jsonify(data)
+
+# --- Alertmanager webhook and alert history ---
+@csrf.exempt
+@route("/api/alerts/webhook", methods=["POST"])
+def api_alerts_webhook():
+    """Alertmanager webhook_configs receiver; answers once the notification is buffered (202)."""
+    from backend.alert_history import BufferFull
+    if not _bearer_ok(settings.ALERT_WEBHOOK_TOKEN):
+        abort(401)
+    try:
+        result = alert_history().submit(request.get_json(force=True, silent=True))
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    except BufferFull as e:
+        return jsonify({"ok": False, "error": str(e)}), 503, {"Retry-After": "5"}
+    return jsonify(dict(result, ok=True)), 202
+
+@route("/api/alerts/history")
+@login_required
+def api_alerts_history():
+    """?alertname=&instance=&status=&since=&until=&after=<cursor>&limit= -> {alerts, next}; times RFC 3339 or unix."""
+    require_admin()
+    from backend.alert_history import history, parse_time, PAGE_SIZE as HISTORY_PAGE_SIZE
+    args = request.args
+    try:
+        rows, next_cursor = history(db_engine(), alertname=args.get("alertname") or None,
+                                    instance=args.get("instance") or None, status=args.get("status") or None,
+                                    since=parse_time(args.get("since")), until=parse_time(args.get("until")),
+                                    after=args.get("after") or None, limit=int(args.get("limit", HISTORY_PAGE_SIZE)))
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    for r in rows:
+        for k in ("starts_at", "ends_at", "last_seen"):
+            r[k] = r[k].isoformat() + "Z" if r[k] else None
+    return jsonify({"alerts": rows, "next": next_cursor})
+
+# --- Dashboard sources (versioned, edited with JSON Patch) ---
+def _base_version(data):
+    """The version an edit was made against: the body's "version", else the If-Match header ("3" or W/"3")."""
+    version = data.get("version")
+    if version is None:
+        tag = request.headers.get("If-Match", "")
+        version = (tag[2:] if tag.startswith("W/") else tag).strip('"') or None
+    if version is None:
+        raise ValueError('the version being edited is required ("version" or If-Match)')
+    return int(version)
+
+def _apply_dashboard(name):
+    """Push just this dashboard to every backend's Grafana; the payload is provision-all's."""
+    from backend.backends import fan_out
+    try:
+        backends = grafana_backends()
+    except ValueError as e:
+        return {"ok": False, "status": "failed", "error": str(e)}
+    return fanned_out(fan_out(backends, lambda b: provision_all_on(b, template=name), "provision"))[1]
+
+def _dashboard_write(name, data, write):
+    """
+    Run write(sources, base_version, author) for one of the dashboard write routes:
+    409 (with the current "version") when someone saved first or a "test" operation
+    fails, 400 for a bad patch, 404 for an unknown dashboard. With "apply": true
+    (or ?apply=1) the saved dashboard is then pushed to Grafana.
+    """
+    from backend.dashboard_sources import VersionConflict
+    from backend.json_patch import PatchTestFailed
+    try:
+        if not isinstance(data, dict):
+            raise ValueError("expected a JSON object")
+        result = write(dashboard_sources(), _base_version(data), current_user.email)
+    except VersionConflict as e:
+        return jsonify({"ok": False, "error": str(e), "version": e.current}), 409
+    except PatchTestFailed as e:
+        return jsonify({"ok": False, "error": str(e)}), 409
+    except KeyError as e:
+        return jsonify({"ok": False, "error": e.args[0]}), 404
+    except (TypeError, ValueError) as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    payload = dict(result, ok=True)
+    if data.get("apply") or request.args.get("apply") == "1":
+        payload["provision"] = _apply_dashboard(name)
+    return jsonify(payload), 200, {"ETag": f'"{result["version"]}"'}
+
+@route("/api/dashboards/sources")
+@login_required
+def api_dashboard_sources():
+    require_admin()
+    sources = dashboard_sources().sources()
+    for src in sources:
+        src["updated_at"] = src["updated_at"].isoformat() + "Z" if src["updated_at"] else None
+    return jsonify({"sources": sources})
+
+@route("/api/dashboards/sources/<name>", methods=["GET","PATCH"])
+@login_required
+def api_dashboard_source(name):
+    """
+    GET ?version=N -> {name, version, dashboard}, ETag = the version (latest unless ?version).
+    PATCH: the version being edited ("version" or If-Match) and either a JSON Patch
+    (application/json-patch+json body, or {"patch": [...]}) or a JSON Merge Patch
+    (application/merge-patch+json body, or {"merge": {...}}); see _dashboard_write.
+    """
+    require_admin()
+    if request.method == "PATCH":
+        data = request.get_json(force=True, silent=True)
+        if request.mimetype == "application/json-patch+json":
+            data = {"patch": data}
+        elif request.mimetype == "application/merge-patch+json":
+            data = {"merge": data}
+        if isinstance(data, dict) and "merge" in data:
+            return _dashboard_write(name, data, lambda src, base, author: src.merge(name, base, data["merge"], author))
+        return _dashboard_write(name, data, lambda src, base, author: src.edit(name, base, data.get("patch"), author))
+    try:
+        if request.args.get("version"):
+            version = int(request.args["version"])
+            dash = dashboard_sources().at(name, version)
+        else:
+            version, dash = dashboard_sources().head(name)
+    except KeyError as e:
+        return jsonify({"ok": False, "error": e.args[0]}), 404
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    return jsonify({"name": name, "version": version, "dashboard": dash}), 200, {"ETag": f'"{version}"'}
+
+@route("/api/dashboards/sources/<name>/history")
+@login_required
+def api_dashboard_history(name):
+    """?before=<version>&limit= -> {revisions newest first, with their patches; next}; pass `next` back as `before`."""
+    from backend.dashboard_sources import PAGE_SIZE as REVISIONS_PAGE_SIZE
+    require_admin()
+    try:
+        before = request.args.get("before")
+        revisions, next_cursor = dashboard_sources().history(name, before=int(before) if before else None,
+                                                             limit=int(request.args.get("limit", REVISIONS_PAGE_SIZE)))
+    except KeyError as e:
+        return jsonify({"ok": False, "error": e.args[0]}), 404
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    for r in revisions:
+        r["created_at"] = r["created_at"].isoformat() + "Z" if r["created_at"] else None
+    return jsonify({"name": name, "revisions": revisions, "next": next_cursor})
+
+@route("/api/dashboards/sources/<name>/revert", methods=["POST"])
+@login_required
+def api_dashboard_revert(name):
+    """{ version, to, apply? } -> a new version with the content of version `to`."""
+    require_admin()
+    data = request.get_json(force=True, silent=True)
+    return _dashboard_write(name, data, lambda src, base, author: src.revert(name, base, int(data.get("to")), author))
+
+@route("/api/dashboards/sources/<name>/import-file", methods=["POST"])
+@login_required
+def api_dashboard_import_file(name):
+    """{ version, apply? } -> a new version with the content of the dashboard's file in backend/grafana."""
+    require_admin()
+    return _dashboard_write(name, request.get_json(force=True, silent=True),
+                            lambda src, base, author: src.import_file(name, base, author))
+
+@route("/admin/edit-dashboard", methods=["GET","POST"])
 @login_required
 def edit_dashboard():
+    """The main dashboard as text; saving stores only what changed since the version the form was loaded at."""
+    from backend.dashboard_sources import VersionConflict
+    from backend.provisioning import DEFAULT_TEMPLATE
     require_admin()
-    path = os.path.join(os.path.dirname(__file__), "grafana", "dashboard_http_api.json")
+    sources = dashboard_sources()
     if request.method == "POST":
         new_text = request.form.get("json_text", "")
+        base = request.form.get("version", type=int)
         try:
-            json.loads(new_text)
-        except Exception as e:
+            result = sources.save(DEFAULT_TEMPLATE, base, json.loads(new_text), current_user.email)
+        except VersionConflict as e:
+            flash(f"Someone saved version {e.current} while you were editing. Your text is kept below; "
+                  f"saving it again replaces version {e.current}.", "warning")
+            return render_template("edit_dashboard.html", text=new_text, version=e.current)
+        except ValueError as e:
             flash(f"JSON error: {e}", "danger")
-            return render_template("edit_dashboard.html", text=new_text)
-        with open(path, "w", encoding="utf-8") as f:
-            f.write(new_text)
-        flash("Saved. Click 'Provision' on Admin Home to apply.", "success")
-    with open(path, "r", encoding="utf-8") as f:
-        text = f.read()
-    return render_template("edit_dashboard.html", text=text)
+            return render_template("edit_dashboard.html", text=new_text, version=base)
+        saved = f"Saved version {result['version']}" if result["changed"] else "No changes to save"
+        if request.form.get("apply"):
+            prov = _apply_dashboard(DEFAULT_TEMPLATE)
+            flash(f"{saved}; provisioning {prov['status']}" + (f": {prov['error']}" if prov.get("error") else "."),
+                  "success" if prov["ok"] else "warning")
+        elif result["changed"]:
+            flash(f"{saved}. Click 'Provision' on Admin Home to apply.", "success")
+        else:
+            flash(f"{saved}.", "info")
+        return redirect(url_for("edit_dashboard"))
+    version, dash = sources.head(DEFAULT_TEMPLATE)
+    return render_template("edit_dashboard.html", text=json.dumps(dash, indent=2, ensure_ascii=False), version=version)
 
-@app.route("/admin/alerts", methods=["GET","POST"])
+@route("/admin/alerts", methods=["GET","POST"])
 @login_required
 def alert_settings():
+    from backend.thresholds import load_thresholds, save_global
     require_admin()
     form = ThresholdForm()
     if form.validate_on_submit():
-        yaml_text = build_rules_yaml({"cpu": form.cpu.data, "memory": form.memory.data, "disk": form.disk.data})
-        write_rules_and_reload(settings.PROM_RULES_PATH, yaml_text, settings.PROM_RELOAD_URL, settings.ALERTMANAGER_RELOAD_URL)
-        flash("Rules updated and Prometheus reloaded.", "success")
+        values = {"cpu": form.cpu.data, "memory": form.memory.data, "disk": form.disk.data}
+        ticket = publish_rules(lambda engine: save_global(engine, values))
+        if ticket["state"] == "unchanged":
+            flash("Rules unchanged; no reload needed.", "info")
+        else:
+            flash(f"Rules updated; Prometheus reload scheduled (ticket #{ticket['id']}).", "success")
         return redirect(url_for("admin_home"))
-    form.cpu.data, form.memory.data, form.disk.data = 80,80,80
+    glob, _ = load_thresholds(db_engine())
+    form.cpu.data, form.memory.data, form.disk.data = glob["cpu"], glob["memory"], glob["disk"]
     return render_template("alert_settings.html", form=form)
 
-@app.route("/admin/grafana-info")
+@route("/admin/grafana-info")
 @login_required
 def grafana_info():
     require_admin()
     try:
-        dss = list_datasources(settings.GRAFANA_URL, settings.GRAFANA_TOKEN)
-        dashes = list_dashboards(settings.GRAFANA_URL, settings.GRAFANA_TOKEN)
+        return jsonify(grafana_info_payload(request.args))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-    return jsonify({"datasources": dss, "dashboards": dashes})
 
-@app.route("/user")
+GRAFANA_INFO_PAGE = 100
+
+def grafana_info_payload(args):
+    """
+    Datasources and one page of dashboards from the in-memory inventory.
+    Query args: q (title substring), folder (uid), offset, limit, refresh=1 (re-list from Grafana first).
+    """
+    inventory = grafana_inventory()
+    if args.get("refresh") == "1":
+        inventory.refresh()
+    offset = max(0, int(args.get("offset") or 0))
+    limit = max(1, min(int(args.get("limit") or GRAFANA_INFO_PAGE), 1000))
+    dashes, total = inventory.page_dashboards(q=args.get("q"), folder_uid=args.get("folder"), offset=offset,
+                                              limit=limit)
+    return {"datasources": inventory.datasources(), "dashboards": dashes, "total": total, "offset": offset,
+            "limit": limit, "next_offset": offset + len(dashes) if offset + len(dashes) < total else None,
+            "inventory": inventory.status()}
+
+@route("/user")
 @login_required
 def user_home():
     if current_user.role not in ("user","admin"):
@@ -453,10 +1201,75 @@ def user_home():
                            folder_title=settings.GRAFANA_FOLDER_TITLE,
                            dashboard_title=settings.GRAFANA_DASHBOARD_TITLE)
 
-@app.errorhandler(500)
+# --- Metrics proxy (dashboard queries, cached per step) ---
+def _metrics_proxy():
+    from backend.provisioning import DEFAULT_TEMPLATE
+    prom_proxy().use_dashboard(dashboard_sources().head(DEFAULT_TEMPLATE)[1])
+    return prom_proxy()
+
+def _float_arg(name, default):
+    from backend.prom_query import PromQueryError
+    v = request.args.get(name)
+    if v is None or v == "":
+        return default
+    try:
+        value = float(v)
+    except ValueError:
+        value = math.nan
+    if not math.isfinite(value):  # float() also takes "nan" and "inf"
+        raise PromQueryError(f"{name} must be a unix timestamp / number of seconds")
+    return value
+
+@route("/api/metrics/queries")
+@login_required
+def api_metrics_queries():
+    return jsonify(_metrics_proxy().exprs)
+
+@route("/api/metrics/query")
+@login_required
+def api_metrics_query():
+    from backend.prom_query import PromQueryError
+    try:
+        proxy = _metrics_proxy()
+        expr = proxy.resolve(request.args.get("expr"), request.args.get("ref"))
+        return jsonify(proxy.query(expr, _float_arg("time", None)))
+    except PromQueryError as e:
+        return jsonify({"error": str(e)}), e.status
+
+@route("/api/metrics/query_range")
+@login_required
+def api_metrics_query_range():
+    from backend.prom_query import PromQueryError
+    try:
+        proxy = _metrics_proxy()
+        expr = proxy.resolve(request.args.get("expr"), request.args.get("ref"))
+        end = _float_arg("end", time.time())
+        start = _float_arg("start", end - 3600)
+        step = _float_arg("step", 60)
+        return jsonify(proxy.query_range(expr, start, end, step))
+    except PromQueryError as e:
+        return jsonify({"error": str(e)}), e.status
+
+@route("/api/metrics/stream")
+@login_required
+def api_metrics_stream():
+    """
+    Server-Sent Events are served by backend/asgi.py only: under a WSGI server an open stream
+    would hold a worker (or get it killed by the worker timeout). 204 tells EventSource not to
+    reconnect, and the page falls back to polling /api/status and /api/metrics/live.
+    """
+    return Response(status=204)
+
+@route("/api/metrics/live")
+@login_required
+def api_metrics_live():
+    """The live values as one snapshot ({seq, values, status}), for pages that cannot stream."""
+    return jsonify(live_hub().current())
+
+@errorhandler(500)
 def internal_error(e):
     # Shows a friendlier message, and you still get the full traceback in the terminal with FLASK_DEBUG=1
     return render_template("index.html") + "<pre class='codeblock'>Server error – check the terminal for the traceback.</pre>", 500
 
 if __name__ == "__main__":
-    app.run(host=settings.FLASK_HOST, port=settings.FLASK_PORT)
+    create_app().run(host=settings.FLASK_HOST, port=settings.FLASK_PORT)
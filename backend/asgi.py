@@ -0,0 +1,327 @@
+"""
+ASGI serving mode (production):
+
+    pip install -r backend/requirements-asgi.txt
+    uvicorn backend.asgi:application --host 0.0.0.0 --port 5050 --workers 4
+
+The I/O-bound routes (Grafana provisioning, Grafana info and the live
+metrics stream) run as native async handlers on httpx, so a slow Grafana
+only holds sockets, not threads. Every other route is served by the Flask
+app on a bounded thread pool (ASGI_WSGI_WORKERS) that those handlers never
+occupy, so login and user pages keep answering.
+"""
+import asyncio, io, json, logging, queue, threading, time
+from typing import Any, Dict, Tuple
+import httpx
+from a2wsgi import WSGIMiddleware
+from a2wsgi.wsgi import build_environ
+from flask import request
+from flask_login import current_user
+from flask_wtf.csrf import CSRFError
+from backend import app as srd
+from backend import grafana_async, telemetry
+from backend.backends import fan_out_async
+from backend.grafana_api import get_inventory
+from backend.grafana_inventory import MISS_RELIST
+from backend.live_metrics import format_sse
+from backend.provisioning import (DEFAULT_TEMPLATE, render_dashboard, check_unchanged, pushed_entry,
+                                  manifest_folders, build_jobs, summarize, datasource_name, with_suffix)
+
+log = logging.getLogger("srd.asgi")
+settings = srd.settings
+flask_app = srd.get_app()
+wsgi = WSGIMiddleware(flask_app, workers=settings.ASGI_WSGI_WORKERS)
+
+class HTTPError(Exception):
+    def __init__(self, status: int, payload: Dict[str, Any]):
+        super().__init__(payload.get("error"))
+        self.status = status
+        self.payload = payload
+
+_clients: Dict[Tuple[int, str, str], grafana_async.AsyncGrafanaClient] = {}
+
+def _grafana(url: str = None, token: str = None) -> grafana_async.AsyncGrafanaClient:
+    # httpx clients are bound to the event loop that created them (one per worker process and Grafana).
+    url, token = url or settings.GRAFANA_URL, token or settings.GRAFANA_TOKEN
+    key = (id(asyncio.get_running_loop()), url, token)
+    client = _clients.get(key)
+    if client is None:
+        client = _clients[key] = grafana_async.AsyncGrafanaClient(
+            url, token, pool_size=settings.GRAFANA_POOL_SIZE,
+            retries=settings.GRAFANA_RETRIES, backoff=settings.GRAFANA_BACKOFF, timeout=settings.GRAFANA_TIMEOUT)
+    return client
+
+def _gate(environ: Dict[str, Any], admin: bool, csrf: bool) -> Tuple[Any, Dict[str, str]]:
+    """Session auth, role and CSRF checks done by the Flask app itself; returns (json_body, query_args)."""
+    with flask_app.request_context(environ):
+        if not current_user.is_authenticated:
+            raise HTTPError(401, {"ok": False, "error": "login required"})
+        if admin and current_user.role != "admin":
+            raise HTTPError(403, {"ok": False, "error": "admin only"})
+        if csrf:
+            try:
+                srd.csrf.protect()
+            except CSRFError as e:
+                raise HTTPError(400, {"ok": False, "error": f"CSRF error: {e.description}"})
+        return request.get_json(force=True, silent=True), request.args.to_dict()
+
+# --- Async handlers: (json_body, query_args) -> (status, payload) ---
+
+async def provision_all(body, args):
+    started = time.perf_counter()
+    force = args.get("force") == "1" or bool((body or {}).get("force"))
+    results = await fan_out_async(srd.grafana_backends(), lambda b: _provision_all_on(b, force), "provision")
+    telemetry.PROVISION_DURATION.labels("all").observe(time.perf_counter() - started)
+    return srd.fanned_out(results)
+
+async def _provision_all_on(b, force: bool) -> Dict[str, Any]:
+    client = _grafana(b.grafana_url, b.grafana_token)
+    inventory = await grafana_async.in_thread(get_inventory, b.grafana_url, b.grafana_token)
+    prom_uid, _ = await grafana_async.ensure_prometheus_datasource(client, b.prometheus_url, inventory,
+                                                                   name=datasource_name(b.suffix),
+                                                                   is_default=not b.suffix)
+    title = settings.GRAFANA_FOLDER_TITLE
+    folder_uid = (await grafana_async.ensure_folders(client, [title], inventory))[title]
+    template = await asyncio.to_thread(srd.dashboard_sources().template, DEFAULT_TEMPLATE)
+    dash = with_suffix(render_dashboard(template, prom_uid, title=settings.GRAFANA_DASHBOARD_TITLE), b.suffix)
+    store = srd.dashboard_store(b.grafana_url)
+    res, key, content_hash = await grafana_async.in_thread(check_unchanged, dash, folder_uid, store, force, inventory)
+    if res is None:
+        res = await _upsert(client, folder_uid, dash, inventory)
+        await asyncio.to_thread(store.record, [pushed_entry(key, content_hash, folder_uid, res)])
+        res = dict(res, skipped=False)
+    else:
+        telemetry.DASHBOARD_PUSHES.labels("skipped").inc()
+    return srd.provision_all_payload(res, b.grafana_url, dash.get("title"))
+
+async def _upsert(client, folder_uid: str, dash: Dict[str, Any], inventory) -> Dict[str, Any]:
+    try:
+        res = await grafana_async.upsert_dashboard(client, folder_uid, dash, inventory)
+    except Exception:
+        telemetry.DASHBOARD_PUSHES.labels("error").inc()
+        raise
+    telemetry.DASHBOARD_PUSHES.labels("pushed").inc()
+    return res
+
+# Named after the Flask view it replaces, so both serving modes report the same endpoint label
+async def provision_bulk_route(body, args):
+    manifest = body or {}
+    folders = manifest_folders(manifest)
+    results = await fan_out_async(srd.grafana_backends(), lambda b: _provision_bulk_on(b, manifest, folders),
+                                  "provision")
+    return srd.fanned_out(results)
+
+async def _provision_bulk_on(b, manifest: Dict[str, Any], folders) -> Dict[str, Any]:
+    started = time.perf_counter()
+    force = bool(manifest.get("force"))
+    client = _grafana(b.grafana_url, b.grafana_token)
+    inventory = await grafana_async.in_thread(get_inventory, b.grafana_url, b.grafana_token)
+    prom_uid, _ = await grafana_async.ensure_prometheus_datasource(client, b.prometheus_url, inventory,
+                                                                   name=datasource_name(b.suffix),
+                                                                   is_default=not b.suffix)
+    folder_uids = await grafana_async.ensure_folders(client, [f["title"] for f in folders], inventory)
+    jobs = await asyncio.to_thread(build_jobs, folders, folder_uids, prom_uid, b.suffix,
+                                   srd.dashboard_sources().template)
+    limit = asyncio.Semaphore(max(1, settings.PROVISION_WORKERS))
+    store = srd.dashboard_store(b.grafana_url)
+
+    async def run(job):
+        result = {"folder": job["folder"], "title": job["title"], "uid": job["uid"]}
+        if "error" in job:
+            return dict(result, ok=False, error=job["error"]), None
+        t = time.perf_counter()
+        entry = None
+        try:
+            res, key, content_hash = await grafana_async.in_thread(check_unchanged, job["dashboard"],
+                                                                   job["folder_uid"], store, force, inventory)
+            if res is None:
+                async with limit:
+                    res = await _upsert(client, job["folder_uid"], job["dashboard"], inventory)
+                entry = pushed_entry(key, content_hash, job["folder_uid"], res)
+                res = dict(res, skipped=False)
+            else:
+                telemetry.DASHBOARD_PUSHES.labels("skipped").inc()
+            result.update(ok=True, skipped=res["skipped"], uid=res.get("uid"), url=res.get("url"),
+                          version=res.get("version"))
+        except Exception as e:
+            result.update(ok=False, error=str(e))
+        result["elapsed_ms"] = round((time.perf_counter() - t) * 1000, 2)
+        return result, entry
+
+    done = await asyncio.gather(*(run(j) for j in jobs))
+    await asyncio.to_thread(store.record, [e for _, e in done if e])
+    telemetry.PROVISION_DURATION.labels("bulk").observe(time.perf_counter() - started)
+    return summarize([r for r, _ in done], prom_uid, folder_uids, started)
+
+async def _create_or_find(client, path: str, payload: Dict[str, Any], note, find):
+    # Same semantics as the gf()-based helpers in app.py: POST, and on 409 find the existing one in the inventory.
+    r = await client.request("POST", path, json=payload)
+    if r.is_success:
+        note(r.json())
+        return {"created": True, "data": r.json()}
+    if r.status_code == 409 or "already exists" in r.text.lower():
+        match = await grafana_async.in_thread(find)
+        if match:
+            return {"created": False, "data": match}
+    r.raise_for_status()
+
+async def provision(body, args):
+    payload = body or {}
+    ds_payload = payload.get("datasource") or {"name": "Prometheus", "type": "prometheus",
+                                               "url": "http://prometheus:9090", "access": "proxy", "isDefault": True}
+    folder_payload = payload.get("folder") or {"title": "SRD Monitoring"}
+    dash_payload = payload.get("dashboard") or {"uid": "srd-api", "title": "SRD HTTP API Dashboard", "panels": []}
+    client = _grafana()
+    inventory = await grafana_async.in_thread(srd.grafana_inventory)
+    ds_result = await _create_or_find(
+        client, "/api/datasources", ds_payload, lambda r: inventory.note_datasource(r.get("datasource") or {}),
+        lambda: inventory.datasource_by_name(ds_payload.get("name"), miss_relist=MISS_RELIST))
+    folder_result = await _create_or_find(
+        client, "/api/folders", {"title": folder_payload["title"]}, inventory.note_folder,
+        lambda: inventory.folder_by_title(folder_payload["title"], miss_relist=MISS_RELIST))
+    dashboard = {"uid": dash_payload.get("uid"), "title": dash_payload.get("title", "New Dashboard"),
+                 "timezone": "browser", "schemaVersion": 39, "version": 1, "panels": dash_payload.get("panels", [])}
+    folder_uid = folder_result["data"]["uid"]
+    dash_result = await client.post("/api/dashboards/db", {"dashboard": dashboard, "folderUid": folder_uid,
+                                                           "overwrite": True})
+    inventory.note_dashboard(dash_result.get("uid"), dashboard["title"], dash_result.get("url"), folder_uid,
+                             dash_result.get("version"))
+    return 200, {"ok": True, "grafana_url": settings.GRAFANA_URL, "datasource": ds_result,
+                 "folder": folder_result, "dashboard": dash_result}
+
+async def grafana_info(body, args):
+    # Served from the in-memory inventory; a thread only because the first call (or refresh=1) lists Grafana
+    return 200, await grafana_async.in_thread(srd.grafana_info_payload, args)
+
+# (method, path) -> (handler, admin only, CSRF checked)
+ROUTES = {
+    ("POST", "/admin/provision-all"): (provision_all, True, True),
+    ("POST", "/admin/provision-bulk"): (provision_bulk_route, True, True),
+    ("POST", "/admin/provision"): (provision, False, True),
+    ("GET", "/admin/grafana-info"): (grafana_info, True, False),
+}
+
+async def _read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        msg = await receive()
+        if msg["type"] == "http.disconnect":
+            break
+        chunks.append(msg.get("body", b""))
+        if not msg.get("more_body"):
+            break
+    return b"".join(chunks)
+
+async def _send_json(send, status: int, payload: Any):
+    body = json.dumps(payload).encode("utf-8")
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]})
+    await send({"type": "http.response.body", "body": body})
+
+async def _handle(route, scope, receive, send):
+    handler, admin, csrf = route
+    started = time.perf_counter()
+    body = await _read_body(receive)
+    environ = build_environ(scope, io.BytesIO(body))
+    try:
+        data, args = await asyncio.to_thread(_gate, environ, admin, csrf)
+        status, payload = await handler(data, args)
+    except HTTPError as e:
+        status, payload = e.status, e.payload
+    except ValueError as e:
+        status, payload = 400, {"ok": False, "error": str(e)}
+    except (httpx.HTTPError, KeyError) as e:
+        status, payload = 502, {"ok": False, "error": str(e)}
+    except Exception as e:
+        log.exception("async route %s failed", scope["path"])
+        status, payload = 500, {"ok": False, "error": str(e)}
+    await _send_json(send, status, payload)
+    telemetry.HTTP_DURATION.labels(scope["method"], handler.__name__).observe(time.perf_counter() - started)
+    telemetry.HTTP_REQUESTS.labels(scope["method"], handler.__name__, str(status)).inc()
+
+class _AsyncSink:
+    """LiveMetricsHub sink that hands events to an asyncio.Queue on the server's event loop."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, maxsize: int):
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.maxsize = maxsize
+        self.pending = 0
+        self.lock = threading.Lock()
+
+    def put_nowait(self, item):
+        with self.lock:
+            if self.pending >= self.maxsize:
+                raise queue.Full
+            self.pending += 1
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, item)
+
+    def overflow(self):
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, ("close", {}))
+
+    async def get(self):
+        item = await self.queue.get()
+        with self.lock:
+            self.pending = max(0, self.pending - 1)
+        return item
+
+async def _stream(scope, receive, send):
+    """/api/metrics/stream without a thread per subscriber."""
+    environ = build_environ(scope, io.BytesIO(b""))
+    try:
+        await asyncio.to_thread(_gate, environ, False, False)
+    except HTTPError as e:
+        return await _send_json(send, e.status, e.payload)
+    hub = srd.live_hub()
+    sink = _AsyncSink(asyncio.get_running_loop(), hub.queue_size)
+    hub.subscribe(sink)
+    disconnected = asyncio.Event()
+
+    async def watch():
+        while (await receive())["type"] != "http.disconnect":
+            pass
+        disconnected.set()
+
+    watcher = asyncio.create_task(watch())
+    try:
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"text/event-stream; charset=utf-8"),
+                                (b"cache-control", b"no-cache"), (b"x-accel-buffering", b"no")]})
+        while not disconnected.is_set():
+            try:
+                event, data = await asyncio.wait_for(sink.get(), timeout=15)
+                if event == "close":
+                    break
+                chunk = format_sse(event, data)
+            except asyncio.TimeoutError:
+                chunk = ": keep-alive\n\n"
+            await send({"type": "http.response.body", "body": chunk.encode("utf-8"), "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+    except OSError:
+        pass
+    finally:
+        hub.unsubscribe(sink)
+        watcher.cancel()
+
+async def _lifespan(receive, send):
+    while True:
+        msg = await receive()
+        if msg["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif msg["type"] == "lifespan.shutdown":
+            for client in list(_clients.values()):
+                await client.aclose()
+            _clients.clear()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await _lifespan(receive, send)
+    if scope["type"] == "http":
+        if scope["method"] == "GET" and scope["path"] == "/api/metrics/stream":
+            return await _stream(scope, receive, send)
+        route = ROUTES.get((scope["method"], scope["path"]))
+        if route is not None:
+            return await _handle(route, scope, receive, send)
+    return await wsgi(scope, receive, send)
@@ -0,0 +1,206 @@
+"""
+The Prometheus (and Grafana) backends SRD fronts, and the fan-out helpers
+that run one operation against all of them at once.
+
+Without BACKENDS_FILE there is one backend, "default", built from
+PROMETHEUS_URL, GRAFANA_URL and friends. With it, every entry of its
+`backends:` list is a shard, e.g. one Prometheus per datacenter:
+
+    backends:
+      - name: dc1
+        prometheus_url: http://prom-dc1:9090
+        rules_path: /mnt/prom-dc1/rules.yml   # default PROM_RULES_PATH
+        grafana_url: http://grafana:3001      # default GRAFANA_URL; "" = no Grafana
+        timeout: 30                           # default BACKEND_TIMEOUT
+
+Each backend gets its own deadline. A shard that is slow or down is
+reported as failed in the result, and the others are not held up by it.
+Outbound calls made under a deadline (see bounded()) get at most the time
+left, and once a call has been reported as timed out its next step raises
+DeadlineExceeded, so it stops instead of changing state after the fact.
+"""
+import asyncio, json, threading, time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import yaml
+from backend.config import Settings
+from backend.telemetry import FANOUT_CALLS
+
+class Backend:
+    def __init__(self, name: str, prometheus_url: str, prom_reload_url: str = "", alertmanager_reload_url: str = "",
+                 rules_path: str = "prometheus/rules.yml", grafana_url: str = "", grafana_token: str = "",
+                 timeout: float = 30.0):
+        self.name = name
+        self.prometheus_url = prometheus_url.rstrip("/")
+        self.prom_reload_url = prom_reload_url or f"{self.prometheus_url}/-/reload"
+        self.alertmanager_reload_url = alertmanager_reload_url
+        self.rules_path = rules_path
+        self.grafana_url = grafana_url or ""  # as configured: provisioned_dashboards rows are keyed by it
+        self.grafana_token = grafana_token or ""
+        self.timeout = timeout
+        # Set by load_backends(): health probe names, and whether other backends share this Grafana
+        self.prom_probe = "prometheus"
+        self.grafana_probe: Optional[str] = "grafana" if self.grafana_url else None
+        self.shared_grafana = False
+
+    @property
+    def suffix(self) -> Optional[str]:
+        """Tells this backend's datasource and dashboards apart in a Grafana other backends share."""
+        return self.name if self.shared_grafana else None
+
+    def __repr__(self):
+        return f"Backend({self.name!r}, {self.prometheus_url!r})"
+
+_FIELDS = ("name", "prometheus_url", "prom_reload_url", "alertmanager_reload_url", "rules_path", "grafana_url",
+           "grafana_token", "timeout")
+
+def load_backends(settings) -> List[Backend]:
+    """Backends from settings.BACKENDS_FILE (YAML or JSON), or the single one the plain settings describe."""
+    if not settings.BACKENDS_FILE:
+        return [Backend("default", settings.PROMETHEUS_URL, settings.PROM_RELOAD_URL, settings.ALERTMANAGER_RELOAD_URL,
+                        settings.PROM_RULES_PATH, settings.GRAFANA_URL, settings.GRAFANA_TOKEN, settings.BACKEND_TIMEOUT)]
+    with open(settings.BACKENDS_FILE, encoding="utf-8") as f:
+        text = f.read()
+    doc = json.loads(text) if settings.BACKENDS_FILE.endswith(".json") else yaml.safe_load(text)
+    entries = (doc or {}).get("backends") if isinstance(doc, dict) else doc
+    if not isinstance(entries, list) or not entries:
+        raise ValueError(f"{settings.BACKENDS_FILE}: expected a non-empty 'backends' list")
+    out: List[Backend] = []
+    for e in entries:
+        if not isinstance(e, dict) or not e.get("name") or not e.get("prometheus_url"):
+            raise ValueError(f"{settings.BACKENDS_FILE}: every backend needs a name and a prometheus_url")
+        unknown = set(e) - set(_FIELDS)
+        if unknown:
+            raise ValueError(f"{settings.BACKENDS_FILE}: unknown backend field(s) {', '.join(sorted(unknown))}")
+        out.append(Backend(
+            str(e["name"]), e["prometheus_url"], e.get("prom_reload_url") or "",
+            e.get("alertmanager_reload_url", settings.ALERTMANAGER_RELOAD_URL) or "",
+            e.get("rules_path") or settings.PROM_RULES_PATH,
+            e.get("grafana_url", settings.GRAFANA_URL) or "",
+            e.get("grafana_token", settings.GRAFANA_TOKEN) or "",
+            float(e.get("timeout", settings.BACKEND_TIMEOUT))))
+    names = [b.name for b in out]
+    if len(set(names)) != len(names):
+        raise ValueError(f"{settings.BACKENDS_FILE}: backend names must be unique")
+    if len(out) > 1:
+        grafana_probes: Dict[str, str] = {}
+        for b in out:
+            b.prom_probe = f"prometheus:{b.name}"
+            if b.grafana_url:
+                b.grafana_probe = grafana_probes.setdefault(b.grafana_url, f"grafana:{b.name}")
+                b.shared_grafana = sum(o.grafana_url == b.grafana_url for o in out) > 1
+    return out
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+class Deadline:
+    """One fanned-out call's deadline; abandon() marks it as already reported timed out."""
+
+    def __init__(self, name: str, seconds: float):
+        self.name = name
+        self.seconds = seconds
+        self.at = time.monotonic() + seconds
+        self.abandoned = False
+
+    def remaining(self) -> float:
+        return self.at - time.monotonic()
+
+    def abandon(self):
+        self.abandoned = True
+
+    def check(self):
+        if self.abandoned or self.remaining() <= 0:
+            raise DeadlineExceeded(f"{self.name} did not answer within {self.seconds:g}s")
+
+_deadline: ContextVar[Optional[Deadline]] = ContextVar("fan_out_deadline", default=None)
+
+def check_deadline():
+    """Raise DeadlineExceeded when the fanned-out call running in this context is out of time (no-op outside one)."""
+    deadline = _deadline.get()
+    if deadline is not None:
+        deadline.check()
+
+def bounded(timeout: float) -> float:
+    """`timeout` for an outbound request, capped by the time left to the fanned-out call running in this context."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return timeout
+    deadline.check()
+    return min(timeout, deadline.remaining())
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+def _executor() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=max(1, Settings.FANOUT_WORKERS), thread_name_prefix="fanout")
+    return _pool
+
+def outcome(results: Dict[str, Dict[str, Any]]) -> str:
+    """"ok" when every backend succeeded, "failed" when none did, else "partial"."""
+    ok = sum(1 for r in results.values() if r["ok"])
+    return "ok" if ok == len(results) else ("failed" if ok == 0 else "partial")
+
+def _record(operation: str, name: str, result: Dict[str, Any]):
+    FANOUT_CALLS.labels(operation, name, "ok" if result["ok"] else result.get("reason", "error")).inc()
+
+def fan_out(backends: List[Backend], fn: Callable[[Backend], Any], operation: str) -> Dict[str, Dict[str, Any]]:
+    """
+    fn(backend) for every backend concurrently on the shared FANOUT_WORKERS
+    pool, each bounded by its own timeout -> name -> {ok, result | error,
+    elapsed_ms}. A call past its deadline is reported as timed out and
+    abandoned: its outbound requests are bounded by the deadline and its next
+    step raises DeadlineExceeded. A request already in flight at the deadline
+    (e.g. a Grafana upsert) may still be applied by the server.
+    """
+    started = time.monotonic()
+    finished: Dict[str, float] = {}
+
+    def run(b: Backend, deadline: Deadline):
+        token = _deadline.set(deadline)
+        try:
+            deadline.check()  # queued behind other calls for its whole timeout
+            return fn(b)
+        finally:
+            _deadline.reset(token)
+            finished[b.name] = time.monotonic()
+
+    deadlines = {b.name: Deadline(b.name, b.timeout) for b in backends}
+    futures = [(b, _executor().submit(run, b, deadlines[b.name])) for b in backends]
+    out: Dict[str, Dict[str, Any]] = {}
+    for b, fut in futures:
+        try:
+            r = {"ok": True, "result": fut.result(timeout=max(0.0, deadlines[b.name].remaining()))}
+        except (FutureTimeout, DeadlineExceeded):
+            deadlines[b.name].abandon()
+            fut.cancel()
+            r = {"ok": False, "reason": "timeout", "error": f"{b.name} did not answer within {b.timeout:g}s"}
+        except Exception as e:
+            r = {"ok": False, "error": str(e)}
+        r["elapsed_ms"] = round((finished.get(b.name, time.monotonic()) - started) * 1000, 2)
+        _record(operation, b.name, r)
+        out[b.name] = r
+    return out
+
+async def fan_out_async(backends: List[Backend], fn: Callable[[Backend], Awaitable[Any]],
+                        operation: str) -> Dict[str, Dict[str, Any]]:
+    """fan_out() for coroutines (ASGI mode); a coroutine past its deadline is cancelled."""
+    async def run(b: Backend) -> Dict[str, Any]:
+        started = time.monotonic()
+        try:
+            r = {"ok": True, "result": await asyncio.wait_for(fn(b), timeout=b.timeout)}
+        except asyncio.TimeoutError:
+            r = {"ok": False, "reason": "timeout", "error": f"{b.name} did not answer within {b.timeout:g}s"}
+        except Exception as e:
+            r = {"ok": False, "error": str(e)}
+        r["elapsed_ms"] = round((time.monotonic() - started) * 1000, 2)
+        _record(operation, b.name, r)
+        return r
+
+    results = await asyncio.gather(*(run(b) for b in backends))
+    return {b.name: r for b, r in zip(backends, results)}
@@ -0,0 +1,193 @@
+"""
+Threshold backtesting: replay proposed CPU/memory/disk thresholds against the
+last N days of the utilisation expressions rules.yml records, and report the
+alerts (`for:` durations included) that would have fired, next to what the
+current thresholds would have done over the same data.
+
+History is fetched as consecutive query_range windows of `chunk_points`
+steps, `workers` windows in flight at once, filtered in Prometheus to the
+samples above the lowest threshold being compared. Each window becomes one NumPy
+matrix (series x steps) that is evaluated for every series in a single pass
+as it arrives. Only per-series carry-over state (run length, open firing)
+survives from one window to the next, so memory is bounded by the window,
+not by the length of the range.
+"""
+import datetime, math, time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from backend.prom_alerts import ALERTS, DEFAULT_THRESHOLDS, METRICS, UTILISATION_RULES
+
+MAX_EVENTS = 200  # firings listed per metric and threshold set; the counts are always complete
+TOP = 10
+_UNITS = {"s": 1, "m": 60, "h": 3600}
+
+def duration_seconds(text: str) -> int:
+    """"5m" -> 300 (the `for:` durations in ALERTS)."""
+    return int(text[:-1]) * _UNITS[text[-1]]
+
+def resolver(thresholds: Dict[str, int], overrides: List[Dict[str, Any]]) -> Callable[[str, str, str], float]:
+    """(metric, instance, group) -> threshold, most specific first, like the rules' threshold series."""
+    by_key = {(o["metric"], o["scope"], o["match"]): float(o["value"]) for o in overrides}
+    glob = {**DEFAULT_THRESHOLDS, **thresholds}
+
+    def resolve(metric: str, instance: str, group: str) -> float:
+        return by_key.get((metric, "instance", instance), by_key.get((metric, "group", group), float(glob[metric])))
+    return resolve
+
+def _prefetch(pool: ThreadPoolExecutor, fn: Callable[[Any], Any], items: Iterable[Any], depth: int) -> Iterator[Tuple[Any, Any]]:
+    """(item, fn(item)) in order, with up to `depth` calls running ahead."""
+    pending: deque = deque()
+    for item in items:
+        pending.append((item, pool.submit(fn, item)))
+        if len(pending) >= depth:
+            item0, fut = pending.popleft()
+            yield item0, fut.result()
+    while pending:
+        item0, fut = pending.popleft()
+        yield item0, fut.result()
+
+class _Replay:
+    """Alert state machine of one metric under one set of thresholds, for every series at once."""
+
+    def __init__(self, np, need: int, step: float):
+        self.np, self.need, self.step = np, need, step
+        self.threshold = np.zeros(0)
+        self.run = np.zeros(0, dtype=np.int64)  # consecutive steps above threshold at the end of the last window
+        self.firing = np.zeros(0, dtype=bool)
+        self.alerts = np.zeros(0, dtype=np.int64)
+        self.firing_steps = np.zeros(0, dtype=np.int64)
+        self.opened: Dict[int, float] = {}  # row -> fired_at of its open firing
+        self.events: List[Tuple[int, float, Optional[float]]] = []
+        self.by_day: Counter = Counter()
+
+    def grow(self, thresholds: List[float]):
+        np = self.np
+        extra = len(thresholds)
+        self.threshold = np.concatenate([self.threshold, np.asarray(thresholds, dtype=float)])
+        self.run = np.concatenate([self.run, np.zeros(extra, dtype=np.int64)])
+        self.firing = np.concatenate([self.firing, np.zeros(extra, dtype=bool)])
+        self.alerts = np.concatenate([self.alerts, np.zeros(extra, dtype=np.int64)])
+        self.firing_steps = np.concatenate([self.firing_steps, np.zeros(extra, dtype=np.int64)])
+
+    def feed(self, values, t0: float):
+        """Advance by one window: `values` is series x steps starting at t0 (NaN = no sample, condition false)."""
+        np = self.np
+        with np.errstate(invalid="ignore"):
+            above = values > self.threshold[:, None]
+        # Run length of consecutive True per cell, continuing the previous window's run
+        cum = np.cumsum(above, axis=1)
+        run = cum - np.maximum.accumulate(np.where(above, 0, cum), axis=1)
+        run += np.where(np.logical_and.accumulate(above, axis=1), self.run[:, None], 0)
+        firing = run >= self.need
+        before = np.concatenate([self.firing[:, None], firing[:, :-1]], axis=1)
+        onset = firing & ~before
+        self.alerts += onset.sum(axis=1)
+        self.firing_steps += firing.sum(axis=1)
+        rows, cols = np.nonzero(onset | (before & ~firing))
+        for row, col in zip(rows.tolist(), cols.tolist()):  # transitions only, in time order per series
+            at = t0 + col * self.step
+            if firing[row, col]:
+                self.opened[row] = at
+                self.by_day[datetime.datetime.utcfromtimestamp(at).date().isoformat()] += 1
+            else:
+                fired = self.opened.pop(row, None)
+                if fired is not None and len(self.events) < MAX_EVENTS:
+                    self.events.append((row, fired, at))
+        self.run = run[:, -1].astype(np.int64)
+        self.firing = firing[:, -1].copy()
+
+    def report(self, labels: List[Dict[str, str]]) -> Dict[str, Any]:
+        np = self.np
+        events = self.events + [(row, at, None) for row, at in sorted(self.opened.items(), key=lambda kv: kv[1])
+                                if len(self.events) < MAX_EVENTS]
+        events = sorted(events, key=lambda e: e[1])[:MAX_EVENTS]
+        order = np.lexsort((-self.firing_steps, -self.alerts))[:TOP]
+        iso = lambda t: datetime.datetime.utcfromtimestamp(t).isoformat() + "Z" if t is not None else None
+        return {
+            "alerts": int(self.alerts.sum()),
+            "series_alerting": int((self.alerts > 0).sum()),
+            "instances_alerting": len({labels[i]["instance"] for i in np.nonzero(self.alerts)[0].tolist()}),
+            "firing_hours": round(float(self.firing_steps.sum()) * self.step / 3600, 2),
+            "still_firing": len(self.opened),
+            "by_day": dict(sorted(self.by_day.items())),
+            "top": [dict(labels[i], alerts=int(self.alerts[i]), threshold=float(self.threshold[i]),
+                         firing_hours=round(float(self.firing_steps[i]) * self.step / 3600, 2))
+                    for i in order.tolist() if self.alerts[i] > 0],
+            "events": [dict(labels[row], fired_at=iso(fired), resolved_at=iso(resolved))
+                       for row, fired, resolved in events],
+            "events_truncated": int(self.alerts.sum()) > len(events),
+        }
+
+def run_backtest(fetch_range: Callable[[str, float, float, float], Dict[str, Any]], proposed: Dict[str, int],
+                 current: Dict[str, int], overrides: List[Dict[str, Any]], days: float, step: float,
+                 group_label: str = "group", chunk_points: int = 360, workers: int = 4,
+                 now: Optional[float] = None) -> Dict[str, Any]:
+    """
+    `fetch_range(expr, start, end, step)` returns query_range's `data`.
+    `proposed` and `current` are global thresholds; both share `overrides`.
+    """
+    import numpy as np  # only the backtest needs it
+
+    started = time.monotonic()
+    end = math.floor((time.time() if now is None else now) / step) * step
+    total = int(days * 86400 // step)
+    start = end - (total - 1) * step
+    windows = [(start + i * step, min(chunk_points, total - i)) for i in range(0, total, chunk_points)]
+    sets = {"proposed": resolver(proposed, overrides), "current": resolver(current, overrides)}
+    state: Dict[str, Dict[str, Any]] = {}
+    for metric in METRICS:
+        need = math.ceil(duration_seconds(ALERTS[metric][1]) / step) + 1
+        # Only samples above the lowest threshold in play can ever count, so Prometheus drops the rest and
+        # a quiet fleet's windows come back nearly empty (a missing sample reads as "condition false")
+        floor = min([t[metric] for t in ({**DEFAULT_THRESHOLDS, **proposed}, {**DEFAULT_THRESHOLDS, **current})]
+                    + [o["value"] for o in overrides if o["metric"] == metric])
+        expr = f"({UTILISATION_RULES[metric][1].format(g=group_label)}) > {floor}"
+        state[metric] = {"expr": expr, "rows": {}, "labels": [],
+                         "replays": {name: _Replay(np, need, step) for name in sets}}
+    stats = {"windows": len(windows) * len(METRICS), "samples": 0}
+
+    def fetch(item):
+        metric, (t0, points) = item
+        data = fetch_range(state[metric]["expr"], t0, t0 + (points - 1) * step, step)
+        # Parse here, on the pool thread, so the next window's download overlaps with it
+        return [(s.get("metric") or {}, np.array(s.get("values") or [], dtype=float).reshape(-1, 2))
+                for s in data.get("result") or []]
+
+    items = [(metric, w) for w in windows for metric in METRICS]
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="backtest") as pool:
+        for (metric, (t0, points)), series in _prefetch(pool, fetch, items, max(1, workers)):
+            st = state[metric]
+            rows, labels, fresh = st["rows"], st["labels"], []
+            placed = []
+            for m, values in series:
+                key = (m.get("instance", ""), m.get(group_label, ""), m.get("volume", ""))
+                row = rows.get(key)
+                if row is None:
+                    row = rows[key] = len(labels)
+                    labels.append({k: v for k, v in zip(("instance", group_label, "volume"), key) if v})
+                    fresh.append(key)
+                placed.append((row, values))
+            if fresh:
+                for name, replay in st["replays"].items():
+                    replay.grow([sets[name](metric, k[0], k[1]) for k in fresh])
+            matrix = np.full((len(labels), points), np.nan)
+            for row, values in placed:
+                idx = np.rint((values[:, 0] - t0) / step).astype(np.int64)
+                ok = (idx >= 0) & (idx < points)
+                matrix[row, idx[ok]] = values[ok, 1]
+                stats["samples"] += int(ok.sum())
+            for replay in st["replays"].values():
+                replay.feed(matrix, t0)
+
+    out = {"start": datetime.datetime.utcfromtimestamp(start).isoformat() + "Z",
+           "end": datetime.datetime.utcfromtimestamp(end).isoformat() + "Z", "step": step, "days": days,
+           "thresholds": {"proposed": {**DEFAULT_THRESHOLDS, **proposed}, "current": {**DEFAULT_THRESHOLDS, **current}},
+           "metrics": {}}
+    for metric in METRICS:
+        st = state[metric]
+        out["metrics"][metric] = dict({"for": ALERTS[metric][1], "alert": ALERTS[metric][0], "expr": st["expr"],
+                                       "series_above_floor": len(st["labels"])},
+                                      **{name: r.report(st["labels"]) for name, r in st["replays"].items()})
+    out["stats"] = dict(stats, seconds=round(time.monotonic() - started, 2))
+    return out
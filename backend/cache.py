@@ -0,0 +1,111 @@
+import threading, time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+from backend.telemetry import CACHE_REQUESTS
+
+class _Flight:
+    __slots__ = ("event", "value", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error: Optional[BaseException] = None
+
+class TTLCache:
+    """
+    Bounded LRU cache with per-entry TTL and single-flight loading: when many
+    threads miss on the same key at once, one runs the loader and the others
+    wait for its result. Loader errors are not cached. A named cache also
+    counts its hits/misses in srd_cache_requests_total.
+
+    invalidate() bumps a generation counter; a load (or a set() given the
+    generation its value was read under) that started before it is dropped
+    instead of caching what may be the old value.
+    """
+
+    def __init__(self, max_entries: int = 512, ttl: float = 15.0, name: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._hit = CACHE_REQUESTS.labels(name, "hit").inc if name else (lambda: None)
+        self._miss = CACHE_REQUESTS.labels(name, "miss").inc if name else (lambda: None)
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[0] > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                self._hit()
+                return item[1]
+            self.misses += 1
+            self._miss()
+            return default
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None, generation: Optional[int] = None):
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return  # invalidated since the value was read
+            self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key: Optional[Hashable] = None):
+        with self._lock:
+            self._generation += 1
+            if key is None:
+                self._data.clear()
+                self._flights.clear()  # later callers start a fresh load instead of joining a stale one
+            else:
+                self._data.pop(key, None)
+                self._flights.pop(key, None)
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any], ttl: Optional[float] = None) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[0] > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                self._hit()
+                return item[1]
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                self.misses += 1
+                self._miss()
+                flight = self._flights[key] = _Flight()
+                generation = self._generation
+            else:
+                self.hits += 1  # coalesced onto the in-flight load
+                self._hit()
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+        try:
+            flight.value = loader()
+            self.set(key, flight.value, ttl, generation)
+            return flight.value
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            flight.event.set()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._data), "hits": self.hits, "misses": self.misses}
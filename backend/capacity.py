@@ -0,0 +1,372 @@
+"""
+Local capacity store: 5-minute min/avg/max/p95 of every instance's CPU and
+memory utilisation and every volume's disk utilisation, pulled in the
+background from the rules.yml recording rules and kept on disk as NumPy
+arrays, so capacity reports over weeks never query Prometheus.
+
+Layout under `directory`, per metric:
+    series.json       row -> {instance, volume, group}; rows are only ever appended
+    <day>.slots.npy   float32 (stat, row, slot): one column per 5 minutes, NaN = no data
+    <day>.agg.npy     float32 (stat, row, 103): the day's values counted in 1% buckets
+                      (0..100), then their sum and max -- all that reports read
+A month-long report adds up ~30 small rollups instead of scanning every
+5-minute value, so it takes milliseconds. Only one process collects (a lock
+file decides); every process can read.
+"""
+import datetime, io, json, logging, math, os, tempfile, threading, time, warnings
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single process serves the app there
+    fcntl = None
+
+log = logging.getLogger(__name__)
+STATS = ("min", "avg", "max", "p95")
+STAT_EXPRS = {"min": "min_over_time({rule}[{w}s])", "avg": "avg_over_time({rule}[{w}s])",
+              "max": "max_over_time({rule}[{w}s])", "p95": "quantile_over_time(0.95, {rule}[{w}s])"}
+BUCKETS = 101  # 0..100 %
+SUM, MAX = BUCKETS, BUCKETS + 1
+DAY = 86400
+
+def _save_atomic(path: str, data: bytes):
+    fd, tmp = tempfile.mkstemp(prefix=".cap-", suffix=".tmp", dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+def _npy(arr) -> bytes:
+    buf = io.BytesIO()
+    np.save(buf, arr)
+    return buf.getvalue()
+
+def _day(ts: float) -> str:
+    return datetime.datetime.utcfromtimestamp(ts).date().isoformat()
+
+class CapacityStore:
+    def __init__(self, directory: str, slot: int = 300, retention_days: int = 62, group_label: str = "group"):
+        self.directory = directory
+        self.slot = slot
+        self.slots_per_day = DAY // slot
+        self.retention_days = retention_days
+        self.group_label = group_label
+        self._lock = threading.RLock()
+        self._series: Dict[str, Tuple[float, List[Dict[str, str]], Dict[Tuple[str, str], int]]] = {}
+
+    def _path(self, metric: str, name: str) -> str:
+        return os.path.join(self.directory, metric, name)
+
+    # --- series registry ---
+
+    def series(self, metric: str) -> List[Dict[str, str]]:
+        return self._registry(metric)[0]
+
+    def _registry(self, metric: str) -> Tuple[List[Dict[str, str]], Dict[Tuple[str, str], int]]:
+        path = self._path(metric, "series.json")
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            return [], {}
+        with self._lock:
+            cached = self._series.get(metric)
+            if cached is None or cached[0] != mtime:
+                with open(path, encoding="utf-8") as f:
+                    rows = json.load(f)
+                cached = (mtime, rows, {(r["instance"], r.get("volume", "")): i for i, r in enumerate(rows)})
+                self._series[metric] = cached
+            return cached[1], cached[2]
+
+    def _rows(self, metric: str, labels: List[Dict[str, str]]) -> List[int]:
+        """Row of each series, appending new ones (and refreshing changed groups) to series.json."""
+        with self._lock:
+            rows, index = self._registry(metric)
+            rows, index, changed, out = list(rows), dict(index), False, []
+            for m in labels:
+                key = (m.get("instance", ""), m.get("volume", ""))
+                group = m.get(self.group_label, "")
+                i = index.get(key)
+                if i is None:
+                    i = index[key] = len(rows)
+                    rows.append({k: v for k, v in (("instance", key[0]), ("volume", key[1]), ("group", group)) if v})
+                    changed = True
+                elif rows[i].get("group", "") != group:
+                    rows[i] = dict(rows[i], group=group)
+                    changed = True
+                out.append(i)
+            if changed:
+                os.makedirs(os.path.join(self.directory, metric), exist_ok=True)
+                _save_atomic(self._path(metric, "series.json"), json.dumps(rows).encode("utf-8"))
+                self._series.pop(metric, None)
+            return out
+
+    # --- writing ---
+
+    def _slots(self, metric: str, day: str, rows: int):
+        """The day's slot array, memory-mapped for writing and grown to at least `rows` rows."""
+        path = self._path(metric, f"{day}.slots.npy")
+        if os.path.exists(path):
+            arr = np.load(path, mmap_mode="r+")
+            if arr.shape[1] >= rows:
+                return arr
+            grown = np.full((len(STATS), rows, self.slots_per_day), np.nan, dtype=np.float32)
+            grown[:, :arr.shape[1]] = arr
+            del arr
+            _save_atomic(path, _npy(grown))
+            return np.load(path, mmap_mode="r+")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        arr = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(len(STATS), rows, self.slots_per_day))
+        arr[:] = np.nan
+        return arr
+
+    def put(self, metric: str, day_start: float, stat: str, result: List[Dict[str, Any]]):
+        """
+        Store one query_range result for a day. A point at time t aggregates
+        the slot ending at t, so the day's points run from day_start + slot to day_start + 1 day.
+        """
+        if not result:
+            return
+        rows = self._rows(metric, [r.get("metric") or {} for r in result])
+        with self._lock:
+            arr = self._slots(metric, _day(day_start), max(rows) + 1)
+            values = [r.get("values") or [] for r in result]
+            v = np.array([p for vs in values for p in vs], dtype=float).reshape(-1, 2)
+            row = np.repeat(np.asarray(rows, dtype=np.int64), [len(vs) for vs in values])
+            idx = np.rint((v[:, 0] - self.slot - day_start) / self.slot).astype(np.int64)
+            ok = (idx >= 0) & (idx < self.slots_per_day)
+            arr[STATS.index(stat), row[ok], idx[ok]] = v[ok, 1]
+            arr.flush()
+
+    def rollup(self, metric: str, day: str):
+        """Recompute the day's histogram/sum/max rollup from its slots."""
+        path = self._path(metric, f"{day}.slots.npy")
+        if not os.path.exists(path):
+            return
+        with self._lock:
+            slots = np.array(np.load(path, mmap_mode="r"))
+        stats, rows, _ = slots.shape
+        have = ~np.isnan(slots)
+        buckets = np.clip(np.floor(np.nan_to_num(slots, nan=0.0)), 0, BUCKETS - 1).astype(np.int64)
+        flat = (np.arange(stats * rows).reshape(stats, rows, 1) * BUCKETS + buckets)[have]
+        agg = np.zeros((stats, rows, BUCKETS + 2), dtype=np.float32)
+        agg[..., :BUCKETS] = np.bincount(flat, minlength=stats * rows * BUCKETS).reshape(stats, rows, BUCKETS)
+        agg[..., SUM] = np.where(have, slots, 0).sum(axis=2)
+        agg[..., MAX] = np.where(have.any(axis=2), np.fmax.reduce(slots, axis=2, initial=-np.inf), np.nan)
+        _save_atomic(self._path(metric, f"{day}.agg.npy"), _npy(agg))
+
+    def prune(self, now: Optional[float] = None):
+        """Delete days older than the retention."""
+        cutoff = _day((time.time() if now is None else now) - self.retention_days * DAY)
+        for metric in os.listdir(self.directory) if os.path.isdir(self.directory) else []:
+            folder = os.path.join(self.directory, metric)
+            for name in os.listdir(folder) if os.path.isdir(folder) else []:
+                if name.endswith(".npy") and name[:10] < cutoff:
+                    os.unlink(os.path.join(folder, name))
+
+    # --- reading ---
+
+    def days(self, metric: str) -> List[str]:
+        folder = os.path.join(self.directory, metric)
+        return sorted(n[:10] for n in os.listdir(folder) if n.endswith(".agg.npy")) if os.path.isdir(folder) else []
+
+    def report(self, metric: str, days: int = 30, stat: str = "avg", threshold: float = 80.0, min_above: float = 0.0,
+               sort: str = "above", group: Optional[str] = None, instance: Optional[str] = None, limit: int = 50,
+               now: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Per-series percentiles, mean, max and share of 5-minute `stat` values at
+        or above `threshold` (%) over the last `days` days, ranked by `sort`
+        (above | p95 | p50 | mean | max). `min_above` (%) keeps only series
+        that spent at least that share of their samples over the threshold.
+        """
+        if stat not in STATS:
+            raise ValueError(f"stat must be one of {', '.join(STATS)}")
+        if sort not in ("above", "p95", "p50", "mean", "max"):
+            raise ValueError("sort must be above, p95, p50, mean or max")
+        k = STATS.index(stat)
+        today = _day(time.time() if now is None else now)
+        first = _day((time.time() if now is None else now) - (days - 1) * DAY)
+        series = self.series(metric)
+        total = np.zeros((len(series), BUCKETS + 2), dtype=np.float64)
+        peak = np.full(len(series), np.nan)
+        used = [d for d in self.days(metric) if first <= d <= today]
+        for d in used:
+            agg = np.load(self._path(metric, f"{d}.agg.npy"), mmap_mode="r")[k]
+            n = min(agg.shape[0], len(series))
+            total[:n, :SUM + 1] += agg[:n, :SUM + 1]
+            peak[:n] = np.fmax(peak[:n], agg[:n, MAX])
+        hist = total[:, :BUCKETS]
+        count = hist.sum(axis=1)
+        cum = hist.cumsum(axis=1)
+        safe = np.maximum(count, 1)
+        t = int(min(max(math.ceil(threshold), 0), BUCKETS))
+        cols = {
+            "samples": count,
+            "above": hist[:, t:].sum(axis=1) / safe * 100,
+            "mean": total[:, SUM] / safe,
+            "p50": (cum >= 0.50 * count[:, None]).argmax(axis=1).astype(float),
+            "p95": (cum >= 0.95 * count[:, None]).argmax(axis=1).astype(float),
+            "max": peak,
+        }
+        keep = count > 0
+        if min_above:
+            keep &= cols["above"] >= min_above
+        if group:
+            keep &= np.array([s.get("group") == group for s in series], dtype=bool)
+        if instance:
+            keep &= np.array([s["instance"] == instance for s in series], dtype=bool)
+        picked = np.nonzero(keep)[0]
+        picked = picked[np.lexsort((-np.nan_to_num(cols["max"][picked], nan=-1), -cols[sort][picked]))]
+        fleet_hist = hist[keep].sum(axis=0)
+        fleet_cum = fleet_hist.cumsum()
+        fleet_n = fleet_hist.sum()
+        rnd = lambda x: None if x is None or np.isnan(x) else round(float(x), 1)
+        return {
+            "metric": metric, "stat": stat, "threshold": threshold, "days_covered": used,
+            "series": int((count > 0).sum()), "matching": int(len(picked)),
+            "fleet": {"samples": int(fleet_n),
+                      "p50": float((fleet_cum >= 0.50 * fleet_n).argmax()) if fleet_n else None,
+                      "p95": float((fleet_cum >= 0.95 * fleet_n).argmax()) if fleet_n else None,
+                      "above": rnd(fleet_hist[t:].sum() / fleet_n * 100) if fleet_n else None},
+            "rows": [dict(series[i], samples=int(count[i]), above=rnd(cols["above"][i]),
+                          hours_above=round(float(hist[i, t:].sum()) * self.slot / 3600, 1),
+                          mean=rnd(cols["mean"][i]), p50=rnd(cols["p50"][i]), p95=rnd(cols["p95"][i]),
+                          max=rnd(cols["max"][i]))
+                     for i in picked[:max(1, int(limit))].tolist()],
+        }
+
+    def timeline(self, metric: str, instance: str, volume: str = "", days: int = 7,
+                 now: Optional[float] = None) -> Dict[str, Any]:
+        """One series' 5-minute min/avg/max/p95 (hourly beyond 2 days) for drill-down from a report."""
+        _, index = self._registry(metric)
+        row = index.get((instance, volume))
+        if row is None:
+            raise KeyError(f"no {metric} data for {instance} {volume}".strip())
+        now = time.time() if now is None else now
+        start = (math.floor(now / DAY) - (days - 1)) * DAY
+        parts = []
+        for i in range(days):
+            path = self._path(metric, f"{_day(start + i * DAY)}.slots.npy")
+            arr = np.load(path, mmap_mode="r") if os.path.exists(path) else None
+            if arr is not None and row < arr.shape[1]:
+                parts.append(np.array(arr[:, row, :]))
+            else:
+                parts.append(np.full((len(STATS), self.slots_per_day), np.nan, dtype=np.float32))
+        data = np.concatenate(parts, axis=1)
+        step = self.slot
+        if days > 2:  # hourly: min of mins, mean of avgs, max of maxes, max of p95s
+            per = 3600 // self.slot
+            d = data.reshape(len(STATS), -1, per)
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", RuntimeWarning)  # hours without data stay NaN
+                data = np.stack([np.nanmin(d[0], axis=1), np.nanmean(d[1], axis=1),
+                                 np.nanmax(d[2], axis=1), np.nanmax(d[3], axis=1)])
+            step = 3600
+        rounded = np.round(data.astype(float), 2)
+        return {"metric": metric, "instance": instance, "volume": volume or None, "start": start, "step": step,
+                **{s: [None if np.isnan(v) else v for v in rounded[k].tolist()] for k, s in enumerate(STATS)}}
+
+class CapacityCollector:
+    """
+    Pulls the 5-minute aggregates from Prometheus every `interval` seconds,
+    one query_range per metric, stat and day, resuming after the last slot it
+    stored (or `backfill_days` back on a fresh store). Progress and the last
+    failure are kept in state.json, so every worker can report them.
+    """
+
+    def __init__(self, store: CapacityStore, fetch_range: Callable[[str, float, float, float], Dict[str, Any]],
+                 rules: Dict[str, str], interval: float = 300.0, backfill_days: int = 7, lag: float = 60.0):
+        self.store = store
+        self.fetch_range = fetch_range
+        self.rules = rules  # metric -> recording rule name
+        self.interval = interval
+        self.backfill_days = backfill_days
+        self.lag = lag  # let the rule evaluate the end of the slot first
+        self.state_path = os.path.join(store.directory, "state.json")
+        self._thread: Optional[threading.Thread] = None
+        self._lockfile = None
+
+    def _load(self) -> Dict[str, Any]:
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save(self, state: Dict[str, Any]):
+        _save_atomic(self.state_path, json.dumps(state).encode("utf-8"))
+
+    def state(self) -> Dict[str, float]:
+        """Metric -> end of the last slot stored."""
+        return {k: v for k, v in self._load().items() if k in self.rules}
+
+    @property
+    def last_error(self) -> Optional[str]:
+        """Why the collector's last run failed (in whichever process collects); None once a run succeeds."""
+        return self._load().get("error")
+
+    def _set_error(self, error: Optional[str]):
+        state = self._load()
+        if state.get("error") != error:
+            state["error"] = error
+            self._save(state)
+
+    def collect(self, now: Optional[float] = None) -> Dict[str, int]:
+        """Fetch every complete slot not stored yet; returns slots stored per metric."""
+        slot = self.store.slot
+        now = time.time() if now is None else now
+        end = math.floor((now - self.lag) / slot) * slot
+        state = self._load()
+        done: Dict[str, int] = {}
+        for metric, rule in self.rules.items():
+            last = max(state.get(metric, 0), end - self.backfill_days * DAY)
+            t = last + slot
+            while t <= end:
+                day_start = math.floor((t - slot) / DAY) * DAY
+                stop = min(end, day_start + DAY)
+                for stat in STATS:
+                    expr = STAT_EXPRS[stat].format(rule=rule, w=slot)
+                    self.store.put(metric, day_start, stat, self.fetch_range(expr, t, stop, slot).get("result") or [])
+                self.store.rollup(metric, _day(day_start))
+                done[metric] = done.get(metric, 0) + int((stop - t) // slot) + 1
+                state[metric] = stop
+                self._save(state)
+                t = stop + slot
+        self.store.prune(now)
+        return done
+
+    def start(self) -> bool:
+        """Collect in a daemon thread, unless another process already does; True if this one collects."""
+        if self._thread is not None:
+            return True
+        os.makedirs(self.store.directory, exist_ok=True)
+        if fcntl is not None:
+            f = open(os.path.join(self.store.directory, ".collector.lock"), "a")
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                f.close()
+                return False
+            self._lockfile = f  # held for the life of the process
+        self._thread = threading.Thread(target=self._run, name="capacity-collector", daemon=True)
+        self._thread.start()
+        return True
+
+    def _run(self):
+        while True:
+            try:
+                self.collect()
+                self._set_error(None)
+            except Exception as e:
+                try:
+                    self._set_error(str(e) or type(e).__name__)
+                except OSError:
+                    pass  # e.g. the disk is full: the warning below still says why
+                log.warning("Capacity collection failed (will retry): %s", e)
+            time.sleep(self.interval)
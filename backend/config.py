@@ -7,15 +7,122 @@ class Settings:
     SECRET_KEY = os.getenv("FLASK_SECRET_KEY", "dev-secret")
     FLASK_HOST = os.getenv("FLASK_HOST", "127.0.0.1")
     FLASK_PORT = int(os.getenv("FLASK_PORT", "5050"))
+    # ASGI mode (backend/asgi.py): threads serving the plain Flask routes
+    ASGI_WSGI_WORKERS = int(os.getenv("ASGI_WSGI_WORKERS", "16"))
+    # ASGI mode: threads for the blocking Grafana inventory lookups, kept apart from the default executor
+    # that authenticates every async request, so a slow Grafana cannot stall logins to the async routes
+    ASGI_GRAFANA_THREADS = int(os.getenv("ASGI_GRAFANA_THREADS", "4"))
+
+    # Database (backend/db.py): SQLite file in WAL mode by default, or e.g. postgresql+psycopg://user:pw@host/srd
+    DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///" + os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "srd_users.db"))
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+    DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+    DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+    # Seconds a SQLite writer waits for the lock before "database is locked"
+    DB_BUSY_TIMEOUT = float(os.getenv("DB_BUSY_TIMEOUT", "5"))
+    DB_ECHO = os.getenv("DB_ECHO", "0") == "1"
+
+    # /login throttling (backend/login_throttle.py): token buckets per client IP and per account,
+    # kept in this process ("memory") or shared by all workers ("redis://host:6379/0").
+    LOGIN_THROTTLE_STORE = os.getenv("LOGIN_THROTTLE_STORE", "memory")
+    LOGIN_IP_PER_MIN = float(os.getenv("LOGIN_IP_PER_MIN", "30"))
+    LOGIN_IP_BURST = float(os.getenv("LOGIN_IP_BURST", "10"))
+    LOGIN_ACCOUNT_PER_MIN = float(os.getenv("LOGIN_ACCOUNT_PER_MIN", "5"))
+    LOGIN_ACCOUNT_BURST = float(os.getenv("LOGIN_ACCOUNT_BURST", "5"))
+    # Password hash checks allowed at once (0 = unlimited) and how long a login waits for a slot
+    LOGIN_HASH_CONCURRENCY = int(os.getenv("LOGIN_HASH_CONCURRENCY", str(os.cpu_count() or 2)))
+    LOGIN_HASH_WAIT = float(os.getenv("LOGIN_HASH_WAIT", "2"))
+    # Behind a reverse proxy: number of proxies whose X-Forwarded-For to trust (0 = use the socket address)
+    PROXY_FIX_X_FOR = int(os.getenv("PROXY_FIX_X_FOR", "0"))
+
+    # Users per transaction for /api/users/import
+    USER_IMPORT_BATCH = int(os.getenv("USER_IMPORT_BATCH", "500"))
+
+    # Flask-Login identity cache (backend/user_cache.py). The marker file is
+    # touched on user changes so every worker process drops its cached users.
+    USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "300"))
+    USER_CACHE_MARKER = os.getenv("USER_CACHE_MARKER",
+                                  os.path.join(os.path.dirname(os.path.abspath(__file__)), ".user_cache_marker"))
 
     GRAFANA_URL = os.getenv("GRAFANA_URL", "http://localhost:3001")
     GRAFANA_TOKEN = os.getenv("GRAFANA_TOKEN")
 
+    # Shared keep-alive Grafana client (see backend/grafana_api.py)
+    GRAFANA_POOL_SIZE = int(os.getenv("GRAFANA_POOL_SIZE", "10"))
+    GRAFANA_RETRIES = int(os.getenv("GRAFANA_RETRIES", "3"))
+    GRAFANA_BACKOFF = float(os.getenv("GRAFANA_BACKOFF", "0.3"))
+    GRAFANA_TIMEOUT = float(os.getenv("GRAFANA_TIMEOUT", "15"))
+    # Datasource/folder/dashboard lists are cached in memory and re-listed in the background (seconds, 0 = never)
+    GRAFANA_INVENTORY_REFRESH = float(os.getenv("GRAFANA_INVENTORY_REFRESH", "300"))
+    GRAFANA_INVENTORY_PAGE_SIZE = int(os.getenv("GRAFANA_INVENTORY_PAGE_SIZE", "1000"))
+    # Concurrent dashboard upserts for /admin/provision-bulk (keep <= GRAFANA_POOL_SIZE)
+    PROVISION_WORKERS = int(os.getenv("PROVISION_WORKERS", "8"))
+
     PROMETHEUS_URL = os.getenv("PROMETHEUS_URL", "http://localhost:9090")
+    # Should match scrape_interval in prometheus/prometheus.yml; drives query-proxy alignment and cache TTL
+    PROM_SCRAPE_INTERVAL = float(os.getenv("PROM_SCRAPE_INTERVAL", "15"))
+    PROM_QUERY_CACHE_SIZE = int(os.getenv("PROM_QUERY_CACHE_SIZE", "512"))
+    # Poll period of the shared live-metrics stream (/api/metrics/stream)
+    LIVE_METRICS_INTERVAL = float(os.getenv("LIVE_METRICS_INTERVAL", "15"))
+
+    # Bearer token required to scrape /metrics; empty = open (restrict it at the proxy instead)
+    METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+    # Background health probing for /api/status (seconds)
+    HEALTH_PROBE_INTERVAL = float(os.getenv("HEALTH_PROBE_INTERVAL", "10"))
+    HEALTH_TTL = float(os.getenv("HEALTH_TTL", "30"))
+    HEALTH_PROBE_TIMEOUT = float(os.getenv("HEALTH_PROBE_TIMEOUT", "2"))
+
+    # Several Prometheus shards (and their Grafanas): YAML/JSON file listing them, see backend/backends.py.
+    # Empty = the single backend above. Status probes, rule reloads and provisioning run on all of them at
+    # once, each within its `timeout` (default BACKEND_TIMEOUT seconds).
+    BACKENDS_FILE = os.getenv("BACKENDS_FILE", "")
+    BACKEND_TIMEOUT = float(os.getenv("BACKEND_TIMEOUT", "30"))
+    # Threads shared by every fan-out (all requests, all backends); calls beyond it queue within their timeout
+    FANOUT_WORKERS = int(os.getenv("FANOUT_WORKERS", "32"))
 
     GRAFANA_FOLDER_TITLE = os.getenv("GRAFANA_FOLDER_TITLE", "SRD - API Provisioned")
     GRAFANA_DASHBOARD_TITLE = os.getenv("GRAFANA_DASHBOARD_TITLE", "SRD - Network Resources (HTTP API)")
+    # Dashboard edits are stored as JSON Patch revisions (backend/dashboard_sources.py): a full snapshot is
+    # written every DASHBOARD_SNAPSHOT_EVERY versions, and other workers' edits are picked up within
+    # DASHBOARD_CHECK_INTERVAL seconds
+    DASHBOARD_SNAPSHOT_EVERY = int(os.getenv("DASHBOARD_SNAPSHOT_EVERY", "50"))
+    DASHBOARD_CHECK_INTERVAL = float(os.getenv("DASHBOARD_CHECK_INTERVAL", "1"))
 
     PROM_RULES_PATH = os.getenv("PROM_RULES_PATH", "prometheus/rules.yml")
     PROM_RELOAD_URL = os.getenv("PROM_RELOAD_URL", "http://localhost:9090/-/reload")
     ALERTMANAGER_RELOAD_URL = os.getenv("ALERTMANAGER_RELOAD_URL", "http://localhost:9093/-/reload")
+    # Target label used for per-group threshold overrides (e.g. set by file_sd)
+    ALERT_GROUP_LABEL = os.getenv("ALERT_GROUP_LABEL", "group")
+    # Host inventory (backend/hosts.py): file_sd target files, one per group, watched by Prometheus
+    HOST_SD_DIR = os.getenv("HOST_SD_DIR", "prometheus/targets")
+    HOST_DEFAULT_PORT = int(os.getenv("HOST_DEFAULT_PORT", "9182"))  # windows_exporter's port
+    HOST_IMPORT_BATCH = int(os.getenv("HOST_IMPORT_BATCH", "1000"))
+    # Threshold backtests (/api/alerts/backtest, needs numpy): range limit, default resolution (s),
+    # steps per query_range window, windows fetched in parallel and the per-window timeout (s)
+    BACKTEST_MAX_DAYS = float(os.getenv("BACKTEST_MAX_DAYS", "30"))
+    BACKTEST_STEP = float(os.getenv("BACKTEST_STEP", "60"))
+    BACKTEST_CHUNK_POINTS = int(os.getenv("BACKTEST_CHUNK_POINTS", "360"))
+    BACKTEST_WORKERS = int(os.getenv("BACKTEST_WORKERS", "4"))
+    BACKTEST_TIMEOUT = float(os.getenv("BACKTEST_TIMEOUT", "60"))
+    # Capacity store (backend/capacity.py, needs numpy): 5-minute aggregates pulled from Prometheus
+    # every CAPACITY_INTERVAL seconds into local files; CAPACITY_COLLECT=0 leaves collection to another host
+    CAPACITY_DIR = os.getenv("CAPACITY_DIR", "capacity_store")
+    CAPACITY_COLLECT = os.getenv("CAPACITY_COLLECT", "1") == "1"
+    CAPACITY_INTERVAL = float(os.getenv("CAPACITY_INTERVAL", "300"))
+    CAPACITY_RETENTION_DAYS = int(os.getenv("CAPACITY_RETENTION_DAYS", "62"))
+    CAPACITY_BACKFILL_DAYS = int(os.getenv("CAPACITY_BACKFILL_DAYS", "7"))
+    CAPACITY_TIMEOUT = float(os.getenv("CAPACITY_TIMEOUT", "60"))
+    # Alertmanager webhook -> alert history (backend/alert_history.py). With a token set, Alertmanager must send
+    # Authorization: Bearer <token> (http_config.authorization in alertmanager.yml); empty = open (logged at start).
+    ALERT_WEBHOOK_TOKEN = os.getenv("ALERT_WEBHOOK_TOKEN", "")
+    ALERT_FLUSH_INTERVAL = float(os.getenv("ALERT_FLUSH_INTERVAL", "1"))
+    ALERT_FLUSH_BATCH = int(os.getenv("ALERT_FLUSH_BATCH", "1000"))
+    # Buffered events per process before the webhook answers 503 (Alertmanager retries)
+    ALERT_BUFFER_MAX = int(os.getenv("ALERT_BUFFER_MAX", "50000"))
+    # Rule changes within this many seconds are folded into one reload (across all workers)
+    RULES_RELOAD_WINDOW = float(os.getenv("RULES_RELOAD_WINDOW", "2"))
+    # Lock file serialising "save thresholds + write rules" across workers; empty = <PROM_RULES_PATH>.lock
+    RULES_LOCK_FILE = os.getenv("RULES_LOCK_FILE", "")
@@ -0,0 +1,269 @@
+"""
+Versioned dashboard sources: the dashboards SRD provisions, kept in the
+database instead of being rewritten in backend/grafana on every edit.
+
+A source is seeded from its file (version 1) the first time it is used.
+Every edit is a JSON Patch against a known version. The patch and its inverse
+are stored as one dashboard_revisions row, and the head's version is
+compare-and-set, so a writer that started from an older version gets
+VersionConflict instead of overwriting someone else's change. An edit
+stores only the delta; a full snapshot is refreshed every `snapshot_every`
+versions so a fresh worker replays at most that many patches.
+
+Each process keeps the head tree (and its compiled template) in memory. A
+reader checks the head's version at most every `check_interval` seconds
+and catches up by applying the newer patches, so applying an edit costs
+the size of the patch, not of the dashboard.
+"""
+import hashlib, json, logging, os, threading, time
+from typing import Any, Dict, List, Optional
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from backend.dashboard_templates import CompiledTemplate
+from backend.json_patch import PatchError, PatchTestFailed, apply_patch, diff, merge_ops
+from backend.models import DashboardRevision, DashboardSource
+from backend.provisioning import GRAFANA_DIR, template_path
+from backend.telemetry import DASHBOARD_EDITS
+
+log = logging.getLogger(__name__)
+MAX_OPS = 5000  # operations per edit
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+class VersionConflict(Exception):
+    def __init__(self, name: str, base: Any, current: int):
+        super().__init__(f"{name} is at version {current}, not {base}")
+        self.current = current
+
+def _dumps(obj: Any) -> str:
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+def validate(doc: Any):
+    """What every version of a dashboard must look like (raises PatchError)."""
+    if not isinstance(doc, dict):
+        raise PatchError("a dashboard is a JSON object")
+    if not isinstance(doc.get("title"), str) or not doc["title"].strip():
+        raise PatchError("the dashboard needs a non-empty title")
+    panels = doc.get("panels")
+    if panels is not None and (not isinstance(panels, list) or not all(isinstance(p, dict) for p in panels)):
+        raise PatchError("panels must be a list of objects")
+
+class _Head:
+    __slots__ = ("version", "tree", "template", "checked")
+
+    def __init__(self, version: int, tree: Dict[str, Any]):
+        self.version = version
+        self.tree = tree  # shared with readers and templates: never mutated, edits build a new tree
+        self.template: Optional[CompiledTemplate] = None
+        self.checked = time.monotonic()
+
+class DashboardSources:
+    def __init__(self, engine, snapshot_every: int = 50, check_interval: float = 1.0):
+        self.engine = engine
+        self.snapshot_every = max(1, snapshot_every)
+        self.check_interval = check_interval
+        self._heads: Dict[str, _Head] = {}
+        self._lock = threading.RLock()
+
+    # --- reading ---
+
+    def _file(self, name: str):
+        path = template_path(name)
+        if not os.path.isfile(path):
+            raise KeyError(f"unknown dashboard {name!r}")
+        with open(path, "rb") as f:
+            raw = f.read()
+        return json.loads(raw), hashlib.sha256(raw).hexdigest()
+
+    def _seed(self, name: str):
+        tree, file_hash = self._file(name)
+        with Session(self.engine) as s:
+            try:
+                s.execute(insert(DashboardSource).values(name=name, version=1, snapshot=_dumps(tree),
+                                                         snapshot_version=1, file_hash=file_hash, updated_by="file"))
+                s.execute(insert(DashboardRevision).values(name=name, version=1, ops="[]", inverse="[]", author="file"))
+                s.commit()
+                log.info("Dashboard %s seeded from its file", name)
+            except IntegrityError:
+                s.rollback()  # another worker seeded it first
+
+    def _version(self, name: str):
+        with Session(self.engine) as s:
+            return s.execute(select(DashboardSource.version, DashboardSource.snapshot_version)
+                             .where(DashboardSource.name == name)).first()
+
+    def _head(self, name: str, fresh: bool = False) -> _Head:
+        with self._lock:
+            head = self._heads.get(name)
+            if head is not None and not fresh and time.monotonic() - head.checked < self.check_interval:
+                return head
+            row = self._version(name)
+            if row is None:
+                self._seed(name)
+                row = self._version(name)
+            if head is not None and head.version == row.version:
+                head.checked = time.monotonic()
+                return head
+            with Session(self.engine) as s:
+                if head is not None and head.version >= row.snapshot_version:
+                    version, tree = head.version, head.tree  # catch up from what we have
+                else:
+                    snap = s.execute(select(DashboardSource.snapshot, DashboardSource.snapshot_version)
+                                     .where(DashboardSource.name == name)).one()
+                    version, tree = snap.snapshot_version, json.loads(snap.snapshot)
+                for rev in s.execute(select(DashboardRevision.version, DashboardRevision.ops)
+                                     .where(DashboardRevision.name == name, DashboardRevision.version > version)
+                                     .order_by(DashboardRevision.version)):
+                    tree, _ = apply_patch(tree, json.loads(rev.ops))
+                    version = rev.version
+            head = self._heads[name] = _Head(version, tree)
+            return head
+
+    def head(self, name: str):
+        """(version, tree) of the latest version; the tree is shared, treat it as read-only."""
+        head = self._head(name)
+        return head.version, head.tree
+
+    def template(self, name: str) -> CompiledTemplate:
+        """The latest version as a template, compiled once per version."""
+        head = self._head(name)
+        if head.template is None:
+            head.template = CompiledTemplate(head.tree)
+        return head.template
+
+    def at(self, name: str, version: int) -> Dict[str, Any]:
+        """The dashboard as it was at `version`, walked back from the head through the stored inverse patches."""
+        head = self._head(name, fresh=True)
+        if version == head.version:
+            return head.tree
+        if not 1 <= version < head.version:
+            raise KeyError(f"{name} has no version {version}")
+        tree = head.tree
+        with Session(self.engine) as s:
+            for rev in s.execute(select(DashboardRevision.inverse)
+                                 .where(DashboardRevision.name == name, DashboardRevision.version > version,
+                                        DashboardRevision.version <= head.version)
+                                 .order_by(DashboardRevision.version.desc())):
+                tree, _ = apply_patch(tree, json.loads(rev.inverse))
+        return tree
+
+    def sources(self) -> List[Dict[str, Any]]:
+        """Every dashboard (files in backend/grafana, stored ones), its version and whether its file changed since."""
+        files = {f for f in os.listdir(GRAFANA_DIR) if f.endswith(".json")}
+        for name in sorted(files):
+            self._head(name)  # seeds new files
+        with Session(self.engine) as s:
+            rows = s.execute(select(DashboardSource.name, DashboardSource.version, DashboardSource.file_hash,
+                                    DashboardSource.updated_at, DashboardSource.updated_by)
+                             .order_by(DashboardSource.name)).all()
+        out = []
+        for r in rows:
+            file_changed = None
+            if r.name in files:
+                with open(template_path(r.name), "rb") as f:
+                    file_changed = hashlib.sha256(f.read()).hexdigest() != r.file_hash
+            out.append({"name": r.name, "version": r.version, "updated_at": r.updated_at, "updated_by": r.updated_by,
+                        "file_changed": file_changed})
+        return out
+
+    def history(self, name: str, before: Optional[int] = None, limit: int = PAGE_SIZE):
+        """(revisions newest first, cursor for the next page or None); pass the cursor back as `before`."""
+        self._head(name)
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        q = select(DashboardRevision.version, DashboardRevision.author, DashboardRevision.created_at,
+                   DashboardRevision.ops).where(DashboardRevision.name == name)
+        if before is not None:
+            q = q.where(DashboardRevision.version < before)
+        with Session(self.engine) as s:
+            rows = s.execute(q.order_by(DashboardRevision.version.desc()).limit(limit)).all()
+        revisions = [{"version": r.version, "author": r.author, "created_at": r.created_at, "ops": json.loads(r.ops)}
+                     for r in rows]
+        return revisions, (rows[-1].version if len(rows) == limit and rows[-1].version > 1 else None)
+
+    # --- writing ---
+
+    def _conflict(self, name: str, base: Any) -> VersionConflict:
+        DASHBOARD_EDITS.labels("conflict").inc()
+        return VersionConflict(name, base, self._head(name, fresh=True).version)
+
+    def edit(self, name: str, base_version: int, ops: List[Dict[str, Any]],
+             author: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Apply a JSON Patch to version `base_version`, which must be the latest.
+        Raises VersionConflict when it is not, PatchTestFailed when a "test"
+        operation fails and PatchError for any other bad patch.
+        """
+        if not isinstance(ops, list):
+            raise PatchError("a JSON Patch is a list of operations")
+        if len(ops) > MAX_OPS:
+            raise PatchError(f"at most {MAX_OPS} operations per edit")
+        with self._lock:
+            head = self._head(name, fresh=True)
+            if base_version != head.version:
+                raise self._conflict(name, base_version)
+            try:
+                tree, inverse = apply_patch(head.tree, ops)
+                validate(tree)
+            except PatchError as e:
+                DASHBOARD_EDITS.labels("test_failed" if isinstance(e, PatchTestFailed) else "invalid").inc()
+                raise
+            if not inverse:  # only "test" operations
+                DASHBOARD_EDITS.labels("unchanged").inc()
+                return {"name": name, "version": head.version, "changed": False}
+            version = head.version + 1
+            values = {"version": version, "updated_by": author}
+            if version % self.snapshot_every == 0:
+                values.update(snapshot=_dumps(tree), snapshot_version=version)
+            with Session(self.engine) as s:
+                try:
+                    res = s.execute(update(DashboardSource)
+                                    .where(DashboardSource.name == name, DashboardSource.version == head.version)
+                                    .values(**values))
+                    if res.rowcount != 1:
+                        s.rollback()
+                        raise self._conflict(name, base_version)
+                    s.execute(insert(DashboardRevision).values(name=name, version=version, ops=_dumps(ops),
+                                                               inverse=_dumps(inverse), author=author))
+                    s.commit()
+                except IntegrityError:
+                    s.rollback()
+                    raise self._conflict(name, base_version)
+            self._heads[name] = _Head(version, tree)
+        DASHBOARD_EDITS.labels("saved").inc()
+        return {"name": name, "version": version, "changed": True, "ops": len(ops)}
+
+    def merge(self, name: str, base_version: int, patch: Dict[str, Any],
+              author: Optional[str] = None) -> Dict[str, Any]:
+        """edit() with a JSON Merge Patch (null deletes a member, objects merge, anything else replaces)."""
+        if not isinstance(patch, dict):
+            raise PatchError("a merge patch is a JSON object")
+        with self._lock:
+            head = self._head(name, fresh=True)
+            if base_version != head.version:
+                raise self._conflict(name, base_version)
+            return self.edit(name, base_version, merge_ops(head.tree, patch), author)
+
+    def save(self, name: str, base_version: int, doc: Any, author: Optional[str] = None) -> Dict[str, Any]:
+        """edit() with a whole document; only its differences from version `base_version` are stored."""
+        with self._lock:
+            head = self._head(name, fresh=True)
+            if base_version != head.version:
+                raise self._conflict(name, base_version)
+            validate(doc)
+            return self.edit(name, base_version, diff(head.tree, doc), author)
+
+    def revert(self, name: str, base_version: int, to_version: int, author: Optional[str] = None) -> Dict[str, Any]:
+        """A new version with the content of `to_version` (history is kept)."""
+        with self._lock:
+            return dict(self.save(name, base_version, self.at(name, to_version), author), reverted_to=to_version)
+
+    def import_file(self, name: str, base_version: int, author: Optional[str] = None) -> Dict[str, Any]:
+        """A new version with the content of the dashboard's file in backend/grafana (e.g. after an upgrade)."""
+        tree, file_hash = self._file(name)
+        with self._lock:
+            res = self.save(name, base_version, tree, author)
+            with Session(self.engine) as s:
+                s.execute(update(DashboardSource).where(DashboardSource.name == name).values(file_hash=file_hash))
+                s.commit()
+        return res
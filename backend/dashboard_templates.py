@@ -0,0 +1,92 @@
+import json, os, re, threading
+from typing import Any, Dict, List, Optional, Tuple
+
+# "__PROM__", "__TITLE__", "__INSTANCE__", "__CPU_WARN__", ... anywhere in a string value
+PLACEHOLDER = re.compile(r"__([A-Z][A-Z0-9_]*)__")
+
+class Placeholder:
+    __slots__ = ("path", "text", "names", "whole")
+
+    def __init__(self, path: Tuple, text: str):
+        self.path = path
+        self.text = text
+        self.names = PLACEHOLDER.findall(text)
+        # "__CPU_WARN__" on its own is replaced by the raw value, so numbers stay numbers.
+        self.whole = self.names[0] if PLACEHOLDER.fullmatch(text) else None
+
+    def render(self, values: Dict[str, Any]) -> Any:
+        if self.whole is not None:
+            return values.get(self.whole, self.text)
+        return PLACEHOLDER.sub(lambda m: str(values[m.group(1)]) if m.group(1) in values else m.group(0), self.text)
+
+class CompiledTemplate:
+    """
+    A dashboard parsed once, with the JSON path of every placeholder string.
+
+    render() copies only the containers on the paths leading to placeholders
+    (and the root), everything else is shared with the template, so the
+    result must be treated as read-only.
+    """
+
+    def __init__(self, tree: Dict[str, Any]):
+        self.tree = tree
+        self.placeholders: List[Placeholder] = []
+        self._scan(tree, ())
+
+    def _scan(self, obj: Any, path: Tuple):
+        if isinstance(obj, dict):
+            for k, v in obj.items():
+                self._scan(v, path + (k,))
+        elif isinstance(obj, list):
+            for i, v in enumerate(obj):
+                self._scan(v, path + (i,))
+        elif isinstance(obj, str) and PLACEHOLDER.search(obj):
+            self.placeholders.append(Placeholder(path, obj))
+
+    @property
+    def names(self) -> List[str]:
+        return sorted({n for p in self.placeholders for n in p.names})
+
+    def render(self, values: Dict[str, Any], **root: Any) -> Dict[str, Any]:
+        """Substitute placeholders from `values`; `root` sets top-level keys (title=..., uid=...)."""
+        out = dict(self.tree)
+        copied = {(): out}
+        for p in self.placeholders:
+            node = out
+            for depth in range(len(p.path) - 1):
+                sub = p.path[:depth + 1]
+                child = copied.get(sub)
+                if child is None:
+                    child = node[p.path[depth]]
+                    child = dict(child) if isinstance(child, dict) else list(child)
+                    node[p.path[depth]] = child
+                    copied[sub] = child
+                node = child
+            node[p.path[-1]] = p.render(values)
+        for k, v in root.items():
+            if v is not None:
+                out[k] = v
+        return out
+
+_cache: Dict[str, Tuple[Tuple[int, int], CompiledTemplate]] = {}
+_cache_lock = threading.Lock()
+
+def compile_file(path: str) -> CompiledTemplate:
+    """Compiled template for a JSON file, recompiled only when its mtime/size changes."""
+    st = os.stat(path)
+    stamp = (st.st_mtime_ns, st.st_size)
+    hit = _cache.get(path)
+    if hit and hit[0] == stamp:
+        return hit[1]
+    with open(path, "r", encoding="utf-8") as f:
+        compiled = CompiledTemplate(json.load(f))
+    with _cache_lock:
+        _cache[path] = (stamp, compiled)
+    return compiled
+
+def invalidate(path: Optional[str] = None):
+    with _cache_lock:
+        if path is None:
+            _cache.clear()
+        else:
+            _cache.pop(path, None)
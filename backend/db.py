@@ -0,0 +1,65 @@
+"""
+The one SQLAlchemy engine shared by the app, reset_admin.py and the stores.
+
+DATABASE_URL selects the backend:
+    sqlite:////abs/path/srd_users.db             (default, WAL mode)
+    postgresql+psycopg://srd:secret@db/srd       (pip install "psycopg[binary]")
+"""
+import threading
+from typing import Optional
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from backend.config import Settings
+from backend.models import Base
+from backend.telemetry import instrument_engine
+
+_engine: Optional[Engine] = None
+_lock = threading.Lock()
+
+def _sqlite_pragmas(busy_timeout_ms: int):
+    def on_connect(dbapi_conn, _record):
+        cur = dbapi_conn.cursor()
+        # WAL: readers never block the writer and vice versa; NORMAL sync is durable across app crashes
+        cur.execute("PRAGMA journal_mode=WAL")
+        cur.execute("PRAGMA synchronous=NORMAL")
+        cur.execute(f"PRAGMA busy_timeout={int(busy_timeout_ms)}")
+        cur.execute("PRAGMA foreign_keys=ON")
+        cur.close()
+    return on_connect
+
+def make_engine(url: Optional[str] = None) -> Engine:
+    settings = Settings
+    url = url or settings.DATABASE_URL
+    kwargs = {"future": True, "echo": settings.DB_ECHO, "pool_size": settings.DB_POOL_SIZE,
+              "max_overflow": settings.DB_MAX_OVERFLOW, "pool_timeout": settings.DB_POOL_TIMEOUT}
+    if url.startswith("sqlite"):
+        if ":memory:" in url or url.rstrip("/") == "sqlite:":
+            raise ValueError("in-memory SQLite cannot be shared between pooled connections; use a file")
+        # Pooled connections move between request threads; SQLite's own wait covers writer contention.
+        kwargs["connect_args"] = {"check_same_thread": False, "timeout": settings.DB_BUSY_TIMEOUT}
+    else:
+        kwargs.update(pool_pre_ping=True, pool_recycle=settings.DB_POOL_RECYCLE)
+    engine = create_engine(url, **kwargs)
+    if url.startswith("sqlite"):
+        event.listen(engine, "connect", _sqlite_pragmas(settings.DB_BUSY_TIMEOUT * 1000))
+    instrument_engine(engine)
+    return engine
+
+def init_db(engine: Engine):
+    """Create missing tables and indexes (indexes too on databases created before they were declared)."""
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+
+def get_engine() -> Engine:
+    """The process-wide engine, created and initialised on first use."""
+    global _engine
+    if _engine is None:
+        with _lock:
+            if _engine is None:
+                engine = make_engine()
+                init_db(engine)
+                _engine = engine
+    return _engine
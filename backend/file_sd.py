@@ -0,0 +1,100 @@
+"""
+Prometheus file_sd target files for the host inventory (backend/hosts.py).
+
+Each group's enabled hosts go to <directory>/<group>.json. Prometheus watches
+these files (file_sd_configs in prometheus/prometheus.yml), so edits take
+effect without a config reload or restart. A shard is rendered
+deterministically and replaced atomically, and only when its bytes change.
+After an import or delete, only the groups that were touched are rendered.
+"""
+import contextlib, glob, itertools, json, logging, os, threading
+from typing import Any, Dict, Iterable, List, Optional
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from backend.models import Host
+from backend.prom_alerts import write_rules_atomic
+from backend.telemetry import FILE_SD_WRITES
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, the in-process one still applies
+    fcntl = None
+
+log = logging.getLogger(__name__)
+
+class TargetFiles:
+    """`group_label` is the target label carrying the group (Settings.ALERT_GROUP_LABEL)."""
+
+    def __init__(self, engine, directory: str, group_label: str = "group"):
+        self.engine = engine
+        self.directory = directory
+        self.group_label = group_label
+        self._lock = threading.Lock()
+
+    def path(self, group: str) -> str:
+        return os.path.join(self.directory, f"{group}.json")
+
+    def render(self, group: str, hosts: Iterable[Any]) -> str:
+        """One target group per distinct label set, targets sorted, so equal inventories give equal bytes."""
+        by_labels: Dict[str, List[str]] = {}
+        for h in hosts:
+            by_labels.setdefault(h.labels or "{}", []).append(h.address)
+        entries = [{"targets": sorted(addresses), "labels": dict(json.loads(labels), **{self.group_label: group})}
+                   for labels, addresses in sorted(by_labels.items())]
+        return json.dumps(entries, indent=1, sort_keys=True) + "\n"
+
+    @contextlib.contextmanager
+    def _locked(self):
+        # Workers in other processes may sync at the same time; whoever renders last reads the newest rows
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(self.directory, ".lock"), "a") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def sync(self, groups: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        """
+        Rewrite the shards of `groups` (all groups when None, which also removes
+        files of groups that no longer exist). Groups left without enabled
+        hosts lose their file, so Prometheus drops the targets.
+        """
+        wanted = None if groups is None else sorted(set(groups))
+        result: Dict[str, Any] = {"written": [], "unchanged": 0, "removed": []}
+        if wanted == []:
+            return result
+        stmt = (select(Host.group_name, Host.address, Host.labels).where(Host.enabled.is_(True))
+                .order_by(Host.group_name, Host.address))
+        if wanted is not None:
+            stmt = stmt.where(Host.group_name.in_(wanted))
+        with self._locked():
+            seen = set()
+            with Session(self.engine) as s:
+                rows = s.execute(stmt.execution_options(yield_per=5000))
+                for group, hosts in itertools.groupby(rows, key=lambda r: r.group_name):
+                    seen.add(group)
+                    if write_rules_atomic(self.path(group), self.render(group, hosts), prefix=".sd-"):
+                        result["written"].append(group)
+                    else:
+                        result["unchanged"] += 1
+            if wanted is None:
+                stale = [os.path.basename(p)[:-len(".json")] for p in glob.glob(os.path.join(self.directory, "*.json"))]
+            else:
+                stale = wanted
+            for group in sorted(set(stale) - seen):
+                try:
+                    os.unlink(self.path(group))
+                    result["removed"].append(group)
+                except FileNotFoundError:
+                    pass
+        FILE_SD_WRITES.labels("written").inc(len(result["written"]))
+        FILE_SD_WRITES.labels("unchanged").inc(result["unchanged"])
+        FILE_SD_WRITES.labels("removed").inc(len(result["removed"]))
+        if result["written"] or result["removed"]:
+            log.info("file_sd: wrote %s, removed %s", result["written"], result["removed"])
+        return result
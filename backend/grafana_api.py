@@ -1,37 +1,149 @@
-import json, requests
-from typing import Tuple, Any, Dict
+import threading, requests
+from typing import Tuple, Any, Dict, Optional
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from backend.backends import bounded
+from backend.config import Settings
+from backend.grafana_inventory import MISS_RELIST, GrafanaInventory
+from backend.telemetry import outbound
+
+RETRY_METHODS = frozenset({"GET", "HEAD", "PUT", "DELETE"})
 
 def _headers(token: str) -> Dict[str, str]:
     return {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
 
-def ensure_prometheus_datasource(grafana_url, token, prom_url) -> Tuple[str, str]:
-    r = requests.get(f"{grafana_url}/api/datasources", headers=_headers(token), timeout=15)
-    r.raise_for_status()
-    for ds in r.json():
-        if ds.get("type") == "prometheus" and ds.get("url") == prom_url:
-            return ds["uid"], ds["name"]
+class GrafanaClient:
+    """
+    Keep-alive Grafana HTTP API client. One pooled requests.Session per
+    Grafana URL/token, retrying 429/5xx with exponential backoff. POSTs are
+    only retried when the connection could not be made: a create that did
+    reach Grafana would come back as 409 on the retry.
+    """
+
+    def __init__(self, grafana_url: str, token: str, pool_size: int = 10, retries: int = 3,
+                 backoff: float = 0.3, timeout: float = 15):
+        self.base_url = grafana_url.rstrip("/")
+        self.timeout = timeout
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=RETRY_METHODS,  # urllib3 retries connect errors for any method
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=False, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update(_headers(token))
+
+    def request(self, method: str, path: str, json: Any = None, params: Optional[Dict[str, Any]] = None,
+                timeout: Optional[float] = None) -> requests.Response:
+        timeout = bounded(timeout or self.timeout)  # within a fan-out, no longer than its backend has left
+        return outbound("grafana", method, path, lambda: self.session.request(
+            method, f"{self.base_url}{path}", json=json, params=params, timeout=timeout))
+
+    def get(self, path: str, params: Optional[Dict[str, Any]] = None, timeout: Optional[float] = None) -> Any:
+        r = self.request("GET", path, params=params, timeout=timeout)
+        r.raise_for_status()
+        return r.json()
+
+    def post(self, path: str, body: Any, timeout: Optional[float] = None) -> Any:
+        r = self.request("POST", path, json=body, timeout=timeout)
+        r.raise_for_status()
+        return r.json()
+
+    def close(self):
+        self.session.close()
+
+_clients: Dict[Tuple[str, str], GrafanaClient] = {}
+_clients_lock = threading.Lock()
+
+def require_token(token: str):
+    """Grafana calls need a service account token; raised on first use rather than at app start."""
+    if not token:
+        raise RuntimeError("GRAFANA_TOKEN is not set. Export your service account token.")
+
+def get_client(grafana_url: str, token: str) -> GrafanaClient:
+    """Shared client for a Grafana URL/token, created on first use from Settings."""
+    require_token(token)
+    key = (grafana_url, token)
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = GrafanaClient(grafana_url, token,
+                                       pool_size=Settings.GRAFANA_POOL_SIZE,
+                                       retries=Settings.GRAFANA_RETRIES,
+                                       backoff=Settings.GRAFANA_BACKOFF,
+                                       timeout=Settings.GRAFANA_TIMEOUT)
+                _clients[key] = client
+    return client
+
+_inventories: Dict[Tuple[str, str], GrafanaInventory] = {}
+
+def get_inventory(grafana_url: str, token: str) -> GrafanaInventory:
+    """Shared datasource/folder/dashboard inventory for a Grafana URL/token, refreshed in the background."""
+    key = (grafana_url, token)
+    inventory = _inventories.get(key)
+    if inventory is None:
+        client = get_client(grafana_url, token)
+        with _clients_lock:
+            inventory = _inventories.get(key)
+            if inventory is None:
+                inventory = GrafanaInventory(lambda path, params: client.get(path, params=params),
+                                             page_size=Settings.GRAFANA_INVENTORY_PAGE_SIZE)
+                inventory.start(Settings.GRAFANA_INVENTORY_REFRESH)
+                _inventories[key] = inventory
+    return inventory
+
+def ensure_prometheus_datasource(grafana_url, token, prom_url, name="Prometheus (SRD)",
+                                 is_default=True) -> Tuple[str, str]:
+    client = get_client(grafana_url, token)
+    inventory = get_inventory(grafana_url, token)
+    ds = inventory.find_datasource("prometheus", prom_url, miss_relist=MISS_RELIST)
+    if ds:
+        return ds["uid"], ds["name"]
     payload = {
-        "name": "Prometheus (SRD)",
+        "name": name,
         "type": "prometheus",
         "access": "proxy",
         "url": prom_url,
         "basicAuth": False,
-        "isDefault": True
+        "isDefault": is_default
     }
-    r = requests.post(f"{grafana_url}/api/datasources", headers=_headers(token), data=json.dumps(payload), timeout=15)
-    r.raise_for_status()
-    return r.json()["datasource"]["uid"], r.json()["datasource"]["name"]
+    r = client.request("POST", "/api/datasources", json=payload)
+    # 409: a datasource with this name exists (created meanwhile, or by hand for another URL)
+    ds = inventory.datasource_by_name(name, miss_relist=0.0) if r.status_code == 409 else None
+    if ds is None:
+        r.raise_for_status()
+        ds = r.json()["datasource"]
+        inventory.note_datasource(ds)
+    return ds["uid"], ds["name"]
 
 def ensure_folder(grafana_url, token, title) -> str:
-    r = requests.get(f"{grafana_url}/api/folders", headers=_headers(token), timeout=15)
-    r.raise_for_status()
-    for f in r.json():
-        if f.get("title") == title:
-            return f["uid"]
-    r = requests.post(f"{grafana_url}/api/folders", headers=_headers(token),
-                      data=json.dumps({"title": title}), timeout=15)
-    r.raise_for_status()
-    return r.json()["uid"]
+    return ensure_folders(grafana_url, token, [title])[title]
+
+def ensure_folders(grafana_url, token, titles) -> Dict[str, str]:
+    """Resolve many folder titles to uids from the inventory, creating the missing ones."""
+    client = get_client(grafana_url, token)
+    inventory = get_inventory(grafana_url, token)
+    out = {}
+    for title in titles:
+        if title not in out:
+            folder = inventory.folder_by_title(title, miss_relist=MISS_RELIST)
+            if folder is None:
+                r = client.request("POST", "/api/folders", json={"title": title})
+                # 409: created meanwhile, e.g. by a run for another backend that shares this Grafana
+                folder = inventory.folder_by_title(title, miss_relist=0.0) if r.status_code == 409 else None
+                if folder is None:
+                    r.raise_for_status()
+                    folder = r.json()
+                    inventory.note_folder(folder)
+            out[title] = folder["uid"]
+    return out
 
 def upsert_dashboard(grafana_url, token, folder_uid, dashboard_json, overwrite=True) -> Dict[str, Any]:
     payload = {
@@ -40,16 +152,13 @@ def upsert_dashboard(grafana_url, token, folder_uid, dashboard_json, overwrite=T
         "overwrite": overwrite,
         "message": "Provisioned by SRD Flask app"
     }
-    r = requests.post(f"{grafana_url}/api/dashboards/db", headers=_headers(token), data=json.dumps(payload), timeout=20)
-    r.raise_for_status()
-    return r.json()
+    res = get_client(grafana_url, token).post("/api/dashboards/db", payload, timeout=20)
+    get_inventory(grafana_url, token).note_dashboard(res.get("uid"), dashboard_json.get("title"), res.get("url"),
+                                                     folder_uid, res.get("version"))
+    return res
 
 def list_dashboards(grafana_url, token) -> Any:
-    r = requests.get(f"{grafana_url}/api/search?type=dash-db", headers=_headers(token), timeout=15)
-    r.raise_for_status()
-    return r.json()
+    return get_client(grafana_url, token).get("/api/search", params={"type": "dash-db"})
 
 def list_datasources(grafana_url, token) -> Any:
-    r = requests.get(f"{grafana_url}/api/datasources", headers=_headers(token), timeout=15)
-    r.raise_for_status()
-    return r.json()
+    return get_client(grafana_url, token).get("/api/datasources")
@@ -0,0 +1,129 @@
+import asyncio, datetime, email.utils, functools, math, time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import httpx
+from backend.config import Settings
+from backend.grafana_api import RETRY_METHODS, _headers, require_token
+from backend.grafana_inventory import MISS_RELIST, GrafanaInventory
+from backend.telemetry import record_outbound
+
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+def _retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds a Retry-After header asks for (delay-seconds or HTTP-date); None when missing or unreadable."""
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            when = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=datetime.timezone.utc)
+        seconds = (when - datetime.datetime.now(datetime.timezone.utc)).total_seconds()
+    return max(0.0, seconds) if math.isfinite(seconds) else None
+
+class AsyncGrafanaClient:
+    """
+    httpx.AsyncClient counterpart of grafana_api.GrafanaClient (same pooling,
+    retry/backoff and timeout settings, POSTs only retried on connect errors)
+    for the ASGI serving mode.
+    """
+
+    def __init__(self, grafana_url: str, token: str, pool_size: int = 10, retries: int = 3,
+                 backoff: float = 0.3, timeout: float = 15):
+        require_token(token)
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.client = httpx.AsyncClient(
+            base_url=grafana_url.rstrip("/"),
+            headers=_headers(token),
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+
+    async def request(self, method: str, path: str, json: Any = None, params: Optional[Dict[str, Any]] = None,
+                      timeout: Optional[float] = None) -> httpx.Response:
+        attempt = 0
+        retry_status = RETRY_STATUS if method in RETRY_METHODS else ()
+        start = time.perf_counter()
+        while True:
+            try:
+                r = await self.client.request(method, path, json=json, params=params, timeout=timeout or self.timeout)
+                if r.status_code not in retry_status or attempt >= self.retries:
+                    record_outbound("grafana", method, path, time.perf_counter() - start, status=r.status_code)
+                    return r
+                # Capped: a server asking for an hour must not park the request that long
+                delay = min(_retry_after(r.headers.get("Retry-After")) or self.backoff * (2 ** attempt), self.timeout)
+            except httpx.TransportError as e:
+                if attempt >= self.retries or not (method in RETRY_METHODS or isinstance(e, httpx.ConnectError)):
+                    record_outbound("grafana", method, path, time.perf_counter() - start, error=e)
+                    raise
+                delay = self.backoff * (2 ** attempt)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def get(self, path: str, params: Optional[Dict[str, Any]] = None, timeout: Optional[float] = None) -> Any:
+        r = await self.request("GET", path, params=params, timeout=timeout)
+        r.raise_for_status()
+        return r.json()
+
+    async def post(self, path: str, body: Any, timeout: Optional[float] = None) -> Any:
+        r = await self.request("POST", path, json=body, timeout=timeout)
+        r.raise_for_status()
+        return r.json()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+# The inventory (grafana_api.get_inventory) lists with the sync client, so its lookups run in a thread of
+# their own bounded pool: asyncio.to_thread's default executor also authenticates every async request
+# (asgi._gate), and a slow Grafana must not hold that up.
+_pool = ThreadPoolExecutor(max_workers=max(1, Settings.ASGI_GRAFANA_THREADS), thread_name_prefix="asgi-grafana")
+
+async def in_thread(fn: Callable[..., Any], *args: Any) -> Any:
+    """Run a blocking Grafana call (inventory lookup or listing) in the Grafana thread pool."""
+    return await asyncio.get_running_loop().run_in_executor(_pool, functools.partial(fn, *args))
+
+async def ensure_prometheus_datasource(client: AsyncGrafanaClient, prom_url: str, inventory: GrafanaInventory,
+                                       name: str = "Prometheus (SRD)", is_default: bool = True) -> Tuple[str, str]:
+    ds = await in_thread(inventory.find_datasource, "prometheus", prom_url, MISS_RELIST)
+    if ds:
+        return ds["uid"], ds["name"]
+    payload = {"name": name, "type": "prometheus", "access": "proxy", "url": prom_url,
+               "basicAuth": False, "isDefault": is_default}
+    r = await client.request("POST", "/api/datasources", json=payload)
+    # 409: a datasource with this name exists (created meanwhile, or by hand for another URL)
+    ds = await in_thread(inventory.datasource_by_name, name, 0.0) if r.status_code == 409 else None
+    if ds is None:
+        r.raise_for_status()
+        ds = r.json()["datasource"]
+        inventory.note_datasource(ds)
+    return ds["uid"], ds["name"]
+
+async def ensure_folders(client: AsyncGrafanaClient, titles: List[str], inventory: GrafanaInventory) -> Dict[str, str]:
+    out = {}
+    for title in titles:
+        if title not in out:
+            folder = await in_thread(inventory.folder_by_title, title, MISS_RELIST)
+            if folder is None:
+                r = await client.request("POST", "/api/folders", json={"title": title})
+                # 409: created meanwhile, e.g. by a run for another backend that shares this Grafana
+                folder = await in_thread(inventory.folder_by_title, title, 0.0) if r.status_code == 409 else None
+                if folder is None:
+                    r.raise_for_status()
+                    folder = r.json()
+                    inventory.note_folder(folder)
+            out[title] = folder["uid"]
+    return out
+
+async def upsert_dashboard(client: AsyncGrafanaClient, folder_uid: str, dashboard_json: Dict[str, Any],
+                           inventory: GrafanaInventory, overwrite: bool = True) -> Dict[str, Any]:
+    payload = {"dashboard": dashboard_json, "folderUid": folder_uid, "overwrite": overwrite,
+               "message": "Provisioned by SRD Flask app"}
+    res = await client.post("/api/dashboards/db", payload, timeout=20)
+    inventory.note_dashboard(res.get("uid"), dashboard_json.get("title"), res.get("url"), folder_uid, res.get("version"))
+    return res
@@ -0,0 +1,230 @@
+"""
+In-memory inventory of a Grafana org's datasources, folders and dashboards.
+
+Each kind is listed once (paged through /api/folders and /api/search), then
+kept current by a background refresher and by our own writes (note_*), so
+provisioning lookups and /admin/grafana-info never re-download the lists.
+A kind is re-listed on access only after invalidate(), or on a lookup miss
+with `miss_relist` (callers pass it just before they would create the thing).
+"""
+import logging, threading, time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from backend.telemetry import CACHE_REQUESTS
+
+log = logging.getLogger(__name__)
+KINDS = ("datasources", "folders", "dashboards")
+# Lookup misses re-list the kind unless it was listed this recently (seconds)
+MISS_RELIST = 2.0
+
+class _Kind:
+    __slots__ = ("items", "loaded_at", "dirty", "lock", "sorted", "noted")
+
+    def __init__(self):
+        self.items: Dict[str, Dict[str, Any]] = {}  # uid -> object as Grafana lists it
+        self.loaded_at: Optional[float] = None
+        self.dirty = True
+        self.lock = threading.Lock()  # one listing per kind at a time
+        self.sorted: Optional[List[Dict[str, Any]]] = None  # dashboards by title, rebuilt after changes
+        self.noted: Dict[str, Tuple[float, Dict[str, Any]]] = {}  # our writes since the last listing started
+
+class GrafanaInventory:
+    """
+    `get(path, params)` performs a Grafana GET and returns the decoded JSON;
+    `page_size` is the limit used when paging folders and dashboards.
+    """
+
+    def __init__(self, get: Callable[[str, Optional[Dict[str, Any]]], Any], page_size: int = 1000):
+        self.get = get
+        self.page_size = page_size
+        self._kinds = {k: _Kind() for k in KINDS}
+        self._lock = threading.Lock()  # guards items/indexes of every kind
+        self._ds_by_url: Dict[Tuple[str, str], str] = {}
+        self._ds_by_name: Dict[str, str] = {}
+        self._folder_by_title: Dict[str, str] = {}
+        self._dash_by_url: Dict[str, str] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._hit = CACHE_REQUESTS.labels("grafana_inventory", "hit").inc
+        self._miss = CACHE_REQUESTS.labels("grafana_inventory", "miss").inc
+
+    # --- loading ---
+
+    def _paged(self, path: str, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        out: Dict[str, Dict[str, Any]] = {}
+        page = 1
+        while True:
+            batch = self.get(path, dict(params, limit=self.page_size, page=page)) or []
+            new = [x for x in batch if x.get("uid") not in out]
+            for x in new:
+                out[x.get("uid")] = x
+            # A short page is the last one; a page of nothing new means the server ignores paging
+            if len(batch) < self.page_size or not new:
+                return list(out.values())
+            page += 1
+
+    def _list(self, kind: str) -> List[Dict[str, Any]]:
+        if kind == "datasources":
+            return self.get("/api/datasources", None) or []  # not paged by Grafana
+        if kind == "folders":
+            return self._paged("/api/folders", {})
+        return self._paged("/api/search", {"type": "dash-db"})
+
+    def _load(self, kind: str):
+        # Caller holds the kind's lock; the listing runs outside self._lock so lookups keep answering
+        state = self._kinds[kind]
+        started = time.time()
+        items = {x["uid"]: x for x in self._list(kind) if x.get("uid")}
+        with self._lock:
+            # Writes made while the listing ran may be missing from it; keep them
+            items.update((uid, item) for uid, (t, item) in state.noted.items() if t >= started)
+            state.noted = {}
+            state.items, state.loaded_at, state.dirty, state.sorted = items, time.time(), False, None
+            for index, _ in self._keys(kind, {}):
+                index.clear()
+            for item in items.values():
+                self._index(kind, item)
+
+    def refresh(self, kind: Optional[str] = None, if_older_than: float = 0.0):
+        """Re-list one kind (or all) from Grafana and swap it in, unless it was listed in the last `if_older_than` s."""
+        for k in ([kind] if kind else KINDS):
+            state = self._kinds[k]
+            with state.lock:
+                if state.dirty or state.loaded_at is None or time.time() - state.loaded_at >= if_older_than:
+                    self._load(k)
+
+    def _ensure(self, kind: str):
+        state = self._kinds[kind]
+        if state.dirty:
+            with state.lock:
+                if state.dirty:  # else another thread loaded it while we waited
+                    self._load(kind)
+
+    def _keys(self, kind: str, item: Dict[str, Any]) -> List[Tuple[Dict[Any, str], Any]]:
+        """(secondary index, key) pairs for an item."""
+        if kind == "datasources":
+            return [(self._ds_by_url, (item.get("type"), item.get("url"))), (self._ds_by_name, item.get("name"))]
+        if kind == "folders":
+            return [(self._folder_by_title, item.get("title"))]
+        return [(self._dash_by_url, item.get("url"))]
+
+    def _index(self, kind: str, item: Dict[str, Any]):
+        for index, key in self._keys(kind, item):
+            if key is not None:
+                index[key] = item["uid"]
+
+    def invalidate(self, kind: Optional[str] = None):
+        """Re-list on next access (after writes we could not record, e.g. raw API calls)."""
+        for k in ([kind] if kind else KINDS):
+            self._kinds[k].dirty = True
+
+    # --- background refresh ---
+
+    def start(self, interval: float):
+        """Re-list every kind that has been loaded once every `interval` seconds (0 disables)."""
+        if interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, args=(interval,), name="grafana-inventory", daemon=True)
+        self._thread.start()
+
+    def _run(self, interval: float):
+        while True:
+            time.sleep(interval)
+            for k in KINDS:
+                if self._kinds[k].loaded_at is None:
+                    continue  # nobody has asked for it yet
+                try:
+                    self.refresh(k)
+                except Exception as e:
+                    log.warning("Grafana inventory refresh of %s failed (keeping the old list): %s", k, e)
+
+    # --- lookups ---
+
+    def _lookup(self, kind: str, index: Optional[str], key: Any,
+                miss_relist: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Item by secondary index (or uid); with `miss_relist`, a miss re-lists the kind and looks again."""
+        self._ensure(kind)
+        with self._lock:
+            uid = getattr(self, index).get(key) if index else key
+            item = self._kinds[kind].items.get(uid) if uid is not None else None
+        (self._hit if item is not None else self._miss)()
+        if item is None and miss_relist is not None:
+            self.refresh(kind, if_older_than=miss_relist)
+            return self._lookup(kind, index, key)
+        return dict(item) if item is not None else None
+
+    def find_datasource(self, ds_type: str, url: str, miss_relist: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        return self._lookup("datasources", "_ds_by_url", (ds_type, url), miss_relist)
+
+    def datasource_by_name(self, name: str, miss_relist: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        return self._lookup("datasources", "_ds_by_name", name, miss_relist)
+
+    def folder_by_title(self, title: str, miss_relist: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        return self._lookup("folders", "_folder_by_title", title, miss_relist)
+
+    def dashboard(self, uid: str) -> Optional[Dict[str, Any]]:
+        return self._lookup("dashboards", None, uid)
+
+    def dashboard_by_url(self, url: str) -> Optional[Dict[str, Any]]:
+        return self._lookup("dashboards", "_dash_by_url", url)
+
+    def datasources(self) -> List[Dict[str, Any]]:
+        self._ensure("datasources")
+        with self._lock:
+            return sorted(self._kinds["datasources"].items.values(), key=lambda d: (d.get("name") or "").lower())
+
+    def page_dashboards(self, q: Optional[str] = None, folder_uid: Optional[str] = None, offset: int = 0,
+                        limit: int = 100) -> Tuple[List[Dict[str, Any]], int]:
+        """One page of dashboards ordered by title, optionally filtered by title substring and folder; and the total."""
+        self._ensure("dashboards")
+        state = self._kinds["dashboards"]
+        with self._lock:
+            if state.sorted is None:
+                state.sorted = sorted(state.items.values(), key=lambda d: ((d.get("title") or "").lower(), d["uid"]))
+            rows = state.sorted
+        if q:
+            needle = q.strip().lower()
+            rows = [d for d in rows if needle in (d.get("title") or "").lower()]
+        if folder_uid:
+            rows = [d for d in rows if d.get("folderUid") == folder_uid]
+        return rows[offset:offset + limit], len(rows)
+
+    def status(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            return {k: {"count": len(s.items), "age_s": round(now - s.loaded_at, 1) if s.loaded_at else None,
+                        "stale": s.dirty} for k, s in self._kinds.items()}
+
+    # --- our own writes ---
+
+    def _note(self, kind: str, item: Dict[str, Any]):
+        state = self._kinds[kind]
+        if not item.get("uid"):
+            return
+        with self._lock:
+            state.noted[item["uid"]] = (time.time(), item)
+            if state.loaded_at is None:
+                return  # the first listing will include it
+            old = state.items.get(item["uid"])
+            if old is not None:
+                for index, key in self._keys(kind, old):
+                    if index.get(key) == item["uid"]:
+                        del index[key]
+            state.items[item["uid"]] = item
+            state.sorted = None
+            self._index(kind, item)
+
+    def note_datasource(self, ds: Dict[str, Any]):
+        self._note("datasources", ds)
+
+    def note_folder(self, folder: Dict[str, Any]):
+        self._note("folders", {"uid": folder.get("uid"), "title": folder.get("title"), "id": folder.get("id")})
+
+    def note_dashboard(self, uid: str, title: str, url: Optional[str], folder_uid: Optional[str],
+                       version: Optional[int] = None):
+        """Record an upsert in the shape /api/search returns it, plus the version it got (until the next listing)."""
+        with self._lock:
+            folder = self._kinds["folders"].items.get(folder_uid) if folder_uid else None
+        item = {"uid": uid, "title": title, "url": url, "type": "dash-db", "folderUid": folder_uid,
+                "folderTitle": folder.get("title") if folder else None}
+        if version is not None:
+            item["version"] = version
+        self._note("dashboards", item)
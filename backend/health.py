@@ -0,0 +1,77 @@
+import threading, time, requests
+from typing import Dict, Optional
+from backend.telemetry import BACKEND_UP, outbound
+
+class _Probe:
+    def __init__(self, name: str, url: str, headers: Optional[Dict[str, str]], interval: float, timeout: float):
+        self.name = name
+        self.url = url
+        self.headers = headers or {}
+        self.interval = interval
+        self.timeout = timeout
+        self.ok = False
+        self.checked_at = 0.0  # monotonic time of the last completed probe, 0 = never
+        self.inflight = False
+        self.wake = threading.Event()
+
+class HealthMonitor:
+    """
+    Probes each backend on its own schedule in a daemon thread and keeps the
+    last result in memory. Readers never do network I/O: a result older than
+    `ttl` schedules one extra probe (shared by every caller that notices it)
+    and the last known value is returned meanwhile.
+    """
+
+    def __init__(self, interval: float = 10.0, ttl: float = 30.0, timeout: float = 2.0):
+        self.interval = interval
+        self.ttl = ttl
+        self.timeout = timeout
+        self._probes: Dict[str, _Probe] = {}
+        self._lock = threading.Lock()
+        self._started = False
+
+    def add_probe(self, name: str, url: str, headers: Optional[Dict[str, str]] = None, interval: Optional[float] = None,
+                  timeout: Optional[float] = None):
+        self._probes[name] = _Probe(name, url, headers, interval or self.interval, timeout or self.timeout)
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        for p in self._probes.values():
+            threading.Thread(target=self._run, args=(p,), name=f"health-{p.name}", daemon=True).start()
+
+    def _check(self, p: _Probe):
+        try:
+            r = outbound(p.name, "GET", p.url, lambda: requests.get(p.url, headers=p.headers, timeout=p.timeout))
+            ok = (r.status_code == 200)
+        except Exception:
+            ok = False
+        BACKEND_UP.labels(p.name).set(1 if ok else 0)
+        with self._lock:
+            p.ok, p.checked_at, p.inflight = ok, time.monotonic(), False
+
+    def _run(self, p: _Probe):
+        while True:
+            with self._lock:
+                p.inflight = True
+            self._check(p)
+            p.wake.wait(p.interval)
+            p.wake.clear()
+
+    def status(self) -> Dict[str, bool]:
+        now = time.monotonic()
+        out = {}
+        with self._lock:
+            for p in self._probes.values():
+                if now - p.checked_at > self.ttl:
+                    if not p.inflight:
+                        # Coalesce: the first stale reader wakes the probe thread, the rest just read.
+                        p.inflight = True
+                        p.wake.set()
+                    # A result this old is not trusted as "up".
+                    out[p.name] = False if p.checked_at == 0.0 or now - p.checked_at > 2 * self.ttl else p.ok
+                else:
+                    out[p.name] = p.ok
+        return out
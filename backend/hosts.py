@@ -0,0 +1,151 @@
+import datetime, json, re
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from sqlalchemy import case, delete, func, insert, or_, select, update
+from sqlalchemy.orm import Session
+from backend.models import Host
+from backend.users import PAGE_SIZE, MAX_PAGE_SIZE, _like
+
+GROUP_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,119}$")  # also the shard file name
+LABEL_RE = re.compile(r"^[a-zA-Z_][a-zA-Z0-9_]*$")
+RESERVED_LABELS = ("job",)  # set by the scrape config; __* labels are Prometheus' own
+_COLUMNS = (Host.id, Host.address, Host.group_name, Host.labels, Host.enabled)
+
+def _row(r) -> Dict[str, Any]:
+    return {"id": r.id, "address": r.address, "group": r.group_name, "labels": json.loads(r.labels or "{}"),
+            "enabled": bool(r.enabled)}
+
+def _flag(v: Any) -> bool:
+    if isinstance(v, bool):
+        return v
+    return str(v).strip().lower() in ("1", "true", "yes", "y", "on")
+
+def _labels(raw: Any) -> Dict[str, str]:
+    """Labels from a dict, a JSON object string or "k=v;k=v" (CSV)."""
+    if raw in (None, ""):
+        return {}
+    if isinstance(raw, str):
+        raw = raw.strip()
+        if raw.startswith("{"):
+            raw = json.loads(raw)
+        else:
+            pairs = [p.partition("=") for p in raw.split(";") if p.strip()]
+            if any(not sep for _, sep, _ in pairs):
+                raise ValueError("labels must be k=v;k=v or a JSON object")
+            raw = {k.strip(): v.strip() for k, _, v in pairs}
+    if not isinstance(raw, dict):
+        raise ValueError("labels must be an object")
+    for k in raw:
+        if not LABEL_RE.match(k) or k.startswith("__") or k in RESERVED_LABELS:
+            raise ValueError(f"invalid label name {k!r}")
+    return {k: str(v) for k, v in raw.items()}
+
+def _prepare(raw: Any, default_port: int) -> Dict[str, Any]:
+    if not isinstance(raw, dict):
+        raise ValueError(raw)
+    address = str(raw.get("address") or "").strip()
+    if not address or any(c.isspace() for c in address) or "/" in address:
+        raise ValueError("address (host or host:port) is required")
+    if not re.search(r":\d+$", address):
+        address = f"{address}:{default_port}"
+    group = str(raw.get("group") or "default").strip()
+    if not GROUP_RE.match(group):
+        raise ValueError("group may only use letters, digits, '_', '.' and '-'")
+    enabled = raw.get("enabled")
+    return {"address": address, "group_name": group,
+            "labels": json.dumps(_labels(raw.get("labels")), sort_keys=True, separators=(",", ":")),
+            "enabled": True if enabled in (None, "") else _flag(enabled)}
+
+def import_hosts(engine, records: Iterable[Tuple[int, Any]], batch_size: int = 1000,
+                 default_port: int = 9182) -> Dict[str, Any]:
+    """
+    Upsert hosts by address, one transaction per batch: new ones are inserted,
+    changed ones updated, identical ones left alone. `groups` in the summary
+    lists every group whose targets changed (old and new group of a moved
+    host), i.e. the file_sd shards to rewrite.
+    """
+    summary: Dict[str, Any] = {"created": 0, "updated": 0, "unchanged": 0, "skipped": 0, "errors": []}
+    groups: Set[str] = set()
+    seen = set()
+
+    def flush(batch: List[Dict[str, Any]]):
+        if not batch:
+            return
+        with Session(engine) as s:
+            existing = {r.address: r for r in s.execute(select(*_COLUMNS).where(
+                Host.address.in_([h["address"] for h in batch])))}
+            fresh, changed = [], []
+            now = datetime.datetime.utcnow()
+            for h in batch:
+                old = existing.get(h["address"])
+                if old is None:
+                    fresh.append(dict(h, updated_at=now))
+                    groups.add(h["group_name"])
+                elif (old.group_name, old.labels, bool(old.enabled)) != (h["group_name"], h["labels"], h["enabled"]):
+                    changed.append(dict(h, id=old.id, updated_at=now))
+                    groups.update((old.group_name, h["group_name"]))
+            if fresh:
+                s.execute(insert(Host), fresh)
+            if changed:
+                s.execute(update(Host), changed)
+            s.commit()
+        summary["created"] += len(fresh)
+        summary["updated"] += len(changed)
+        summary["unchanged"] += len(batch) - len(fresh) - len(changed)
+
+    batch: List[Dict[str, Any]] = []
+    for line, raw in records:
+        try:
+            rec = _prepare(raw, default_port)
+        except ValueError as e:
+            summary["errors"].append({"line": line, "error": str(e)})
+            continue
+        if rec["address"] in seen:
+            summary["skipped"] += 1
+            continue
+        seen.add(rec["address"])
+        batch.append(rec)
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    flush(batch)
+    summary["groups"] = sorted(groups)
+    summary["ok"] = not summary["errors"]
+    return summary
+
+def delete_hosts(engine, addresses: List[str]) -> Tuple[int, List[str]]:
+    """Delete hosts by address; returns the number deleted and the groups they were in."""
+    addresses = [str(a).strip() for a in addresses if str(a).strip()]
+    if not addresses:
+        return 0, []
+    with Session(engine) as s:
+        groups = set(s.execute(select(Host.group_name).where(Host.address.in_(addresses)).distinct()).scalars())
+        deleted = s.execute(delete(Host).where(Host.address.in_(addresses))).rowcount
+        s.commit()
+    return deleted, sorted(groups)
+
+def list_hosts(engine, q: Optional[str] = None, group: Optional[str] = None, enabled: Optional[bool] = None,
+               after: Optional[str] = None, limit: int = PAGE_SIZE) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """One page of hosts ordered by address and the cursor for the next page (keyset, like list_users)."""
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    stmt = select(*_COLUMNS)
+    if q:
+        pattern = _like(q.strip())
+        stmt = stmt.where(or_(Host.address.ilike(pattern, escape="\\"), Host.labels.ilike(pattern, escape="\\")))
+    if group:
+        stmt = stmt.where(Host.group_name == group)
+    if enabled is not None:
+        stmt = stmt.where(Host.enabled == enabled)
+    if after:
+        stmt = stmt.where(Host.address > after)
+    with Session(engine) as s:
+        rows = [_row(r) for r in s.execute(stmt.order_by(Host.address).limit(limit + 1))]
+    more = len(rows) > limit
+    rows = rows[:limit]
+    return rows, (rows[-1]["address"] if more else None)
+
+def group_counts(engine) -> List[Dict[str, Any]]:
+    """Hosts per group, and how many of them are enabled (scraped)."""
+    stmt = (select(Host.group_name, func.count(), func.sum(case((Host.enabled, 1), else_=0)))
+            .group_by(Host.group_name).order_by(Host.group_name))
+    with Session(engine) as s:
+        return [{"group": g, "hosts": n, "enabled": int(e or 0)} for g, n, e in s.execute(stmt)]
@@ -0,0 +1,144 @@
+import json, math, queue, threading, time
+from typing import Any, Callable, Dict, List, Optional
+from backend.telemetry import LIVE_SUBSCRIBERS
+
+# Recorded by the rules build_rules_yaml generates, so each poll is three cheap lookups.
+LIVE_SERIES = {
+    "cpu": "instance:cpu_utilisation:rate5m",
+    "memory": "instance:memory_utilisation:percent",
+    "disk": "instance_volume:disk_utilisation:percent",
+}
+
+def _value(sample: List[Any]) -> Optional[float]:
+    # NaN/Inf (e.g. 0/0 on an empty volume) become null: bare NaN is not JSON, and NaN != NaN would resend it every poll
+    value = float(sample[1])
+    return round(value, 2) if math.isfinite(value) else None
+
+def _series_key(metric: Dict[str, str]) -> str:
+    inst = metric.get("instance", "")
+    return f"{inst} {metric['volume']}" if "volume" in metric else inst
+
+class QueueSink(queue.Queue):
+    """Bounded per-subscriber queue; put_nowait raises queue.Full when the reader falls behind."""
+
+    def overflow(self):
+        # Too far behind: drop the backlog and tell the reader to reconnect for a fresh snapshot.
+        with self.mutex:
+            self.queue.clear()
+        self.put_nowait(("close", {}))
+
+class LiveMetricsHub:
+    """
+    One background poller queries Prometheus once per interval and fans the
+    changes out to every subscriber, so upstream load does not depend on the
+    number of open browsers. Subscribers get a full snapshot first, then only
+    deltas: {"set": {metric: {series: value}}, "del": {metric: [series]}}.
+    A subscriber that stops reading is dropped (EventSource reconnects).
+    """
+
+    def __init__(self, query: Callable[[str], Dict[str, Any]], interval: float = 15.0,
+                 status: Optional[Callable[[], Dict[str, Any]]] = None, series: Optional[Dict[str, str]] = None,
+                 queue_size: int = 32):
+        self.query = query
+        self.interval = interval
+        self.status_fn = status
+        self.series = series or LIVE_SERIES
+        self.queue_size = queue_size
+        self.values: Dict[str, Dict[str, Optional[float]]] = {m: {} for m in self.series}
+        self.status: Dict[str, Any] = {}
+        self.seq = 0
+        self._polled = 0.0
+        self._subs: List[Any] = []
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def _snapshot(self) -> Dict[str, Any]:
+        return {"seq": self.seq, "values": {m: dict(v) for m, v in self.values.items()}, "status": dict(self.status)}
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return self._snapshot()
+
+    def current(self) -> Dict[str, Any]:
+        """Snapshot for pollers (no stream under WSGI): polls first when the last poll is an interval old."""
+        if time.monotonic() - self._polled >= self.interval:
+            self._poll()
+        return self.snapshot()
+
+    def subscribe(self, sink=None):
+        """Register a sink (put_nowait/overflow, see QueueSink); a QueueSink is created by default."""
+        q = sink if sink is not None else QueueSink(maxsize=self.queue_size)
+        with self._lock:
+            q.put_nowait(("snapshot", self._snapshot()))
+            self._subs.append(q)
+            LIVE_SUBSCRIBERS.set(len(self._subs))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="live-metrics", daemon=True)
+                self._thread.start()
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            if q in self._subs:
+                self._subs.remove(q)
+                LIVE_SUBSCRIBERS.set(len(self._subs))
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subs)
+
+    def _poll(self) -> Dict[str, Any]:
+        self._polled = time.monotonic()
+        fresh: Dict[str, Optional[Dict[str, Optional[float]]]] = {}
+        for metric, expr in self.series.items():
+            try:
+                result = self.query(expr)["data"]["result"]
+            except Exception:
+                fresh[metric] = None  # keep the last values on a failed poll
+                continue
+            fresh[metric] = {_series_key(s["metric"]): _value(s["value"]) for s in result}
+        status = self.status_fn() if self.status_fn else {}
+
+        delta: Dict[str, Any] = {"set": {}, "del": {}}
+        with self._lock:
+            for metric, new in fresh.items():
+                if new is None:
+                    continue
+                old = self.values[metric]
+                changed = {k: v for k, v in new.items() if k not in old or old[k] != v}
+                gone = [k for k in old if k not in new]
+                if changed:
+                    delta["set"][metric] = changed
+                if gone:
+                    delta["del"][metric] = gone
+                self.values[metric] = new
+            if status != self.status:
+                delta["status"] = status
+                self.status = status
+            if not (delta["set"] or delta["del"] or "status" in delta):
+                return None
+            self.seq += 1
+            delta["seq"] = self.seq
+            return delta
+
+    def _publish(self, event: str, data: Dict[str, Any]):
+        with self._lock:
+            subs = list(self._subs)
+        for q in subs:
+            try:
+                q.put_nowait((event, data))
+            except queue.Full:
+                self.unsubscribe(q)
+                q.overflow()
+
+    def _run(self):
+        while True:
+            started = time.monotonic()
+            if self._subs:
+                delta = self._poll()
+                if delta:
+                    self._publish("delta", delta)
+            time.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
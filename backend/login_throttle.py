@@ -0,0 +1,121 @@
+import threading, time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+class MemoryBucketStore:
+    """Token buckets in this process (one gunicorn/uvicorn worker); least recently used keys are dropped."""
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> float:
+        """Spend `cost` tokens; 0.0 if allowed, else seconds until enough tokens have refilled."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - last) * rate)
+            if tokens >= cost:
+                self._buckets[key] = (tokens - cost, now)
+                wait = 0.0
+            else:
+                self._buckets[key] = (tokens, now)
+                wait = (cost - tokens) / rate
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def reset(self, key: str):
+        with self._lock:
+            self._buckets.pop(key, None)
+
+# KEYS[1] bucket; ARGV rate, burst, cost, now. Returns the wait in ms (0 = allowed).
+_TAKE_LUA = """
+local b = redis.call('HMGET', KEYS[1], 'tokens', 'last')
+local rate, burst, cost, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+local tokens = tonumber(b[1]) or burst
+local last = tonumber(b[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - last) * rate)
+local wait = 0
+if tokens >= cost then tokens = tokens - cost else wait = math.ceil((cost - tokens) / rate * 1000) end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'last', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return wait
+"""
+
+class RedisBucketStore:
+    """Token buckets shared by every worker and host through Redis (pip install redis); one round-trip per take."""
+
+    def __init__(self, url: str, prefix: str = "srd:login:"):
+        import redis  # optional dependency, only needed for a shared store
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._take = self.client.register_script(_TAKE_LUA)
+
+    def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> float:
+        return int(self._take(keys=[self.prefix + key], args=[rate, burst, cost, time.time()])) / 1000.0
+
+    def reset(self, key: str):
+        self.client.delete(self.prefix + key)
+
+def make_store(url: str):
+    """LOGIN_THROTTLE_STORE: "memory" or a redis:// / rediss:// URL."""
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBucketStore(url)
+    if url != "memory":
+        raise ValueError(f"unsupported LOGIN_THROTTLE_STORE {url!r}")
+    return MemoryBucketStore()
+
+class LoginThrottled(Exception):
+    def __init__(self, retry_after: float, reason: str):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+class LoginThrottle:
+    """
+    Gatekeeper for /login. check() spends one token from the client IP's
+    bucket and one from the account's bucket and raises LoginThrottled before
+    any password hashing happens; verifying() bounds how many hash checks run
+    at once, so a burst cannot occupy every core.
+    """
+
+    def __init__(self, store, ip_per_min: float = 30, ip_burst: float = 10, account_per_min: float = 5,
+                 account_burst: float = 5, max_hashes: int = 4, hash_wait: float = 2.0):
+        self.store = store
+        self.ip = (ip_per_min / 60.0, ip_burst)
+        self.account = (account_per_min / 60.0, account_burst)
+        self.hash_wait = hash_wait
+        self._hashes = threading.BoundedSemaphore(max_hashes) if max_hashes > 0 else None
+
+    def check(self, ip: str, email: str):
+        wait = self.store.take(f"ip:{ip}", *self.ip)
+        if wait:
+            raise LoginThrottled(wait, "too many login attempts from this address")
+        if email:
+            wait = self.store.take(f"acct:{email.lower()}", *self.account)
+            if wait:
+                raise LoginThrottled(wait, "too many login attempts for this account")
+
+    def succeeded(self, email: str):
+        """A correct password refills the account's bucket (earlier typos don't count against the owner)."""
+        self.store.reset(f"acct:{email.lower()}")
+
+    def verifying(self) -> "_HashSlot":
+        return _HashSlot(self._hashes, self.hash_wait)
+
+class _HashSlot:
+    def __init__(self, sem: Optional[threading.BoundedSemaphore], wait: float):
+        self.sem = sem
+        self.wait = wait
+
+    def __enter__(self):
+        if self.sem is not None and not self.sem.acquire(timeout=self.wait):
+            raise LoginThrottled(1.0, "login is busy, try again shortly")
+        return self
+
+    def __exit__(self, *exc):
+        if self.sem is not None:
+            self.sem.release()
+        return False
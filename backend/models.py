@@ -1,22 +1,15 @@
-from sqlalchemy import Column, Integer, String, Boolean, create_engine
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Float, Index, Text, UniqueConstraint
 from sqlalchemy.orm import declarative_base
 from werkzeug.security import generate_password_hash, check_password_hash
-import os
+import datetime
 
+# Engine and connection settings live in backend/db.py (DATABASE_URL)
 Base = declarative_base()
 
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DB_PATH  = os.path.join(BASE_DIR, "srd_users.db")
-DATABASE_URL = f"sqlite:///{DB_PATH}"
-
-engine = create_engine(DATABASE_URL, future=True)
-
-print("SRD DB file ->", DB_PATH)  # shows in console so you can verify
-
 class User(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True)
-    email = Column(String(255), unique=True, nullable=False)
+    email = Column(String(255), unique=True, index=True, nullable=False)  # login lookup
     name = Column(String(120), nullable=False)
     password_hash = Column(String(255), nullable=False)
     role = Column(String(20), default="user")
@@ -32,3 +25,97 @@ class User(Base):
     def is_anonymous(self): return False
     def is_active_user(self): return self.is_active
     def get_id(self): return str(self.id)
+
+class ProvisionedDashboard(Base):
+    """What SRD last pushed to Grafana for a dashboard, so unchanged content can be skipped."""
+    __tablename__ = "provisioned_dashboards"
+    __table_args__ = (UniqueConstraint("grafana_url", "dashboard_key"),)
+    id = Column(Integer, primary_key=True)
+    grafana_url = Column(String(255), nullable=False)
+    dashboard_key = Column(String(255), nullable=False)  # uid, or "title:<title>" when Grafana assigns the uid
+    dashboard_uid = Column(String(64))
+    folder_uid = Column(String(64))
+    url = Column(String(255))
+    content_hash = Column(String(64), nullable=False)
+    grafana_version = Column(Integer)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+class AlertThreshold(Base):
+    """Alert threshold (%) for cpu/memory/disk: the global default, or an override for one instance or label group."""
+    __tablename__ = "alert_thresholds"
+    __table_args__ = (UniqueConstraint("metric", "scope", "match"),)
+    id = Column(Integer, primary_key=True)
+    metric = Column(String(20), nullable=False)            # cpu | memory | disk
+    scope = Column(String(20), nullable=False, default="global")  # global | instance | group
+    match = Column(String(255), nullable=False, default="")  # instance or group label value; "" for global
+    value = Column(Integer, nullable=False)
+
+class Host(Base):
+    """A windows_exporter scrape target; backend/file_sd.py writes the enabled ones to one file_sd file per group."""
+    __tablename__ = "hosts"
+    # Shards are read per group, in target order
+    __table_args__ = (Index("ix_hosts_group_address", "group_name", "address"),)
+    id = Column(Integer, primary_key=True)
+    address = Column(String(255), unique=True, index=True, nullable=False)  # host:port as Prometheus scrapes it
+    group_name = Column(String(120), nullable=False, default="default")  # value of ALERT_GROUP_LABEL
+    labels = Column(Text, nullable=False, default="{}")  # extra target labels, JSON object with sorted keys
+    enabled = Column(Boolean, nullable=False, default=True)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+class AlertEvent(Base):
+    """One firing of an alert as Alertmanager reported it (fingerprint + start), updated until it resolves."""
+    __tablename__ = "alert_events"
+    __table_args__ = (
+        UniqueConstraint("fingerprint", "starts_at"),
+        # History is read newest first, optionally narrowed to one alert or one instance
+        Index("ix_alert_events_starts", "starts_at", "id"),
+        Index("ix_alert_events_alertname_starts", "alertname", "starts_at", "id"),
+        Index("ix_alert_events_instance_starts", "instance", "starts_at", "id"),
+    )
+    id = Column(Integer, primary_key=True)
+    fingerprint = Column(String(64), nullable=False)
+    alertname = Column(String(255), nullable=False, default="")
+    instance = Column(String(255), nullable=False, default="")
+    severity = Column(String(50))
+    status = Column(String(20), nullable=False)  # firing | resolved
+    starts_at = Column(DateTime, nullable=False)
+    ends_at = Column(DateTime)  # set once resolved
+    last_seen = Column(DateTime, nullable=False)  # last notification that mentioned it
+    labels = Column(Text, nullable=False, default="{}")
+    annotations = Column(Text, nullable=False, default="{}")
+
+class DashboardSource(Base):
+    """Head of a versioned dashboard (backend/dashboard_sources.py), seeded from its file in backend/grafana."""
+    __tablename__ = "dashboard_sources"
+    id = Column(Integer, primary_key=True)
+    name = Column(String(255), unique=True, nullable=False)  # template file name, e.g. dashboard_http_api.json
+    version = Column(Integer, nullable=False)  # bumped by every edit; writers compare-and-set it
+    snapshot = Column(Text, nullable=False)  # full JSON at snapshot_version, refreshed every few edits
+    snapshot_version = Column(Integer, nullable=False)
+    file_hash = Column(String(64), nullable=False)  # sha256 of the file the source was seeded/imported from
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+    updated_by = Column(String(255))
+
+class DashboardRevision(Base):
+    """One edit of a dashboard source: the JSON Patch that made `version` and the one that undoes it."""
+    __tablename__ = "dashboard_revisions"
+    __table_args__ = (UniqueConstraint("name", "version"),)
+    id = Column(Integer, primary_key=True)
+    name = Column(String(255), nullable=False)
+    version = Column(Integer, nullable=False)
+    ops = Column(Text, nullable=False)  # JSON Patch from version - 1
+    inverse = Column(Text, nullable=False)  # JSON Patch back to version - 1
+    author = Column(String(255))
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class RulePublish(Base):
+    """A rules.yml publish ticket (backend/prom_alerts.py), shared by every worker so any of them can answer a poll."""
+    __tablename__ = "rule_publishes"
+    id = Column(Integer, primary_key=True)
+    state = Column(String(20), nullable=False, index=True)  # pending | reloading | done | partial | failed | unchanged
+    backends = Column(Text, nullable=False, default="{}")  # JSON: backend name -> {state, error}
+    error = Column(Text)
+    created = Column(Float, nullable=False)  # unix time
+    finished = Column(Float)
+    claimed_by = Column(String(32))  # the reload run that took the ticket
+    claimed_at = Column(Float)
@@ -1,55 +1,314 @@
-import os, requests, yaml
-from typing import Dict
+import contextlib, json, logging, os, tempfile, threading, time, uuid, requests, yaml
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import and_, delete, func, or_, select, update
+from sqlalchemy.orm import Session
+from backend.backends import Backend, bounded, fan_out
+from backend.models import RulePublish
+from backend.telemetry import RULE_PUBLISHES, RULE_RELOADS, outbound
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, the in-process one still applies
+    fcntl = None
+
+log = logging.getLogger(__name__)
 
 DEFAULT_THRESHOLDS = {"cpu": 80, "memory": 80, "disk": 80}
+METRICS = ("cpu", "memory", "disk")
+
+# Per-instance utilisation (%) recorded once per evaluation and shared by every alert.
+# Disk stays per volume; the threshold is still resolved per instance.
+UTILISATION_RULES = {
+    "cpu": ("instance:cpu_utilisation:rate5m",
+            '100 - (avg by (instance, {g}) (rate(windows_cpu_time_total{{mode="idle"}}[5m])) * 100)'),
+    "memory": ("instance:memory_utilisation:percent",
+               "(1 - (sum by (instance, {g}) (windows_memory_available_bytes)"
+               " / sum by (instance, {g}) (windows_memory_physical_total_bytes))) * 100"),
+    "disk": ("instance_volume:disk_utilisation:percent",
+             "100 - (sum by (instance, {g}, volume) (windows_logical_disk_free_bytes)"
+             " / sum by (instance, {g}, volume) (windows_logical_disk_size_bytes) * 100)"),
+}
+
+ALERTS = {
+    "cpu": ("HighCPU", "5m", "High CPU usage", "CPU usage"),
+    "memory": ("HighMemory", "5m", "High Memory usage", "Memory usage"),
+    "disk": ("HighDisk", "10m", "High Disk usage", "Disk utilisation"),
+}
 
-def build_rules_yaml(thresholds: Dict[str, int]) -> str:
+def _threshold_rules(metric: str, default: int, overrides: List[Dict[str, Any]], group_label: str) -> List[Dict[str, Any]]:
+    util = UTILISATION_RULES[metric][0]
+    base = f"max by (instance, {group_label}) ({util})"
+    rules = [{"record": f"srd:{metric}_threshold:global", "expr": f"vector({default})"}]
+    # Most specific wins: instance override, then group override, then the global default.
+    resolved = []
+    mine = [o for o in overrides if o["metric"] == metric]
+    for o in mine:
+        if o["scope"] == "instance":
+            rules.append({"record": f"srd:{metric}_threshold:instance", "expr": f"vector({int(o['value'])})",
+                          "labels": {"instance": o["match"]}})
+    for o in mine:
+        if o["scope"] == "group":
+            rules.append({"record": f"srd:{metric}_threshold:group", "expr": f"vector({int(o['value'])})",
+                          "labels": {group_label: o["match"]}})
+    if any(o["scope"] == "instance" for o in mine):
+        resolved.append(f"max by (instance) (srd:{metric}_threshold:instance)")
+    if any(o["scope"] == "group" for o in mine):
+        resolved.append(f"max by (instance) (0 * {base} + on ({group_label}) group_left () srd:{metric}_threshold:group)")
+    resolved.append(f"max by (instance) (0 * {base} + on () group_left () srd:{metric}_threshold:global)")
+    rules.append({"record": f"instance:{metric}_threshold:percent", "expr": " or on (instance) ".join(resolved)})
+    return rules
+
+def build_rules_yaml(thresholds: Dict[str, int], overrides: Optional[List[Dict[str, Any]]] = None,
+                     group_label: str = "group") -> str:
+    """
+    Render rules.yml. `thresholds` are the global defaults; `overrides` are
+    {metric, scope: "instance"|"group", match, value} rows. Utilisation is
+    recorded once per instance and every alert compares it against a
+    per-instance threshold series, so the rule count depends on the number of
+    overrides, never on the number of hosts.
+    """
     t = {**DEFAULT_THRESHOLDS, **thresholds}
+    overrides = overrides or []
+    recording = [{"record": name, "expr": expr.format(g=group_label)} for name, expr in UTILISATION_RULES.values()]
+    for metric in METRICS:
+        recording.extend(_threshold_rules(metric, t[metric], overrides, group_label))
+    alerts = []
+    for metric in METRICS:
+        alert, duration, summary, what = ALERTS[metric]
+        minutes = duration.rstrip("m")
+        alerts.append({
+            "alert": alert,
+            "expr": f"{UTILISATION_RULES[metric][0]} > on (instance) group_left () instance:{metric}_threshold:percent",
+            "for": duration,
+            "labels": {"severity": "warning"},
+            "annotations": {
+                "summary": summary,
+                "description": f"{what} {{{{ $value | printf \"%.0f\" }}}}% above the {metric} threshold "
+                               f"(default {t[metric]}%) for {minutes} minutes"
+            }
+        })
     doc = {
-        "groups": [{
-            "name": "srd_windows_resource_alerts",
-            "rules": [
-                {
-                    "alert": "HighCPU",
-                    "expr": f"(100 - (avg by (instance) (irate(windows_cpu_time_total{{mode=\"idle\"}}[5m])) * 100)) > {t['cpu']}",
-                    "for": "5m",
-                    "labels": {"severity": "warning"},
-                    "annotations": {
-                        "summary": "High CPU usage",
-                        "description": f"CPU usage >{t['cpu']}% for 5 minutes"
-                    }
-                },
-                {
-                    "alert": "HighMemory",
-                    "expr": f"((1 - (windows_memory_available_bytes / windows_memory_physical_total_bytes)) * 100) > {t['memory']}",
-                    "for": "5m",
-                    "labels": {"severity": "warning"},
-                    "annotations": {
-                        "summary": "High Memory usage",
-                        "description": f"Memory usage >{t['memory']}% for 5 minutes"
-                    }
-                },
-                {
-                    "alert": "HighDisk",
-                    "expr": f"(100 - (sum by (instance, volume) (windows_logical_disk_free_bytes) / sum by (instance, volume) (windows_logical_disk_size_bytes) * 100)) > {t['disk']}",
-                    "for": "10m",
-                    "labels": {"severity": "warning"},
-                    "annotations": {
-                        "summary": "High Disk usage",
-                        "description": f"Disk utilisation >{t['disk']}% for 10 minutes"
-                    }
-                }
-            ]
-        }]
+        "groups": [
+            {"name": "srd_windows_resource_recording", "rules": recording},
+            {"name": "srd_windows_resource_alerts", "rules": alerts},
+        ]
     }
     return yaml.dump(doc, sort_keys=False)
 
-def write_rules_and_reload(path: str, yaml_text: str, prom_reload_url: str, alert_reload_url: str):
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path, "w", encoding="utf-8") as f:
-        f.write(yaml_text)
-    requests.post(prom_reload_url, timeout=10)
+def write_rules_atomic(path: str, yaml_text: str, prefix: str = ".rules-") -> bool:
+    """
+    Write rules via temp file + rename so Prometheus never reads a half-written
+    file. Returns False (and writes nothing) when the content is byte-identical.
+    """
+    data = yaml_text.encode("utf-8")
     try:
-        requests.post(alert_reload_url, timeout=10)
-    except Exception:
+        with open(path, "rb") as f:
+            if f.read() == data:
+                return False
+    except FileNotFoundError:
         pass
+    folder = os.path.dirname(path) or "."
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=prefix, suffix=".tmp", dir=folder)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    return True
+
+def reload_prometheus(prom_reload_url: str, alert_reload_url: str, timeout: float = 10.0):
+    try:
+        r = outbound("prometheus", "POST", prom_reload_url,
+                     lambda: requests.post(prom_reload_url, timeout=bounded(timeout)))
+        r.raise_for_status()
+    except Exception:
+        RULE_RELOADS.labels("prometheus", "error").inc()
+        raise
+    RULE_RELOADS.labels("prometheus", "ok").inc()
+    if not alert_reload_url:
+        return
+    try:
+        r = outbound("alertmanager", "POST", alert_reload_url,
+                     lambda: requests.post(alert_reload_url, timeout=bounded(timeout)))
+        RULE_RELOADS.labels("alertmanager", "ok" if r.ok else "error").inc()
+    except Exception:
+        RULE_RELOADS.labels("alertmanager", "error").inc()
+
+def write_rules(backends: List[Backend], yaml_text: str) -> Tuple[List[Backend], Dict[str, str]]:
+    """Write the rules once per distinct rules_path -> (backends whose file changed, name -> write error)."""
+    by_path: Dict[str, List[Backend]] = {}
+    for b in backends:
+        by_path.setdefault(b.rules_path, []).append(b)
+    changed: List[Backend] = []
+    errors: Dict[str, str] = {}
+    for path, group in by_path.items():
+        try:
+            if write_rules_atomic(path, yaml_text):
+                changed.extend(group)
+        except OSError as e:
+            errors.update({b.name: f"writing {path} failed: {e}" for b in group})
+    return changed, errors
+
+def reload_backends(backends: List[Backend]) -> Dict[str, Dict[str, Any]]:
+    """Reload every backend's Prometheus at once (see backends.fan_out); a shared Alertmanager is reloaded once."""
+    alertmanager, seen = {}, set()
+    for b in backends:
+        alertmanager[b.name] = "" if b.alertmanager_reload_url in seen else b.alertmanager_reload_url
+        seen.add(b.alertmanager_reload_url)
+    return fan_out(backends, lambda b: reload_prometheus(b.prom_reload_url, alertmanager[b.name], timeout=b.timeout),
+                   "reload")
+
+def write_rules_and_reload(backends: List[Backend], yaml_text: str) -> Dict[str, Dict[str, Any]]:
+    """Publish synchronously; name -> {state: done | unchanged | failed, error}."""
+    changed, errors = write_rules(backends, yaml_text)
+    out = {b.name: {"state": "unchanged", "error": None} for b in backends}
+    out.update({name: {"state": "failed", "error": e} for name, e in errors.items()})
+    for name, r in reload_backends(changed).items():
+        out[name] = {"state": "done", "error": None} if r["ok"] else {"state": "failed", "error": r["error"]}
+    return out
+
+def _ticket_state(per_backend: Dict[str, Dict[str, Any]]) -> Tuple[str, Optional[str]]:
+    failed = {name: b["error"] for name, b in per_backend.items() if b["state"] == "failed"}
+    if not failed:
+        return ("unchanged" if all(b["state"] == "unchanged" for b in per_backend.values()) else "done"), None
+    return ("failed" if len(failed) == len(per_backend) else "partial"), \
+        "; ".join(f"{name}: {e}" for name, e in failed.items())
+
+class RulePublisher:
+    """
+    Publishes rule files to every backend without blocking the request thread.
+
+    publish() writes the file atomically (once per distinct path, skipped if
+    unchanged) and returns a ticket right away. Tickets are rows of
+    rule_publishes, so ids are unique across workers and any worker can
+    answer a poll (ticket()); the last `keep` are retained. Reloads run on a
+    background thread `window` seconds after a publish. The thread claims
+    every pending ticket, whichever worker created it, so changes published
+    within the window by any worker are folded into one reload, sent to all
+    backends at once. "partial" means some backends failed.
+
+    Callers hold locked() around "save thresholds, render, publish" so the
+    last rules file written always reflects the newest stored thresholds.
+    """
+
+    STALE = 300.0  # a ticket left "reloading" this long (its worker died) is claimed again
+
+    def __init__(self, engine, backends: List[Backend], window: float = 2.0, keep: int = 500,
+                 lock_path: Optional[str] = None):
+        self.engine = engine
+        self.backends = backends
+        self.window = window
+        self.keep = keep
+        self.lock_path = lock_path
+        self._lock = threading.Lock()
+        self._due: Optional[float] = None
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    @contextlib.contextmanager
+    def locked(self):
+        with self._lock:
+            if fcntl is None or not self.lock_path:
+                yield
+                return
+            os.makedirs(os.path.dirname(self.lock_path) or ".", exist_ok=True)
+            with open(self.lock_path, "a") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def publish(self, yaml_text: str) -> Dict[str, Any]:
+        changed, errors = write_rules(self.backends, yaml_text)
+        per = {b.name: {"state": "unchanged", "error": None} for b in self.backends}
+        per.update({name: {"state": "failed", "error": e} for name, e in errors.items()})
+        for b in changed:
+            per[b.name]["state"] = "pending"
+        row = RulePublish(state="pending", backends=json.dumps(per), created=time.time())
+        if not changed:
+            row.state, row.error = _ticket_state(per)
+            row.finished = row.created
+        with Session(self.engine) as s:
+            s.add(row)
+            s.commit()
+            ticket = _ticket(row)
+        if not changed:
+            RULE_PUBLISHES.labels(ticket["state"]).inc()
+            return ticket
+        with self._cond:
+            if self._due is None:
+                self._due = time.monotonic() + self.window
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="rule-reloader", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return ticket
+
+    def ticket(self, ticket_id: int) -> Optional[Dict[str, Any]]:
+        with Session(self.engine) as s:
+            row = s.get(RulePublish, ticket_id)
+            return _ticket(row) if row else None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._due is None:
+                    self._cond.wait()
+                while time.monotonic() < self._due:
+                    self._cond.wait(self._due - time.monotonic())
+                self._due = None
+            try:
+                self._reload_pending()
+            except Exception:
+                log.exception("Rule reload failed")
+
+    def _reload_pending(self):
+        token, now = uuid.uuid4().hex, time.time()
+        names = set()
+        with Session(self.engine) as s:
+            # One UPDATE claims the pending tickets of every worker; another worker's run finds none left
+            s.execute(update(RulePublish)
+                      .where(or_(RulePublish.state == "pending",
+                                 and_(RulePublish.state == "reloading", RulePublish.claimed_at < now - self.STALE)))
+                      .values(state="reloading", claimed_by=token, claimed_at=now))
+            rows = s.execute(select(RulePublish).where(RulePublish.claimed_by == token)).scalars().all()
+            for row in rows:
+                per = json.loads(row.backends)
+                for name, b in per.items():
+                    if b["state"] in ("pending", "reloading"):
+                        b["state"] = "reloading"
+                        names.add(name)
+                row.backends = json.dumps(per)
+            s.commit()
+        if not rows:
+            return
+        results = reload_backends([b for b in self.backends if b.name in names])
+        with Session(self.engine) as s:
+            finished = time.time()
+            for row in s.execute(select(RulePublish).where(RulePublish.claimed_by == token,
+                                                           RulePublish.state == "reloading")).scalars():
+                per = json.loads(row.backends)
+                for name, b in per.items():
+                    if b["state"] == "reloading":
+                        r = results.get(name) or {"ok": False, "error": f"{name} is not configured in this worker"}
+                        b.update(state="done" if r["ok"] else "failed", error=r.get("error"))
+                row.backends = json.dumps(per)
+                row.state, row.error = _ticket_state(per)
+                row.finished = finished
+                RULE_PUBLISHES.labels(row.state).inc()
+            newest = s.execute(select(func.max(RulePublish.id))).scalar() or 0
+            s.execute(delete(RulePublish).where(RulePublish.id <= newest - self.keep, RulePublish.finished.isnot(None)))
+            s.commit()
+
+def _ticket(row: RulePublish) -> Dict[str, Any]:
+    return {"id": row.id, "state": row.state, "created": row.created, "finished": row.finished, "error": row.error,
+            "backends": json.loads(row.backends)}
@@ -0,0 +1,111 @@
+import math, time, requests
+from typing import Any, Dict, Optional
+from requests.adapters import HTTPAdapter
+from backend.cache import TTLCache
+from backend.telemetry import outbound
+
+MAX_POINTS = 11000  # Prometheus' own per-series limit for query_range
+
+class PromQueryError(Exception):
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+def dashboard_exprs(tree: Any) -> Dict[str, str]:
+    """refId -> expr for every Prometheus target in a dashboard tree."""
+    out = {}
+    def walk(obj):
+        if isinstance(obj, dict):
+            for t in obj.get("targets") or []:
+                if isinstance(t, dict) and t.get("expr"):
+                    out[t.get("refId") or t["expr"]] = t["expr"]
+            for v in obj.values():
+                if isinstance(v, (dict, list)):
+                    walk(v)
+        elif isinstance(obj, list):
+            for v in obj:
+                walk(v)
+    walk(tree)
+    return out
+
+class PromQueryProxy:
+    """
+    Cached, single-flighted proxy for a fixed set of PromQL expressions.
+
+    Evaluation times are aligned down to the step (instant queries: the scrape
+    interval), so concurrent viewers of the same panel share one cache key and
+    one upstream query per step. Entries live for one scrape interval.
+    """
+
+    def __init__(self, prom_url: str, exprs: Dict[str, str], scrape_interval: float = 15.0,
+                 max_entries: int = 512, timeout: float = 10.0, name: str = "promql"):
+        self.prom_url = prom_url.rstrip("/")
+        self.scrape_interval = scrape_interval
+        self.timeout = timeout
+        self.cache = TTLCache(max_entries=max_entries, ttl=scrape_interval, name=name)
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_maxsize=10))
+        self.session.mount("https://", HTTPAdapter(pool_maxsize=10))
+        self._tree = None
+        self.set_exprs(exprs)
+
+    def set_exprs(self, exprs: Dict[str, str]):
+        self.exprs = dict(exprs)
+        self._allowed = set(self.exprs.values())
+
+    def use_dashboard(self, tree: Any):
+        """Allow exactly the dashboard's queries; a no-op while the same tree is passed."""
+        if tree is not self._tree:
+            self.set_exprs(dashboard_exprs(tree))
+            self._tree = tree
+
+    def resolve(self, expr: Optional[str] = None, ref: Optional[str] = None) -> str:
+        if ref:
+            if ref not in self.exprs:
+                raise PromQueryError(f"unknown ref {ref!r}")
+            return self.exprs[ref]
+        if not expr or expr not in self._allowed:
+            raise PromQueryError("expression is not one of the dashboard's known queries")
+        return expr
+
+    def _fetch(self, path: str, params: Dict[str, Any], timeout: Optional[float] = None) -> Any:
+        timeout = timeout or self.timeout
+        try:
+            r = outbound("prometheus", "GET", path,
+                         lambda: self.session.get(f"{self.prom_url}{path}", params=params, timeout=timeout))
+        except requests.RequestException as e:
+            raise PromQueryError(f"Prometheus unreachable: {e}", 502)
+        try:
+            body = r.json()
+        except ValueError:
+            raise PromQueryError(f"Prometheus returned {r.status_code}", 502)
+        if r.status_code != 200 or body.get("status") != "success":
+            raise PromQueryError(body.get("error") or f"Prometheus returned {r.status_code}",
+                                 400 if r.status_code in (400, 422) else 502)
+        return body["data"]
+
+    def query(self, expr: str, at: Optional[float] = None) -> Dict[str, Any]:
+        step = self.scrape_interval
+        t = math.floor((time.time() if at is None else at) / step) * step
+        data = self.cache.get_or_load(("query", expr, t),
+                                      lambda: self._fetch("/api/v1/query", {"query": expr, "time": t}))
+        return {"time": t, "data": data}
+
+    def query_range(self, expr: str, start: float, end: float, step: float) -> Dict[str, Any]:
+        step = max(float(step), self.scrape_interval)
+        start = math.floor(start / step) * step
+        end = math.floor(end / step) * step
+        if end < start:
+            raise PromQueryError("end must not be before start")
+        if (end - start) / step > MAX_POINTS:
+            raise PromQueryError(f"too many points; raise step (max {MAX_POINTS} per series)")
+        key = ("range", expr, start, end, step)
+        data = self.cache.get_or_load(key, lambda: self._fetch(
+            "/api/v1/query_range", {"query": expr, "start": start, "end": end, "step": step}))
+        return {"start": start, "end": end, "step": step, "data": data}
+
+    def fetch_range(self, expr: str, start: float, end: float, step: float, timeout: Optional[float] = None) -> Any:
+        """Uncached query_range for any expression (bulk reads such as backtests; callers vet `expr`)."""
+        if (end - start) / step > MAX_POINTS:
+            raise PromQueryError(f"too many points; raise step (max {MAX_POINTS} per series)")
+        return self._fetch("/api/v1/query_range", {"query": expr, "start": start, "end": end, "step": step}, timeout)
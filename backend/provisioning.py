@@ -0,0 +1,272 @@
+import contextvars, hashlib, json, os, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from backend import grafana_api
+from backend.backends import check_deadline
+from backend.dashboard_templates import CompiledTemplate, compile_file
+from backend.grafana_inventory import GrafanaInventory
+from backend.models import ProvisionedDashboard
+from backend.telemetry import DASHBOARD_PUSHES, PROVISION_DURATION
+
+GRAFANA_DIR = os.path.join(os.path.dirname(__file__), "grafana")
+DEFAULT_TEMPLATE = "dashboard_http_api.json"
+
+def template_path(name: str) -> str:
+    # Templates live in backend/grafana; only bare file names are accepted.
+    if not isinstance(name, str) or os.path.basename(name) != name or not name.endswith(".json"):
+        raise ValueError(f"invalid dashboard template name: {name!r}")
+    return os.path.join(GRAFANA_DIR, name)
+
+def load_template(name: str = DEFAULT_TEMPLATE) -> CompiledTemplate:
+    """The template as its file reads; the app renders the versioned copy instead (backend/dashboard_sources.py)."""
+    return compile_file(template_path(name))
+
+def render_dashboard(template: CompiledTemplate, prom_uid: str, title: str = None, uid: str = None,
+                     values: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Fill "__PROM__" (datasource uid), "__TITLE__" and any extra `values` placeholders."""
+    vals = dict(values or {}, PROM=prom_uid)
+    if title:
+        vals.setdefault("TITLE", title)
+    return template.render(vals, title=title, uid=uid)
+
+def datasource_name(suffix: Optional[str] = None) -> str:
+    return f"Prometheus (SRD {suffix})" if suffix else "Prometheus (SRD)"
+
+def with_suffix(dash: Dict[str, Any], suffix: Optional[str]) -> Dict[str, Any]:
+    """
+    One backend's copy of a dashboard when several backends share a Grafana:
+    the uid gets "-<suffix>" (within Grafana's 40 characters) and the title " (<suffix>)".
+    """
+    if not suffix:
+        return dash
+    out = dict(dash, title=f"{dash.get('title')} ({suffix})")
+    if dash.get("uid"):
+        out["uid"] = f"{dash['uid'][:39 - len(suffix)]}-{suffix}"
+    return out
+
+def dashboard_key(dash: Dict[str, Any]) -> str:
+    return dash.get("uid") or f"title:{dash.get('title')}"
+
+def dashboard_hash(dash: Dict[str, Any], folder_uid: str) -> str:
+    """Canonical content hash of a rendered dashboard in its target folder."""
+    canonical = json.dumps({"folderUid": folder_uid, "dashboard": dash}, sort_keys=True,
+                           separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+class DashboardHashStore:
+    """
+    Remembers the hash and Grafana version of every dashboard we pushed to a
+    Grafana instance (provisioned_dashboards table). Rows are loaded once and
+    kept in memory, so a changed dashboard costs no DB query; a match is
+    confirmed against its row (one unique-key lookup), because another worker
+    may have pushed other content since.
+    """
+
+    def __init__(self, engine, grafana_url: str):
+        self.engine = engine
+        self.grafana_url = grafana_url
+        self._rows: Optional[Dict[str, Dict[str, Any]]] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _entry(r: ProvisionedDashboard) -> Dict[str, Any]:
+        return {"uid": r.dashboard_uid, "folder_uid": r.folder_uid, "url": r.url, "hash": r.content_hash,
+                "version": r.grafana_version}
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if self._rows is None:
+            with Session(self.engine) as s:
+                rows = s.execute(select(ProvisionedDashboard)
+                                 .where(ProvisionedDashboard.grafana_url == self.grafana_url)).scalars()
+                self._rows = {r.dashboard_key: self._entry(r) for r in rows}
+        return self._rows
+
+    def get(self, key: str, content_hash: str) -> Optional[Dict[str, Any]]:
+        """The stored entry if `key` was last pushed (by any worker) with exactly this content, else None."""
+        with self._lock:
+            entry = self._load().get(key)
+        if not entry or entry["hash"] != content_hash:
+            return None
+        with Session(self.engine) as s:
+            row = s.execute(select(ProvisionedDashboard)
+                            .where(ProvisionedDashboard.grafana_url == self.grafana_url,
+                                   ProvisionedDashboard.dashboard_key == key)).scalar_one_or_none()
+            entry = self._entry(row) if row is not None else None
+        with self._lock:
+            if entry is None:
+                self._rows.pop(key, None)
+            else:
+                self._rows[key] = entry
+        return entry if entry and entry["hash"] == content_hash else None
+
+    def record(self, entries: List[Dict[str, Any]]):
+        """Persist pushed dashboards in one transaction: [{key, uid, folder_uid, url, hash, version}]."""
+        if not entries:
+            return
+        check_deadline()  # a fanned-out provision already reported as timed out records nothing
+        with self._lock:
+            rows = self._load()
+            with Session(self.engine) as s:
+                existing = {r.dashboard_key: r for r in s.execute(
+                    select(ProvisionedDashboard).where(ProvisionedDashboard.grafana_url == self.grafana_url,
+                                                       ProvisionedDashboard.dashboard_key.in_([e["key"] for e in entries]))
+                ).scalars()}
+                for e in entries:
+                    row = existing.get(e["key"])
+                    if row is None:
+                        row = ProvisionedDashboard(grafana_url=self.grafana_url, dashboard_key=e["key"])
+                        s.add(row)
+                    row.dashboard_uid, row.folder_uid, row.url = e.get("uid"), e.get("folder_uid"), e.get("url")
+                    row.content_hash, row.grafana_version = e["hash"], e.get("version")
+                s.commit()
+            for e in entries:
+                rows[e["key"]] = {k: e.get(k) for k in ("uid", "folder_uid", "url", "hash", "version")}
+
+def _still_there(prev: Dict[str, Any], folder_uid: str, inventory: GrafanaInventory) -> bool:
+    """Whether the inventory still has the dashboard we pushed, in its folder and (when known) at our version."""
+    live = inventory.dashboard(prev["uid"]) if prev["uid"] else None
+    if live is None or live.get("folderUid") != folder_uid:
+        return False  # deleted or moved in Grafana
+    # Listings carry no version; only writes noted since the last one do (e.g. the /admin/provision API)
+    return live.get("version") is None or live["version"] == prev["version"]
+
+def check_unchanged(dash: Dict[str, Any], folder_uid: str, store: Optional[DashboardHashStore] = None,
+                    force: bool = False, inventory: Optional[GrafanaInventory] = None):
+    """
+    (skip_result_or_None, key, content_hash) for a rendered dashboard;
+    skip_result is set when the store says Grafana already has this content
+    and, given an inventory, Grafana still lists that dashboard as we left it.
+    """
+    key = dashboard_key(dash)
+    content_hash = dashboard_hash(dash, folder_uid)
+    if store is not None and not force:
+        prev = store.get(key, content_hash)
+        if prev and (inventory is None or _still_there(prev, folder_uid, inventory)):
+            return {"status": "unchanged", "skipped": True, "uid": prev["uid"], "url": prev["url"],
+                    "version": prev["version"]}, key, content_hash
+    return None, key, content_hash
+
+def pushed_entry(key: str, content_hash: str, folder_uid: str, res: Dict[str, Any]) -> Dict[str, Any]:
+    return {"key": key, "uid": res.get("uid"), "folder_uid": folder_uid, "url": res.get("url"),
+            "hash": content_hash, "version": res.get("version")}
+
+def push_dashboard(grafana_url: str, token: str, folder_uid: str, dash: Dict[str, Any],
+                   store: Optional[DashboardHashStore] = None, force: bool = False):
+    """
+    Upsert one rendered dashboard unless the store says Grafana already has
+    exactly this content. Returns (result, store_entry_or_None); result
+    mirrors Grafana's response plus "skipped".
+    """
+    inventory = grafana_api.get_inventory(grafana_url, token) if store is not None and not force else None
+    skip, key, content_hash = check_unchanged(dash, folder_uid, store, force, inventory)
+    if skip:
+        DASHBOARD_PUSHES.labels("skipped").inc()
+        return skip, None
+    try:
+        res = grafana_api.upsert_dashboard(grafana_url, token, folder_uid, dash, overwrite=True)
+    except Exception:
+        DASHBOARD_PUSHES.labels("error").inc()
+        raise
+    DASHBOARD_PUSHES.labels("pushed").inc()
+    return dict(res, skipped=False), pushed_entry(key, content_hash, folder_uid, res)
+
+def manifest_folders(manifest: Dict[str, Any]) -> List[Dict[str, Any]]:
+    folders = manifest.get("folders") or []
+    if not folders:
+        raise ValueError("manifest has no folders")
+    if any(not isinstance(f, dict) or not f.get("title") for f in folders):
+        raise ValueError("every folder needs a title")
+    return folders
+
+def build_jobs(folders: List[Dict[str, Any]], folder_uids: Dict[str, str], prom_uid: str,
+               suffix: Optional[str] = None,
+               templates: Callable[[str], CompiledTemplate] = load_template) -> List[Dict[str, Any]]:
+    """
+    Render every manifest item (see with_suffix); items that fail to render carry an "error" instead of a dashboard.
+    `templates(name)` looks up a named template, once per name.
+    """
+    jobs: List[Dict[str, Any]] = []
+    loaded: Dict[str, CompiledTemplate] = {}
+    for folder in folders:
+        for item in folder.get("dashboards") or []:
+            job = {"folder": folder["title"], "folder_uid": folder_uids[folder["title"]],
+                   "title": item.get("title"), "uid": item.get("uid")}
+            try:
+                if "dashboard" in item:
+                    template = CompiledTemplate(item["dashboard"])
+                else:
+                    name = item.get("template") or DEFAULT_TEMPLATE
+                    template = loaded.get(name) if isinstance(name, str) else None
+                    if template is None:
+                        template = loaded[name] = templates(name)
+                job["dashboard"] = with_suffix(render_dashboard(template, prom_uid, item.get("title"), item.get("uid"),
+                                                                item.get("values")), suffix)
+                job["title"] = job["dashboard"].get("title")
+            except Exception as e:
+                job["error"] = str(e)
+            jobs.append(job)
+    return jobs
+
+def summarize(items: List[Dict[str, Any]], prom_uid: str, folder_uids: Dict[str, str], started: float) -> Dict[str, Any]:
+    return {
+        "ok": all(i["ok"] for i in items),
+        "datasource_uid": prom_uid,
+        "folders": folder_uids,
+        "count": len(items),
+        "failed": sum(1 for i in items if not i["ok"]),
+        "skipped": sum(1 for i in items if i.get("skipped")),
+        "items": items,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
+
+def provision_bulk(grafana_url: str, token: str, prom_url: str, manifest: Dict[str, Any],
+                   max_workers: int = 8, store: Optional[DashboardHashStore] = None,
+                   force: bool = False, suffix: Optional[str] = None,
+                   templates: Callable[[str], CompiledTemplate] = load_template) -> Dict[str, Any]:
+    """
+    Provision many folders x dashboards in one go.
+
+    manifest = {"folders": [{"title": "Team A", "dashboards": [
+        {"template": "dashboard_http_api.json", "title": "...", "uid": "..."},
+        {"template": "...", "values": {"INSTANCE": "host01"}},  # fills "__INSTANCE__"
+        {"dashboard": {...inline dashboard JSON...}},
+    ]}]}
+
+    The datasource and all folders are resolved once, then the dashboards are
+    upserted concurrently on a bounded thread pool. Dashboards whose rendered
+    content matches what `store` recorded are skipped unless `force`.
+    Per-item failures are reported in the result instead of aborting the batch.
+    `suffix` tells this backend's datasource and dashboards apart in a Grafana
+    that other backends share. `templates(name)` supplies the named templates.
+    """
+    started = time.perf_counter()
+    folders = manifest_folders(manifest)
+    prom_uid, _ = grafana_api.ensure_prometheus_datasource(grafana_url, token, prom_url, name=datasource_name(suffix),
+                                                           is_default=not suffix)
+    folder_uids = grafana_api.ensure_folders(grafana_url, token, [f["title"] for f in folders])
+    jobs = build_jobs(folders, folder_uids, prom_uid, suffix, templates)
+
+    def run(job):
+        result = {"folder": job["folder"], "title": job["title"], "uid": job["uid"]}
+        if "error" in job:
+            return dict(result, ok=False, error=job["error"]), None
+        t = time.perf_counter()
+        entry = None
+        try:
+            res, entry = push_dashboard(grafana_url, token, job["folder_uid"], job["dashboard"], store, force)
+            result.update(ok=True, skipped=res["skipped"], uid=res.get("uid"), url=res.get("url"),
+                          version=res.get("version"))
+        except Exception as e:
+            result.update(ok=False, error=str(e))
+        result["elapsed_ms"] = round((time.perf_counter() - t) * 1000, 2)
+        return result, entry
+
+    context = contextvars.copy_context()  # carries the fan-out deadline (backends.bounded) into the pool
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="provision") as pool:
+        done = list(pool.map(lambda job: context.copy().run(run, job), jobs))
+    if store is not None:
+        store.record([e for _, e in done if e])
+    PROVISION_DURATION.labels("bulk").observe(time.perf_counter() - started)
+    return summarize([r for r, _ in done], prom_uid, folder_uids, started)
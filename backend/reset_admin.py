@@ -1,17 +1,14 @@
 # reset_admin.py
-import os
-from sqlalchemy import create_engine, select
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from backend.models import Base, User   # models.py is in the same folder
-
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DB_PATH  = os.path.join(BASE_DIR, "srd_users.db")
-engine   = create_engine(f"sqlite:///{DB_PATH}", future=True)
-
-Base.metadata.create_all(engine)
+from backend.models import User   # models.py is in the same folder
+from backend.config import Settings
+from backend.db import get_engine
+from backend.user_cache import signal_user_change
 
 def reset_or_create_admin():
-
+    engine = get_engine()  # same DATABASE_URL as the app
+    print("Database:", engine.url.render_as_string(hide_password=True))
 
     with Session(engine) as s:
         u = s.execute(select(User).where(User.email=="admin@srd.local")).scalar_one_or_none()
@@ -25,6 +22,8 @@ def reset_or_create_admin():
             s.add(u)
             s.commit()
             print("✅ Created admin@srd.local with password ChangeMe123!")
+    # Running app workers drop their cached users, so the old password/session state is not served from memory
+    signal_user_change(Settings.USER_CACHE_MARKER)
 
 if __name__ == "__main__":
     reset_or_create_admin()
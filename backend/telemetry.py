@@ -0,0 +1,110 @@
+"""
+SRD's own Prometheus metrics, served at /metrics.
+
+With several worker processes (gunicorn -w N, uvicorn --workers N) set
+PROMETHEUS_MULTIPROC_DIR to an empty directory shared by the workers so a
+scrape sees all of them, not just the worker that answered.
+"""
+import os, time
+from typing import Any, Callable, Optional
+from prometheus_client import (CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, REGISTRY,
+                               generate_latest)
+
+# Latencies from sub-millisecond cache/DB hits up to slow Grafana calls
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+HTTP_DURATION = Histogram("srd_http_request_duration_seconds", "Time to produce a response, per route.",
+                          ["method", "endpoint"], buckets=BUCKETS)
+HTTP_REQUESTS = Counter("srd_http_requests_total", "Responses by route and status.", ["method", "endpoint", "status"])
+OUTBOUND_DURATION = Histogram("srd_outbound_request_duration_seconds",
+                              "Calls to Grafana/Prometheus/Alertmanager, retries included.",
+                              ["target", "method", "endpoint"], buckets=BUCKETS)
+OUTBOUND_ERRORS = Counter("srd_outbound_errors_total", "Failed outbound calls (HTTP status >= 400 or exception).",
+                          ["target", "endpoint", "reason"])
+DB_DURATION = Histogram("srd_db_query_duration_seconds", "SQL statement execution time.", ["operation"],
+                        buckets=BUCKETS)
+DB_ERRORS = Counter("srd_db_errors_total", "SQL statements that raised.", ["operation"])
+CACHE_REQUESTS = Counter("srd_cache_requests_total", "Cache lookups by result.", ["cache", "result"])
+LOGIN_ATTEMPTS = Counter("srd_login_attempts_total", "POST /login outcomes.", ["result"])
+LOGIN_HASH_DURATION = Histogram("srd_login_hash_seconds", "Password hash verification time.", buckets=BUCKETS)
+RULE_PUBLISHES = Counter("srd_rules_publish_total", "rules.yml publishes by outcome.", ["state"])
+RULE_RELOADS = Counter("srd_rules_reloads_total", "Prometheus/Alertmanager reloads by outcome.", ["target", "result"])
+PROVISION_DURATION = Histogram("srd_provision_duration_seconds", "Provisioning runs.", ["kind"], buckets=BUCKETS)
+DASHBOARD_PUSHES = Counter("srd_dashboard_pushes_total", "Dashboards sent to Grafana, skipped or failed.", ["result"])
+FILE_SD_WRITES = Counter("srd_file_sd_writes_total", "file_sd target files written, unchanged or removed.",
+                         ["result"])
+ALERT_EVENTS = Counter("srd_alert_webhook_alerts_total",
+                       "Alerts from Alertmanager notifications: received, merged in the buffer, written or rejected.",
+                       ["result"])
+ALERT_BUFFER = Gauge("srd_alert_webhook_pending", "Alert events buffered for the next history write.",
+                     multiprocess_mode="livesum")
+BACKEND_UP = Gauge("srd_backend_up", "Last health probe result (1 = up).", ["backend"], multiprocess_mode="max")
+FANOUT_CALLS = Counter("srd_backend_fanout_total", "Per-backend results of fanned-out operations.",
+                       ["operation", "backend", "result"])
+DASHBOARD_EDITS = Counter("srd_dashboard_edits_total", "Dashboard source edits by outcome.", ["result"])
+LIVE_SUBSCRIBERS = Gauge("srd_live_subscribers", "Open /api/metrics/stream connections.", multiprocess_mode="livesum")
+
+# Words that are part of an API route; any other path segment is an id/uid and is folded into ":id"
+_STATIC_SEGMENTS = {"api", "v1", "query", "query_range", "series", "labels", "label", "values", "dashboards", "db",
+                    "uid", "folders", "datasources", "search", "health", "-", "reload", "alerts", "status",
+                    "buildinfo", "targets", "rules", "name", "org", "user", "proxy", "versions", "permissions"}
+
+def endpoint_label(path: str) -> str:
+    """Bounded label for an outbound URL path: /api/dashboards/uid/abc123 -> /api/dashboards/uid/:id."""
+    path = path.split("?", 1)[0]
+    if "://" in path:
+        path = "/" + path.split("://", 1)[1].partition("/")[2]
+    parts = [p if p in _STATIC_SEGMENTS else ":id" for p in path.strip("/").split("/") if p]
+    return "/" + "/".join(parts)
+
+def record_outbound(target: str, method: str, path: str, seconds: float, status: Optional[int] = None,
+                    error: Optional[BaseException] = None):
+    endpoint = endpoint_label(path)
+    OUTBOUND_DURATION.labels(target, method, endpoint).observe(seconds)
+    if error is not None:
+        OUTBOUND_ERRORS.labels(target, endpoint, type(error).__name__).inc()
+    elif status is not None and status >= 400:
+        OUTBOUND_ERRORS.labels(target, endpoint, str(status)).inc()
+
+def outbound(target: str, method: str, path: str, call: Callable[[], Any]) -> Any:
+    """Run `call()` (a requests call returning a Response) and record its latency and outcome."""
+    start = time.perf_counter()
+    try:
+        r = call()
+    except Exception as e:
+        record_outbound(target, method, path, time.perf_counter() - start, error=e)
+        raise
+    record_outbound(target, method, path, time.perf_counter() - start, status=r.status_code)
+    return r
+
+def instrument_engine(engine):
+    """Time every SQL statement on `engine`, labelled by its verb (SELECT/INSERT/UPDATE/...)."""
+    from sqlalchemy import event
+
+    def _operation(statement: str) -> str:
+        return (statement.lstrip().split(None, 1) or ["?"])[0].upper()
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("srd_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _end(conn, cursor, statement, parameters, context, executemany):
+        DB_DURATION.labels(_operation(statement)).observe(time.perf_counter() - conn.info["srd_query_start"].pop())
+
+    @event.listens_for(engine, "handle_error")
+    def _error(ctx):
+        stack = ctx.connection.info.get("srd_query_start") if ctx.connection is not None else None
+        if stack:
+            stack.pop()
+        DB_ERRORS.labels(_operation(ctx.statement or "")).inc()
+
+def render() -> tuple:
+    """(body, content type) for a /metrics response; aggregates all workers in multiprocess mode."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
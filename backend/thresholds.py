@@ -0,0 +1,72 @@
+from typing import Any, Dict, List, Tuple
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from backend.models import AlertThreshold
+from backend.prom_alerts import DEFAULT_THRESHOLDS, METRICS
+
+SCOPES = ("instance", "group")
+
+def _check(metric: str, value: int):
+    if metric not in METRICS:
+        raise ValueError(f"unknown metric {metric!r} (expected one of {', '.join(METRICS)})")
+    if value < 10 or value > 100:
+        raise ValueError("threshold out of range")
+
+def load_thresholds(engine) -> Tuple[Dict[str, int], List[Dict[str, Any]]]:
+    """Global thresholds (defaults filled in) and the per-instance/group overrides."""
+    glob = dict(DEFAULT_THRESHOLDS)
+    overrides = []
+    with Session(engine) as s:
+        for t in s.execute(select(AlertThreshold).order_by(AlertThreshold.metric, AlertThreshold.scope,
+                                                           AlertThreshold.match)).scalars():
+            if t.scope == "global":
+                glob[t.metric] = t.value
+            else:
+                overrides.append({"id": t.id, "metric": t.metric, "scope": t.scope, "match": t.match, "value": t.value})
+    return glob, overrides
+
+def save_global(engine, values: Dict[str, int]):
+    for metric, value in values.items():
+        _check(metric, value)
+    with Session(engine) as s:
+        rows = {t.metric: t for t in s.execute(select(AlertThreshold).where(AlertThreshold.scope == "global")).scalars()}
+        for metric, value in values.items():
+            row = rows.get(metric)
+            if row is None:
+                s.add(AlertThreshold(metric=metric, scope="global", match="", value=value))
+            else:
+                row.value = value
+        s.commit()
+
+def save_overrides(engine, items: List[Dict[str, Any]]) -> int:
+    """
+    Upsert overrides in one transaction: [{metric, scope, match, value}];
+    value None removes the override. Returns the number of rows touched.
+    """
+    parsed = []
+    for it in items:
+        metric, scope, match = it.get("metric"), it.get("scope"), str(it.get("match") or "").strip()
+        if scope not in SCOPES:
+            raise ValueError(f"scope must be one of {', '.join(SCOPES)}")
+        if not match:
+            raise ValueError("match (instance or group value) is required")
+        value = it.get("value")
+        if value is not None:
+            value = int(value)
+            _check(metric, value)
+        elif metric not in METRICS:
+            raise ValueError(f"unknown metric {metric!r}")
+        parsed.append((metric, scope, match, value))
+    with Session(engine) as s:
+        for metric, scope, match, value in parsed:
+            row = s.execute(select(AlertThreshold).where(AlertThreshold.metric == metric, AlertThreshold.scope == scope,
+                                                         AlertThreshold.match == match)).scalar_one_or_none()
+            if value is None:
+                if row is not None:
+                    s.delete(row)
+            elif row is None:
+                s.add(AlertThreshold(metric=metric, scope=scope, match=match, value=value))
+            else:
+                row.value = value
+        s.commit()
+    return len(parsed)
@@ -0,0 +1,74 @@
+import os, threading, time
+from typing import Optional
+from sqlalchemy.orm import Session
+from backend.cache import TTLCache
+from backend.models import User
+
+def signal_user_change(marker_path: str):
+    """Tell every process's UserCache to drop its entries (bumps the marker file's mtime)."""
+    with open(marker_path, "a"):
+        pass
+    # Always move forward, even when two signals land within the clock's resolution
+    now = max(time.time_ns(), os.stat(marker_path).st_mtime_ns + 1000)
+    os.utime(marker_path, ns=(now, now))
+
+class UserCache:
+    """
+    Identity cache for Flask-Login's user_loader, keyed by user id.
+
+    Entries are detached User rows that live for `ttl` seconds. Changes made
+    in this process evict the entry via invalidate(); changes made elsewhere
+    (reset_admin.py, another worker) are seen through the marker file, whose
+    mtime is checked with one os.stat per lookup, so steady-state requests do
+    not touch the database.
+    """
+
+    def __init__(self, engine, ttl: float = 300.0, max_entries: int = 4096, marker_path: Optional[str] = None):
+        self.engine = engine
+        self.marker_path = marker_path
+        self.cache = TTLCache(max_entries=max_entries, ttl=ttl, name="users")
+        self._marker = self._marker_mtime()
+        self._lock = threading.Lock()
+
+    def _marker_mtime(self) -> Optional[int]:
+        if not self.marker_path:
+            return None
+        try:
+            return os.stat(self.marker_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _check_marker(self):
+        mtime = self._marker_mtime()
+        if mtime != self._marker:
+            with self._lock:
+                if mtime != self._marker:
+                    self._marker = mtime
+                    self.cache.invalidate()
+
+    def _load(self, user_id: int) -> Optional[User]:
+        with Session(self.engine) as s:
+            user = s.get(User, user_id)
+            if user is not None:
+                s.expunge(user)
+            return user
+
+    def get(self, user_id: int) -> Optional[User]:
+        self._check_marker()
+        return self.cache.get_or_load(user_id, lambda: self._load(user_id))
+
+    def generation(self) -> int:
+        """Take before reading a row to put(): the put is dropped if a change was signalled in between."""
+        self._check_marker()
+        return self.cache.generation
+
+    def put(self, user: User, generation: Optional[int] = None):
+        """Prime the cache with a freshly loaded row (e.g. right after login)."""
+        self._check_marker()
+        self.cache.set(user.id, user, generation=generation)
+
+    def invalidate(self, user_id: Optional[int] = None, broadcast: bool = True):
+        """Evict one user (or all) here and, by default, in every other process sharing the marker."""
+        self.cache.invalidate(user_id)
+        if broadcast and self.marker_path:
+            signal_user_change(self.marker_path)
@@ -0,0 +1,210 @@
+import csv, io, json
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from sqlalchemy import insert, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from werkzeug.security import generate_password_hash
+from backend.models import User
+
+ROLES = ("user", "admin")
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+EXPORT_FIELDS = ["id", "email", "name", "role", "is_active"]
+_COLUMNS = (User.id, User.email, User.name, User.role, User.is_active)
+
+def _row(r) -> Dict[str, Any]:
+    return {"id": r.id, "email": r.email, "name": r.name, "role": r.role, "is_active": bool(r.is_active)}
+
+def _like(q: str) -> str:
+    return "%" + q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+def _filtered(stmt, q: Optional[str] = None, role: Optional[str] = None, active: Optional[bool] = None):
+    if q:
+        pattern = _like(q.strip())
+        stmt = stmt.where(or_(User.email.ilike(pattern, escape="\\"), User.name.ilike(pattern, escape="\\")))
+    if role:
+        stmt = stmt.where(User.role == role)
+    if active is not None:
+        stmt = stmt.where(User.is_active == active)
+    return stmt
+
+def list_users(engine, q: Optional[str] = None, role: Optional[str] = None, active: Optional[bool] = None,
+               after: Optional[str] = None, limit: int = PAGE_SIZE) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    One page of users ordered by email, and the cursor for the next page
+    (the last email, None at the end). Keyset pagination walks the email
+    index, so page N costs the same as page 1.
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    stmt = _filtered(select(*_COLUMNS), q, role, active)
+    if after:
+        stmt = stmt.where(User.email > after)
+    stmt = stmt.order_by(User.email).limit(limit + 1)
+    with Session(engine) as s:
+        rows = [_row(r) for r in s.execute(stmt)]
+    more = len(rows) > limit
+    rows = rows[:limit]
+    return rows, (rows[-1]["email"] if more else None)
+
+def create_user(engine, email: str, name: str, role: str, password: str) -> Dict[str, Any]:
+    """Insert one user; raises ValueError if the email is taken (the unique index decides, no pre-check)."""
+    if role not in ROLES:
+        raise ValueError(f"unknown role {role!r}")
+    u = User(email=email.strip(), name=name.strip(), role=role)
+    u.set_password(password)
+    with Session(engine) as s:
+        s.add(u)
+        try:
+            s.commit()
+        except IntegrityError:
+            raise ValueError("Email already exists")
+        return _row(u)
+
+def ensure_default_admin(engine, email: str = "admin@srd.local", password: str = "ChangeMe123!") -> bool:
+    """Create the default admin when the users table is empty (first ever run); True if it was created."""
+    with Session(engine) as s:
+        if s.execute(select(User.id).limit(1)).first() is not None:
+            return False
+        admin = User(email=email, name="Admin", role="admin")
+        admin.set_password(password)
+        s.add(admin)
+        try:
+            s.commit()
+        except IntegrityError:
+            return False  # another worker seeded it first
+        return True
+
+# --- Bulk import / export ---
+
+def _parse_bool(v: Any) -> bool:
+    if isinstance(v, bool):
+        return v
+    return str(v).strip().lower() in ("1", "true", "yes", "y", "on")
+
+def parse_rows(data: str, fmt: str) -> Iterator[Tuple[int, Any]]:
+    """(line number, dict or error string) for each record of a CSV (with header) or JSONL document."""
+    if fmt == "csv":
+        reader = csv.DictReader(io.StringIO(data))
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == "jsonl":
+        for n, line in enumerate(data.splitlines(), 1):
+            if not line.strip():
+                continue
+            try:
+                obj = json.loads(line)
+            except ValueError as e:
+                yield n, f"invalid JSON: {e}"
+                continue
+            yield n, obj if isinstance(obj, dict) else "expected a JSON object"
+    else:
+        raise ValueError("format must be csv or jsonl")
+
+def _text(raw: Dict[str, Any], key: str, default: str = "") -> str:
+    value = raw.get(key)
+    if value in (None, ""):
+        return default
+    if not isinstance(value, str):  # JSONL can carry numbers, lists, objects
+        raise ValueError(f"{key} must be a string")
+    return value
+
+def _prepare(raw: Any) -> Dict[str, Any]:
+    if not isinstance(raw, dict):
+        raise ValueError(raw)
+    email = _text(raw, "email").strip()
+    name = _text(raw, "name").strip()
+    role = _text(raw, "role", "user").strip()
+    password, password_hash = _text(raw, "password") or None, _text(raw, "password_hash") or None
+    if "@" not in email:
+        raise ValueError("email is required")
+    if len(name) < 2:
+        raise ValueError("name is required")
+    if role not in ROLES:
+        raise ValueError(f"unknown role {role!r}")
+    if not password and not password_hash:
+        raise ValueError("password or password_hash is required")
+    active = raw.get("is_active")
+    return {"email": email, "name": name, "role": role,
+            "is_active": True if active in (None, "") else _parse_bool(active),
+            "password": password, "password_hash": password_hash}
+
+def import_users(engine, records: Iterable[Tuple[int, Any]], batch_size: int = 500,
+                 hash_workers: int = 4) -> Dict[str, Any]:
+    """
+    Insert new users in one transaction per batch. Emails that already exist
+    (or repeat within the file) are skipped, bad records are reported by line.
+    Plain passwords are hashed on a small thread pool (the KDF releases the GIL).
+    """
+    summary: Dict[str, Any] = {"created": 0, "skipped": 0, "errors": []}
+    seen = set()
+
+    def flush(batch: List[Tuple[int, Dict[str, Any]]], pool: ThreadPoolExecutor):
+        if not batch:
+            return
+        with Session(engine) as s:
+            existing = set(s.execute(select(User.email).where(User.email.in_([r["email"] for _, r in batch]))).scalars())
+            fresh = [(n, r) for n, r in batch if r["email"] not in existing]
+            summary["skipped"] += len(batch) - len(fresh)
+            hashes = pool.map(lambda r: r["password_hash"] or generate_password_hash(r["password"]),
+                              [r for _, r in fresh])
+            values = [{"email": r["email"], "name": r["name"], "role": r["role"], "is_active": r["is_active"],
+                       "password_hash": h} for (_, r), h in zip(fresh, hashes)]
+            if values:
+                s.execute(insert(User), values)
+            s.commit()
+        summary["created"] += len(values)
+
+    batch: List[Tuple[int, Dict[str, Any]]] = []
+    with ThreadPoolExecutor(max_workers=max(1, hash_workers)) as pool:
+        for line, raw in records:
+            try:
+                rec = _prepare(raw)
+            except ValueError as e:
+                summary["errors"].append({"line": line, "error": str(e)})
+                continue
+            if rec["email"] in seen:
+                summary["skipped"] += 1
+                continue
+            seen.add(rec["email"])
+            batch.append((line, rec))
+            if len(batch) >= batch_size:
+                flush(batch, pool)
+                batch = []
+        flush(batch, pool)
+    summary["ok"] = not summary["errors"]
+    return summary
+
+def export_users(engine, fmt: str, include_hashes: bool = False, batch_size: int = 1000) -> Iterator[str]:
+    """Stream every user as CSV or JSONL, reading the table in keyset batches."""
+    if fmt not in ("csv", "jsonl"):
+        raise ValueError("format must be csv or jsonl")
+    fields = EXPORT_FIELDS + (["password_hash"] if include_hashes else [])
+    columns = _COLUMNS + ((User.password_hash,) if include_hashes else ())
+
+    def lines():
+        if fmt == "csv":
+            buf = io.StringIO()
+            csv.writer(buf).writerow(fields)
+            yield buf.getvalue()
+        after = None
+        while True:
+            stmt = select(*columns).order_by(User.email).limit(batch_size)
+            if after is not None:
+                stmt = stmt.where(User.email > after)
+            with Session(engine) as s:
+                rows = [dict(_row(r), **({"password_hash": r.password_hash} if include_hashes else {}))
+                        for r in s.execute(stmt)]
+            if not rows:
+                return
+            buf = io.StringIO()
+            if fmt == "csv":
+                w = csv.writer(buf)
+                for r in rows:
+                    w.writerow([r[f] for f in fields])
+            else:
+                for r in rows:
+                    buf.write(json.dumps(r, separators=(",", ":")) + "\n")
+            yield buf.getvalue()
+            after = rows[-1]["email"]
+    return lines()
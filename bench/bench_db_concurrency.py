@@ -0,0 +1,105 @@
+"""
+Login lookups and user listings under parallel load while an admin keeps
+editing users, against the old engine setup (plain create_engine, rollback
+journal) and backend/db.py (WAL, busy timeout, sized pool).
+
+    python -m bench.bench_db_concurrency --threads 16 --seconds 5
+
+Runs the same queries as the /login and /admin/users routes against a
+throwaway SQLite file; password hashing is left out so only the database
+is measured.
+"""
+import argparse, json, os, random, shutil, tempfile, threading, time
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+from backend.db import make_engine, init_db
+from backend.models import User
+
+def _seed(engine, users: int):
+    with Session(engine) as s:
+        s.add_all(User(email=f"user{i}@srd.local", name=f"User {i}", role="user", password_hash="x")
+                  for i in range(users))
+        s.commit()
+
+def _pct(samples, q):
+    return round(samples[min(len(samples) - 1, int(len(samples) * q))], 3) if samples else None
+
+def run(engine, a) -> dict:
+    stop = threading.Event()
+    lat = {"login": [], "list": [], "edit": []}
+    errors = {"login": 0, "list": 0, "edit": 0}
+    lock = threading.Lock()
+
+    def op(kind):
+        if kind == "login":
+            with Session(engine) as s:
+                email = f"user{random.randrange(a.users)}@srd.local"
+                s.execute(select(User).where(User.email == email)).scalar_one_or_none()
+        elif kind == "list":
+            with Session(engine) as s:
+                s.query(User).all()
+        else:
+            with Session(engine) as s:
+                u = s.get(User, random.randrange(1, a.users + 1))
+                u.is_active = not u.is_active
+                s.commit()
+
+    def worker(kind):
+        while not stop.is_set():
+            t = time.perf_counter()
+            try:
+                op(kind)
+                ok = True
+            except Exception:
+                ok = False
+            ms = (time.perf_counter() - t) * 1000
+            with lock:
+                if ok:
+                    lat[kind].append(ms)
+                else:
+                    errors[kind] += 1
+            if kind == "edit":
+                time.sleep(a.edit_pause)
+
+    kinds = ["edit"] * a.writers + ["list"] * a.listers + ["login"] * (a.threads - a.writers - a.listers)
+    threads = [threading.Thread(target=worker, args=(k,), daemon=True) for k in kinds]
+    for t in threads:
+        t.start()
+    time.sleep(a.seconds)
+    stop.set()
+    for t in threads:
+        t.join(30)
+    out = {}
+    for kind, samples in lat.items():
+        samples.sort()
+        out[kind] = {"ops_per_s": round(len(samples) / a.seconds, 1), "p50_ms": _pct(samples, 0.5),
+                     "p95_ms": _pct(samples, 0.95), "p99_ms": _pct(samples, 0.99), "errors": errors[kind]}
+    return out
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--threads", type=int, default=16)
+    ap.add_argument("--writers", type=int, default=2, help="threads toggling users (admin edits)")
+    ap.add_argument("--listers", type=int, default=4, help="threads listing all users")
+    ap.add_argument("--users", type=int, default=2000)
+    ap.add_argument("--seconds", type=float, default=5)
+    ap.add_argument("--edit-pause", type=float, default=0.005)
+    a = ap.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="srd-bench-db-")
+    out = {"threads": a.threads, "writers": a.writers, "listers": a.listers, "users": a.users,
+           "seconds": a.seconds, "results": {}}
+    try:
+        for mode in ("default", "tuned"):
+            url = f"sqlite:///{os.path.join(workdir, mode + '.db')}"
+            engine = create_engine(url, future=True) if mode == "default" else make_engine(url)
+            init_db(engine)
+            _seed(engine, a.users)
+            out["results"][mode] = run(engine, a)
+            engine.dispose()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    print(json.dumps(out, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Latency per provision (datasource + folder + dashboard upsert) against the
+local stub Grafana: bare requests.* calls vs the shared pooled GrafanaClient.
+Both paths make the same three calls, so only the connection handling differs
+(the inventory cache that saves the lookups is not measured here).
+
+    python -m bench.bench_grafana_client --runs 200 --handshake-ms 5
+"""
+import argparse, json, os, statistics, time, requests
+from bench.stub_grafana import start_stub
+from backend import grafana_api
+
+DASHBOARD_PATH = os.path.join(os.path.dirname(__file__), "..", "backend", "grafana", "dashboard_http_api.json")
+TOKEN = "bench-token"
+PROM_URL = "http://prometheus:9090"
+
+def provision_bare(grafana_url, dash):
+    # The pre-pooling code path: one new connection per call.
+    h = {"Authorization": f"Bearer {TOKEN}", "Content-Type": "application/json"}
+    r = requests.get(f"{grafana_url}/api/datasources", headers=h, timeout=15); r.raise_for_status()
+    r = requests.get(f"{grafana_url}/api/folders", headers=h, timeout=15); r.raise_for_status()
+    folder_uid = next(f["uid"] for f in r.json() if f["title"] == "Bench")
+    payload = {"dashboard": dash, "folderUid": folder_uid, "overwrite": True}
+    r = requests.post(f"{grafana_url}/api/dashboards/db", headers=h, data=json.dumps(payload), timeout=20)
+    r.raise_for_status()
+
+def provision_pooled(grafana_url, dash):
+    client = grafana_api.get_client(grafana_url, TOKEN)
+    client.get("/api/datasources")
+    folder_uid = next(f["uid"] for f in client.get("/api/folders") if f["title"] == "Bench")
+    client.post("/api/dashboards/db", {"dashboard": dash, "folderUid": folder_uid, "overwrite": True})
+
+def setup(grafana_url):
+    grafana_api.ensure_prometheus_datasource(grafana_url, TOKEN, PROM_URL)
+    grafana_api.ensure_folder(grafana_url, TOKEN, "Bench")
+
+def measure(fn, grafana_url, dash, runs):
+    samples = []
+    for _ in range(runs):
+        t = time.perf_counter()
+        fn(grafana_url, dash)
+        samples.append((time.perf_counter() - t) * 1000)
+    samples.sort()
+    return {
+        "mean_ms": round(statistics.fmean(samples), 3),
+        "p50_ms": round(samples[len(samples) // 2], 3),
+        "p95_ms": round(samples[int(len(samples) * 0.95) - 1], 3),
+    }
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--runs", type=int, default=200)
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    ap.add_argument("--handshake-ms", type=float, default=5.0, help="simulated per-connection TLS cost")
+    a = ap.parse_args()
+
+    server, url = start_stub(latency_ms=a.latency_ms, handshake_ms=a.handshake_ms)
+    with open(DASHBOARD_PATH, "r", encoding="utf-8") as f:
+        dash = json.load(f)
+    dash["uid"] = "bench"
+    setup(url)  # creates datasource/folder
+    provision_pooled(url, dash)  # warm-up: opens the pool
+
+    results = {}
+    for name, fn in (("bare_requests", provision_bare), ("pooled_client", provision_pooled)):
+        before, calls = server.state.connections, server.state.requests
+        results[name] = measure(fn, url, dash, a.runs)
+        results[name]["connections"] = server.state.connections - before
+        results[name]["requests"] = server.state.requests - calls
+    print(json.dumps({"runs": a.runs, "handshake_ms": a.handshake_ms, "latency_ms": a.latency_ms, "results": results}, indent=2))
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Login latency for real users during a credential-stuffing burst, with the
+login throttle effectively off and with the default limits.
+
+Attackers POST wrong passwords for the seeded accounts at a fixed offered
+rate, from a pool of spoofed client addresses (X-Forwarded-For, trusted via
+PROXY_FIX_X_FOR=1); legitimate users each log in with their own password
+from their own address, then load the login page.
+
+    python -m bench.bench_login_throttle --seconds 30 --attack-rps 100
+
+Needs gunicorn (the app runs as a real server, one worker, N threads).
+"""
+import argparse, json, os, random, shutil, socket, subprocess, sys, tempfile, threading, time, requests
+from backend.db import make_engine, init_db
+from backend.users import import_users
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+MODES = {
+    "unthrottled": {"LOGIN_IP_PER_MIN": "1e9", "LOGIN_IP_BURST": "1e9", "LOGIN_ACCOUNT_PER_MIN": "1e9",
+                    "LOGIN_ACCOUNT_BURST": "1e9", "LOGIN_HASH_CONCURRENCY": "0"},
+    "throttled": {},  # Settings defaults
+}
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _pct(samples, q):
+    return round(samples[min(len(samples) - 1, int(len(samples) * q))], 2) if samples else None
+
+def _seed(db_url: str, users: int):
+    engine = make_engine(db_url)
+    init_db(engine)
+    rows = [(i, {"email": f"op{i}@srd.local", "name": f"Operator {i}", "password": f"pw-{i}-secret"})
+            for i in range(users)]
+    import_users(engine, rows, hash_workers=os.cpu_count() or 2)
+    engine.dispose()
+
+def run_mode(mode: str, a) -> dict:
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    workdir = tempfile.mkdtemp(prefix=f"srd-bench-login-{mode}-")
+    db_url = f"sqlite:///{os.path.join(workdir, 'srd_users.db')}"
+    _seed(db_url, a.legit + a.victims)
+    env = dict(os.environ, PYTHONPATH=ROOT, GRAFANA_TOKEN="bench", GRAFANA_URL="http://127.0.0.1:9",
+               PROMETHEUS_URL="http://127.0.0.1:9", DATABASE_URL=db_url, PROXY_FIX_X_FOR="1",
+               USER_CACHE_MARKER=os.path.join(workdir, "user_cache_marker"), **MODES[mode])
+    proc = subprocess.Popen([sys.executable, "-m", "gunicorn", "--workers", "1", "--threads", str(a.threads),
+                             "--bind", f"127.0.0.1:{port}", "--timeout", "120", "backend.app:app"],
+                            cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.time() + 30
+        while True:
+            try:
+                if requests.get(f"{base}/login", timeout=1).status_code == 200:
+                    break
+            except requests.RequestException:
+                pass
+            if time.time() > deadline or proc.poll() is not None:
+                raise RuntimeError(f"{mode} server did not start")
+            time.sleep(0.2)
+
+        stop = threading.Event()
+        lock = threading.Lock()
+        attack = {"requests": 0, "throttled": 0, "errors": 0}
+        legit = {"login": [], "page": [], "login_failed": 0, "errors": 0}
+
+        def attacker(n):
+            # Open loop: each thread fires at attack_rps / attackers regardless of how slowly the server answers
+            s = requests.Session()
+            interval = a.attackers / a.attack_rps
+            next_at = time.monotonic() + random.random() * interval
+            while not stop.is_set():
+                delay = next_at - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                next_at = max(next_at + interval, time.monotonic() - interval)
+                ip = f"10.{n}.{random.randrange(a.attack_ips)}.1"
+                email = f"op{a.legit + random.randrange(a.victims)}@srd.local"
+                try:
+                    r = s.post(f"{base}/login", data={"email": email, "password": "wrong"},
+                               headers={"X-Forwarded-For": ip}, allow_redirects=False, timeout=30)
+                    with lock:
+                        attack["requests"] += 1
+                        attack["throttled"] += r.status_code == 429
+                except requests.RequestException:
+                    with lock:
+                        attack["errors"] += 1
+
+        def user(n):
+            ip = f"192.168.0.{n + 1}"
+            while not stop.is_set():
+                s = requests.Session()
+                try:
+                    t = time.perf_counter()
+                    r = s.post(f"{base}/login", data={"email": f"op{n}@srd.local", "password": f"pw-{n}-secret"},
+                               headers={"X-Forwarded-For": ip}, allow_redirects=False, timeout=30)
+                    login_ms = (time.perf_counter() - t) * 1000
+                    t = time.perf_counter()
+                    s.get(f"{base}/login", headers={"X-Forwarded-For": ip}, timeout=30)
+                    page_ms = (time.perf_counter() - t) * 1000
+                    with lock:
+                        if r.status_code == 302:
+                            legit["login"].append(login_ms)
+                        else:
+                            legit["login_failed"] += 1
+                        legit["page"].append(page_ms)
+                except requests.RequestException:
+                    with lock:
+                        legit["errors"] += 1
+                time.sleep(a.user_pause)
+
+        threads = [threading.Thread(target=attacker, args=(i,), daemon=True) for i in range(a.attackers)]
+        threads += [threading.Thread(target=user, args=(i,), daemon=True) for i in range(a.legit)]
+        for t in threads:
+            t.start()
+        time.sleep(a.seconds)
+        stop.set()
+        for t in threads:
+            t.join(35)
+        legit["login"].sort()
+        legit["page"].sort()
+        return {
+            "attack_rps_served": round(attack["requests"] / a.seconds, 1),
+            "attack_throttled_pct": round(100.0 * attack["throttled"] / max(1, attack["requests"]), 1),
+            "attack_errors": attack["errors"],
+            "user_logins": len(legit["login"]),
+            "user_login_p50_ms": _pct(legit["login"], 0.50),
+            "user_login_p95_ms": _pct(legit["login"], 0.95),
+            "user_login_failed": legit["login_failed"],
+            "login_page_p50_ms": _pct(legit["page"], 0.50),
+            "login_page_p95_ms": _pct(legit["page"], 0.95),
+            "user_errors": legit["errors"],
+        }
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--modes", default="unthrottled,throttled")
+    ap.add_argument("--seconds", type=float, default=30)
+    ap.add_argument("--threads", type=int, default=32, help="gunicorn threads")
+    ap.add_argument("--attackers", type=int, default=32, help="attacker threads")
+    ap.add_argument("--attack-rps", type=float, default=100, help="offered attack rate (all threads)")
+    ap.add_argument("--attack-ips", type=int, default=4, help="spoofed addresses per attacker thread")
+    ap.add_argument("--victims", type=int, default=20, help="accounts under attack")
+    ap.add_argument("--legit", type=int, default=4, help="legitimate users")
+    ap.add_argument("--user-pause", type=float, default=0.5)
+    a = ap.parse_args()
+    out = {k: v for k, v in vars(a).items() if k != "modes"}
+    out["cpus"] = os.cpu_count()
+    out["results"] = {mode: run_mode(mode.strip(), a) for mode in a.modes.split(",")}
+    print(json.dumps(out, indent=2))
+
+if __name__ == "__main__":
+    main()
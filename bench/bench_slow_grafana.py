@@ -0,0 +1,157 @@
+"""
+Throughput of the login page while admins hammer Grafana-bound routes and
+Grafana is slow. Runs the app as a real server against the local stub
+Grafana, once per serving mode:
+
+    wsgi  gunicorn sync workers (--workers 1 --threads N)
+    asgi  uvicorn backend.asgi:application
+
+    python -m bench.bench_slow_grafana --grafana-latency-ms 2000 --seconds 15
+
+Needs gunicorn for the wsgi mode and backend/requirements-asgi.txt for asgi.
+"""
+import argparse, json, os, shutil, socket, statistics, subprocess, sys, tempfile, threading, time, requests
+from bench.stub_grafana import start_stub
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _server_cmd(mode: str, port: int, threads: int):
+    if mode == "wsgi":
+        return [sys.executable, "-m", "gunicorn", "--workers", "1", "--threads", str(threads),
+                "--bind", f"127.0.0.1:{port}", "--timeout", "120", "backend.app:app"]
+    return [sys.executable, "-m", "uvicorn", "backend.asgi:application", "--host", "127.0.0.1",
+            "--port", str(port), "--workers", "1", "--log-level", "warning"]
+
+def _login(base: str):
+    """Log the admin in once; every slow client reuses the session cookie (the login throttle is not under test)."""
+    s = requests.Session()
+    s.get(f"{base}/login", timeout=10)  # first request seeds the default admin
+    s.post(f"{base}/login", data={"email": "admin@srd.local", "password": "ChangeMe123!"}, timeout=10)
+    if not _json_ok(s.get(f"{base}/api/status", timeout=10, allow_redirects=False)):
+        raise RuntimeError("admin login failed")
+    return s.cookies
+
+def _json_ok(r: requests.Response) -> bool:
+    # A lost session redirects to /login (200 HTML once followed); only a JSON answer counts
+    return r.status_code == 200 and r.headers.get("Content-Type", "").startswith("application/json")
+
+def _pct(samples, q):
+    return round(samples[min(len(samples) - 1, int(len(samples) * q))], 2) if samples else None
+
+def run_mode(mode: str, grafana_url: str, a) -> dict:
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    workdir = tempfile.mkdtemp(prefix=f"srd-bench-{mode}-")
+    env = dict(os.environ, PYTHONPATH=ROOT, GRAFANA_URL=grafana_url, GRAFANA_TOKEN="bench",
+               DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'srd_users.db')}",
+               USER_CACHE_MARKER=os.path.join(workdir, "user_cache_marker"),
+               PROMETHEUS_URL=grafana_url, ASGI_WSGI_WORKERS=str(a.threads), GRAFANA_RETRIES="0",
+               GRAFANA_POOL_SIZE=str(a.grafana_pool))
+    proc = subprocess.Popen(_server_cmd(mode, port, a.threads), cwd=workdir, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.time() + 30
+        while True:
+            try:
+                if requests.get(f"{base}/login", timeout=1).status_code == 200:
+                    break
+            except requests.RequestException:
+                pass
+            if time.time() > deadline or proc.poll() is not None:
+                raise RuntimeError(f"{mode} server did not start")
+            time.sleep(0.2)
+
+        stop = threading.Event()
+        fast, fast_errors, slow_done, slow_errors = [], [0], [0], [0]
+        lock = threading.Lock()
+
+        cookies = _login(base)
+
+        def slow_client():
+            s = requests.Session()
+            s.cookies.update(cookies)
+            while not stop.is_set():
+                try:
+                    ok = _json_ok(s.get(f"{base}/admin/grafana-info", timeout=120, allow_redirects=False))
+                except requests.RequestException:
+                    ok = False
+                with lock:
+                    if ok:
+                        slow_done[0] += 1
+                    else:
+                        slow_errors[0] += 1
+
+        def fast_client():
+            s = requests.Session()
+            while not stop.is_set():
+                t = time.perf_counter()
+                try:
+                    ok = s.get(f"{base}/login", timeout=a.fast_timeout).status_code == 200
+                except requests.RequestException:
+                    ok = False
+                ms = (time.perf_counter() - t) * 1000
+                with lock:
+                    if ok:
+                        fast.append(ms)
+                    else:
+                        fast_errors[0] += 1
+
+        threads = [threading.Thread(target=slow_client, daemon=True) for _ in range(a.slow_clients)]
+        for t in threads:
+            t.start()
+        time.sleep(1.0)  # let the slow requests occupy the server first
+        fast_threads = [threading.Thread(target=fast_client, daemon=True) for _ in range(a.fast_clients)]
+        for t in fast_threads:
+            t.start()
+        time.sleep(a.seconds)
+        stop.set()
+        for t in fast_threads:
+            t.join(a.fast_timeout + 1)
+        fast.sort()
+        return {
+            "login_requests": len(fast),
+            "login_rps": round(len(fast) / a.seconds, 1),
+            "login_p50_ms": _pct(fast, 0.50),
+            "login_p95_ms": _pct(fast, 0.95),
+            "login_p99_ms": _pct(fast, 0.99),
+            "login_mean_ms": round(statistics.fmean(fast), 2) if fast else None,
+            "login_errors": fast_errors[0],
+            "grafana_info_completed": slow_done[0],
+            "grafana_info_errors": slow_errors[0],
+        }
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--modes", default="wsgi,asgi")
+    ap.add_argument("--grafana-latency-ms", type=float, default=2000)
+    ap.add_argument("--seconds", type=float, default=15)
+    ap.add_argument("--threads", type=int, default=8, help="gunicorn threads / ASGI_WSGI_WORKERS")
+    ap.add_argument("--grafana-pool", type=int, default=32, help="GRAFANA_POOL_SIZE for the server")
+    ap.add_argument("--slow-clients", type=int, default=16)
+    ap.add_argument("--fast-clients", type=int, default=8)
+    ap.add_argument("--fast-timeout", type=float, default=10)
+    a = ap.parse_args()
+
+    server, grafana_url = start_stub(latency_ms=a.grafana_latency_ms)
+    out = {"grafana_latency_ms": a.grafana_latency_ms, "seconds": a.seconds, "threads": a.threads,
+           "grafana_pool": a.grafana_pool,
+           "slow_clients": a.slow_clients, "fast_clients": a.fast_clients, "results": {}}
+    for mode in a.modes.split(","):
+        out["results"][mode] = run_mode(mode.strip(), grafana_url, a)
+    print(json.dumps(out, indent=2))
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Worker cold start: how long a fresh interpreter takes to import backend.app,
+build the app and answer its first /login, plus the slowest imports from
+`python -X importtime`.
+
+    python -m bench.bench_startup --runs 7
+    python -m bench.bench_startup --compare HEAD~1   # same probe against an older revision
+
+Every run is a new process (no warm module cache in the interpreter; the OS
+page cache is warm after the first run, as it is when a node scales out).
+"""
+import argparse, json, os, shutil, statistics, subprocess, sys, tempfile, time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# Runs inside the measured interpreter; prints one JSON line.
+PROBE = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import backend.app as srd
+t1 = time.perf_counter()
+factory = getattr(srd, "create_app", None)
+app = factory() if factory else srd.app
+t2 = time.perf_counter()
+status = app.test_client().get("/login").status_code
+t3 = time.perf_counter()
+heavy = [m for m in ("requests", "urllib3", "yaml", "backend.grafana_api", "backend.prom_alerts", "backend.health")
+         if m in sys.modules]
+print(json.dumps({"import_ms": (t1 - t0) * 1000, "create_app_ms": (t2 - t1) * 1000,
+                  "first_request_ms": (t3 - t2) * 1000, "status": status,
+                  "modules": len(sys.modules), "heavy_loaded": heavy}))
+"""
+
+def _env(src: str, workdir: str) -> dict:
+    return dict(os.environ, PYTHONPATH=src, GRAFANA_TOKEN="bench", GRAFANA_URL="http://127.0.0.1:9",
+                PROMETHEUS_URL="http://127.0.0.1:9", DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'srd.db')}",
+                USER_CACHE_MARKER=os.path.join(workdir, "user_cache_marker"))
+
+def probe(src: str, runs: int) -> dict:
+    workdir = tempfile.mkdtemp(prefix="srd-bench-startup-")
+    samples = []
+    try:
+        for _ in range(runs):
+            t = time.perf_counter()
+            out = subprocess.run([sys.executable, "-c", PROBE], cwd=workdir, env=_env(src, workdir),
+                                 capture_output=True, text=True, timeout=120)
+            wall = (time.perf_counter() - t) * 1000
+            if out.returncode != 0:
+                raise RuntimeError(out.stderr.strip().splitlines()[-1] if out.stderr.strip() else "probe failed")
+            sample = json.loads(out.stdout.strip().splitlines()[-1])
+            sample["wall_ms"] = wall
+            samples.append(sample)
+        result = {k: round(statistics.median(s[k] for s in samples), 1)
+                  for k in ("import_ms", "create_app_ms", "first_request_ms", "wall_ms")}
+        result.update(modules=samples[-1]["modules"], heavy_loaded=samples[-1]["heavy_loaded"],
+                      status=samples[-1]["status"], importtime_top=importtime(src, workdir))
+        return result
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def importtime(src: str, workdir: str, top: int = 10) -> list:
+    """Largest self times (ms) reported by -X importtime for `import backend.app`."""
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import backend.app"], cwd=workdir,
+                         env=_env(src, workdir), capture_output=True, text=True, timeout=120)
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = (p.strip() for p in line[len("import time:"):].split("|"))
+        rows.append((int(self_us), int(cumulative_us), name.strip()))
+    rows.sort(reverse=True)
+    return [{"module": n, "self_ms": round(s / 1000, 1), "cumulative_ms": round(c / 1000, 1)} for s, c, n in rows[:top]]
+
+def checkout(rev: str) -> str:
+    """Export `rev` of this repo to a temp dir (git archive, no working-tree changes)."""
+    dest = tempfile.mkdtemp(prefix="srd-bench-rev-")
+    archive = subprocess.run(["git", "archive", rev], cwd=ROOT, capture_output=True, check=True).stdout
+    subprocess.run(["tar", "-x", "-C", dest], input=archive, check=True)
+    return dest
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--compare", help="git revision to measure as the baseline")
+    a = ap.parse_args()
+    out = {"python": sys.version.split()[0], "runs": a.runs, "results": {}}
+    if a.compare:
+        src = checkout(a.compare)
+        try:
+            out["results"][a.compare] = probe(src, a.runs)
+        finally:
+            shutil.rmtree(src, ignore_errors=True)
+    out["results"]["working tree"] = probe(ROOT, a.runs)
+    print(json.dumps(out, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""
+End-to-end latency/throughput suite for the main routes, against the local
+stub Grafana and Prometheus (no live backends needed). The app runs as a real
+server (gunicorn, or uvicorn with --server asgi); each scenario is driven by
+--concurrency client threads for --seconds, one scenario at a time.
+
+    python -m bench.bench_suite --concurrency 8 --seconds 10 --out bench-results.json
+    python -m bench.bench_suite --grafana-latency-ms 50 --grafana-error-rate 0.02 --baseline bench-baseline.json
+    python -m bench.bench_suite --diff bench-baseline.json bench-results.json   # compare two saved runs
+
+Results (p50/p95/p99/mean/max in ms, throughput in req/s, status counts) are
+written as JSON. With --baseline (or --diff) every scenario is compared with
+the baseline run and the process exits 1 when p95, p99 or throughput is worse
+by more than --tolerance percent, or a scenario's error rate rose, so CI can
+gate on it. Login rate limits are lifted for the run (the hash cap stays), so
+/login measures password checks rather than 429s.
+"""
+import argparse, json, math, os, platform, re, shutil, socket, subprocess, sys, tempfile, threading, time
+import requests
+from bench.stub_grafana import start_stub as start_grafana
+from bench.stub_prometheus import start_stub as start_prometheus
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+ADMIN = {"email": "admin@srd.local", "password": "ChangeMe123!"}
+CSRF_RE = re.compile(r'name="csrf[-_]token"\s+(?:content|value)="([^"]+)"')
+
+def _provision_body(n):
+    return {"folder": {"title": "SRD Bench"},
+            "dashboard": {"uid": "srd-bench", "title": "SRD Bench", "panels": []}}
+
+def _alerts_body(n):
+    return {"cpu": 70 + n % 20, "memory": 80, "disk": 85}
+
+# name -> (method, path, JSON body factory or None, needs an admin session)
+SCENARIOS = {
+    "login": ("POST", "/login", None, False),
+    "status": ("GET", "/api/status", None, True),
+    "provision_all": ("POST", "/admin/provision-all", None, True),
+    "provision": ("POST", "/admin/provision", _provision_body, True),
+    "alerts_update": ("POST", "/api/alerts/update", _alerts_body, True),
+    "grafana_info": ("GET", "/admin/grafana-info", None, True),
+}
+METRICS = ("p50_ms", "p95_ms", "p99_ms")
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _pct(samples, q):
+    """Nearest-rank percentile of sorted samples."""
+    return round(samples[max(0, math.ceil(q * len(samples)) - 1)], 2) if samples else None
+
+def _server_cmd(mode: str, port: int, threads: int):
+    if mode == "wsgi":
+        return [sys.executable, "-m", "gunicorn", "--workers", "1", "--threads", str(threads),
+                "--bind", f"127.0.0.1:{port}", "--timeout", "120", "backend.app:app"]
+    return [sys.executable, "-m", "uvicorn", "backend.asgi:application", "--host", "127.0.0.1",
+            "--port", str(port), "--workers", "1", "--log-level", "warning"]
+
+def _admin_session(base: str) -> requests.Session:
+    """Logged-in admin session that sends its CSRF token on every request, like the dashboard's fetch() calls."""
+    s = requests.Session()
+    r = s.post(f"{base}/login", data=ADMIN, allow_redirects=False, timeout=30)
+    if r.status_code != 302:
+        raise RuntimeError(f"admin login failed: {r.status_code}")
+    m = CSRF_RE.search(s.get(f"{base}/admin/users", timeout=30).text)
+    if not m:
+        raise RuntimeError("no CSRF token on /admin/users")
+    s.headers["X-CSRFToken"] = m.group(1)
+    return s
+
+def _send(s: requests.Session, base: str, scenario: str, n: int) -> int:
+    method, path, body, _ = SCENARIOS[scenario]
+    if scenario == "login":
+        return s.post(f"{base}{path}", data=ADMIN, allow_redirects=False, timeout=60).status_code
+    return s.request(method, f"{base}{path}", json=body(n) if body else None, allow_redirects=False,
+                     timeout=60).status_code
+
+def run_scenario(base: str, scenario: str, a) -> dict:
+    admin = SCENARIOS[scenario][3]
+    sessions = [_admin_session(base) if admin else requests.Session() for _ in range(a.concurrency)]
+    for i in range(a.warmup):
+        _send(sessions[i % len(sessions)], base, scenario, i)
+    lock = threading.Lock()
+    latencies, statuses, failures = [], {}, [0]
+    stop_at = time.perf_counter() + a.seconds
+
+    def client(k: int):
+        s, n = sessions[k], k
+        while time.perf_counter() < stop_at:
+            t = time.perf_counter()
+            try:
+                code = _send(s, base, scenario, n)
+                status, failed = str(code), code >= 400
+            except requests.RequestException:
+                status, failed = "error", True
+            ms = (time.perf_counter() - t) * 1000
+            with lock:
+                latencies.append(ms)
+                statuses[status] = statuses.get(status, 0) + 1
+                failures[0] += failed
+            n += a.concurrency
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(k,), daemon=True) for k in range(a.concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "error_rate": round(failures[0] / max(1, len(latencies)), 4),
+        "p50_ms": _pct(latencies, 0.50),
+        "p95_ms": _pct(latencies, 0.95),
+        "p99_ms": _pct(latencies, 0.99),
+        "mean_ms": round(sum(latencies) / len(latencies), 2) if latencies else None,
+        "max_ms": round(latencies[-1], 2) if latencies else None,
+        "status": dict(sorted(statuses.items())),
+    }
+
+def run_suite(a) -> dict:
+    grafana, grafana_url = start_grafana(latency_ms=a.grafana_latency_ms, error_rate=a.grafana_error_rate,
+                                         dashboards=a.grafana_dashboards, panels=a.grafana_panels, seed=a.seed)
+    prom, prom_url = start_prometheus(latency_ms=a.prom_latency_ms, error_rate=a.prom_error_rate,
+                                      series=a.prom_series, seed=a.seed)
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    workdir = tempfile.mkdtemp(prefix="srd-bench-suite-")
+    env = dict(os.environ, PYTHONPATH=ROOT, GRAFANA_URL=grafana_url, GRAFANA_TOKEN="bench", PROMETHEUS_URL=prom_url,
+               PROM_RELOAD_URL=f"{prom_url}/-/reload", ALERTMANAGER_RELOAD_URL=f"{prom_url}/-/reload",
+               PROM_RULES_PATH=os.path.join(workdir, "rules.yml"),
+               DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'srd_users.db')}",
+               USER_CACHE_MARKER=os.path.join(workdir, "user_cache_marker"),
+               ASGI_WSGI_WORKERS=str(a.threads), LOGIN_IP_PER_MIN="1e9", LOGIN_IP_BURST="1e9",
+               LOGIN_ACCOUNT_PER_MIN="1e9", LOGIN_ACCOUNT_BURST="1e9")
+    env.pop("PROMETHEUS_MULTIPROC_DIR", None)
+    proc = subprocess.Popen(_server_cmd(a.server, port, a.threads), cwd=workdir, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.time() + 30
+        while True:
+            try:
+                if requests.get(f"{base}/login", timeout=1).status_code == 200:
+                    break
+            except requests.RequestException:
+                pass
+            if time.time() > deadline or proc.poll() is not None:
+                raise RuntimeError(f"{a.server} server did not start")
+            time.sleep(0.2)
+        results = {}
+        for scenario in a.scenarios.split(","):
+            scenario = scenario.strip()
+            if scenario not in SCENARIOS:
+                raise SystemExit(f"unknown scenario {scenario!r}; choose from {', '.join(SCENARIOS)}")
+            results[scenario] = run_scenario(base, scenario, a)
+        return {"stub_requests": {"grafana": grafana.state.requests, "prometheus": prom.state.requests,
+                                  "injected_errors": grafana.state.errors + prom.state.errors}, "results": results}
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        grafana.shutdown()
+        prom.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def _change(old, new):
+    return None if not old or new is None else round(100.0 * (new - old) / old, 1)
+
+def compare(baseline: dict, current: dict, tolerance: float) -> dict:
+    """Per-scenario % change vs the baseline; a scenario regresses when latency/throughput moved past tolerance."""
+    out = {}
+    for scenario, cur in current["results"].items():
+        base = baseline.get("results", {}).get(scenario)
+        if base is None:
+            out[scenario] = {"note": "not in baseline"}
+            continue
+        delta = {f"{m}_change_pct": _change(base.get(m), cur.get(m)) for m in METRICS}
+        delta["throughput_change_pct"] = _change(base.get("throughput_rps"), cur.get("throughput_rps"))
+        reasons = [m for m in METRICS if (delta[f"{m}_change_pct"] or 0) > tolerance]
+        if (delta["throughput_change_pct"] or 0) < -tolerance:
+            reasons.append("throughput_rps")
+        if cur.get("error_rate", 0) > base.get("error_rate", 0):
+            reasons.append("error_rate")
+        out[scenario] = dict(delta, regressed=reasons)
+    return out
+
+def _report(comparison: dict) -> bool:
+    regressed = False
+    for scenario, c in comparison.items():
+        if "note" in c:
+            print(f"{scenario:14} {c['note']}", file=sys.stderr)
+            continue
+        changes = "  ".join(f"{m[:-3]} {c[f'{m}_change_pct']:+.1f}%" for m in METRICS
+                            if c[f"{m}_change_pct"] is not None)
+        rps = c["throughput_change_pct"]
+        flag = f"  REGRESSED: {', '.join(c['regressed'])}" if c["regressed"] else ""
+        print(f"{scenario:14} {changes}  rps {rps:+.1f}%{flag}" if rps is not None else f"{scenario:14} {changes}{flag}",
+              file=sys.stderr)
+        regressed |= bool(c["regressed"])
+    return regressed
+
+def _git_rev() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--scenarios", default=",".join(SCENARIOS))
+    ap.add_argument("--server", choices=("wsgi", "asgi"), default="wsgi")
+    ap.add_argument("--concurrency", type=int, default=8, help="client threads per scenario")
+    ap.add_argument("--seconds", type=float, default=10, help="measured time per scenario")
+    ap.add_argument("--warmup", type=int, default=5, help="unmeasured requests per scenario")
+    ap.add_argument("--threads", type=int, default=16, help="server threads (gunicorn / ASGI_WSGI_WORKERS)")
+    ap.add_argument("--grafana-latency-ms", type=float, default=5.0)
+    ap.add_argument("--grafana-error-rate", type=float, default=0.0)
+    ap.add_argument("--grafana-dashboards", type=int, default=50, help="pre-loaded dashboards (search size)")
+    ap.add_argument("--grafana-panels", type=int, default=12, help="panels per pre-loaded dashboard")
+    ap.add_argument("--prom-latency-ms", type=float, default=2.0)
+    ap.add_argument("--prom-error-rate", type=float, default=0.0)
+    ap.add_argument("--prom-series", type=int, default=50, help="series per query result")
+    ap.add_argument("--seed", type=int, default=1, help="seed for injected errors")
+    ap.add_argument("--out", default="bench-results.json")
+    ap.add_argument("--baseline", help="earlier --out file to compare against")
+    ap.add_argument("--tolerance", type=float, default=20.0, help="allowed regression, percent")
+    ap.add_argument("--diff", nargs=2, metavar=("BASELINE", "CURRENT"), help="compare two result files and exit")
+    a = ap.parse_args()
+
+    if a.diff:
+        with open(a.diff[0], encoding="utf-8") as f:
+            baseline = json.load(f)
+        with open(a.diff[1], encoding="utf-8") as f:
+            current = json.load(f)
+        sys.exit(1 if _report(compare(baseline, current, a.tolerance)) else 0)
+
+    config = {k: v for k, v in vars(a).items() if k not in ("out", "baseline", "diff")}
+    out = {"meta": {"git_rev": _git_rev(), "python": sys.version.split()[0], "platform": platform.platform(),
+                    "cpus": os.cpu_count(), "started": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())},
+           "config": config}
+    out.update(run_suite(a))
+    regressed = False
+    if a.baseline:
+        with open(a.baseline, encoding="utf-8") as f:
+            out["comparison"] = compare(json.load(f), out, a.tolerance)
+        regressed = _report(out["comparison"])
+    with open(a.out, "w", encoding="utf-8") as f:
+        json.dump(out, f, indent=2)
+    print(json.dumps(out, indent=2))
+    sys.exit(1 if regressed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+Minimal in-memory Grafana HTTP API stub for local benchmarks.
+
+    python -m bench.stub_grafana --port 3001 --latency-ms 5 --handshake-ms 20
+
+`--handshake-ms` is slept once per new TCP connection, standing in for the
+TLS handshake a real HTTPS Grafana would cost. `--error-rate` answers that
+fraction of requests with a 503 (seeded, so runs are repeatable), and
+`--dashboards`/`--panels` pre-load dashboards to make search and dashboard
+responses as large as a real instance's.
+"""
+import argparse, json, random, sys, threading, time, uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+class GrafanaState:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.datasources = []
+        self.folders = []
+        self.dashboards = {}  # uid -> {"dashboard", "folderUid", "version"}
+        self.requests = 0
+        self.connections = 0
+        self.errors = 0
+
+    def seed(self, dashboards: int, panels: int):
+        """Pre-load `dashboards` dashboards of `panels` panels each in a "Seeded" folder."""
+        if not dashboards:
+            return
+        folder = {"uid": "seeded", "title": "Seeded", "id": len(self.folders) + 1}
+        self.folders.append(folder)
+        for i in range(dashboards):
+            uid = f"seed{i:05d}"
+            panel_list = [{"id": p + 1, "type": "timeseries", "title": f"Panel {p + 1}",
+                           "gridPos": {"h": 8, "w": 12, "x": (p % 2) * 12, "y": (p // 2) * 8},
+                           "targets": [{"refId": "A", "expr": f'rate(windows_cpu_time_total{{instance="host{p}"}}[5m])'}]}
+                          for p in range(panels)]
+            self.dashboards[uid] = {"dashboard": {"uid": uid, "title": f"Seeded dashboard {i}", "version": 1,
+                                                  "panels": panel_list}, "folderUid": folder["uid"], "version": 1}
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Shared plumbing for the stub servers: keep-alive, JSON replies, injected latency and errors."""
+    protocol_version = "HTTP/1.1"  # keep-alive, so pooled clients can reuse connections
+    disable_nagle_algorithm = True  # like Go's net/http; avoids delayed-ACK stalls on reused connections
+
+    def setup(self):
+        super().setup()
+        with self.server.state.lock:
+            self.server.state.connections += 1
+        if self.server.handshake_ms:
+            time.sleep(self.server.handshake_ms / 1000.0)
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _send(self, code, obj):
+        body = json.dumps(obj).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self):
+        n = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(n) or b"{}") if n else {}
+
+    def _begin(self):
+        """(state, path, query) for a request to serve, or None when an error was injected (already answered)."""
+        st = self.server.state
+        with st.lock:
+            st.requests += 1
+            fail = self.server.error_rate and self.server.rng.random() < self.server.error_rate
+            st.errors += bool(fail)
+        if self.server.latency_ms:
+            time.sleep(self.server.latency_ms / 1000.0)
+        if fail:
+            self.rfile.read(int(self.headers.get("Content-Length") or 0))  # drain it so the connection stays usable
+            self._send(503, {"message": "injected stub error"})
+            return None
+        parts = urlsplit(self.path)
+        return st, parts.path, parse_qs(parts.query)
+
+class StubGrafanaHandler(StubHandler):
+    @staticmethod
+    def _page(items, query):
+        # Grafana's ?limit=&page= (1-based); search defaults to 1000 results, folders to all
+        limit = int(query.get("limit", ["0"])[-1])
+        if not limit:
+            return items
+        page = max(1, int(query.get("page", ["1"])[-1]))
+        return items[(page - 1) * limit:page * limit]
+
+    def do_GET(self):
+        begun = self._begin()
+        if begun is None:
+            return
+        st, path, query = begun
+        if path == "/api/health":
+            return self._send(200, {"database": "ok", "version": "stub"})
+        if path == "/api/datasources":
+            return self._send(200, st.datasources)
+        if path == "/api/folders":
+            with st.lock:
+                folders = list(st.folders)
+            return self._send(200, self._page(folders, query))
+        if path == "/api/search":
+            with st.lock:
+                hits = [{"uid": uid, "title": d["dashboard"].get("title"), "type": "dash-db",
+                         "folderUid": d["folderUid"], "url": f"/d/{uid}"} for uid, d in st.dashboards.items()]
+            return self._send(200, self._page(hits, query))
+        if path.startswith("/api/dashboards/uid/"):
+            d = st.dashboards.get(path.rsplit("/", 1)[-1])
+            if not d:
+                return self._send(404, {"message": "Dashboard not found"})
+            return self._send(200, {"dashboard": d["dashboard"], "meta": {"folderUid": d["folderUid"], "version": d["version"]}})
+        self._send(404, {"message": "not found"})
+
+    def do_POST(self):
+        begun = self._begin()
+        if begun is None:
+            return
+        st, path, _ = begun
+        body = self._body()
+        if path == "/api/datasources":
+            ds = dict(body, uid=uuid.uuid4().hex[:9], id=len(st.datasources) + 1)
+            with st.lock:
+                st.datasources.append(ds)
+            return self._send(200, {"datasource": ds, "message": "Datasource added"})
+        if path == "/api/folders":
+            with st.lock:
+                if any(f["title"] == body.get("title") for f in st.folders):
+                    return self._send(409, {"message": "a folder with the same name already exists"})
+                f = {"uid": uuid.uuid4().hex[:9], "title": body.get("title"), "id": len(st.folders) + 1}
+                st.folders.append(f)
+            return self._send(200, f)
+        if path == "/api/dashboards/db":
+            dash = body.get("dashboard") or {}
+            with st.lock:
+                # Like Grafana: without a uid, overwrite matches on title within the folder.
+                uid = dash.get("uid") or next((u for u, d in st.dashboards.items()
+                                               if d["dashboard"].get("title") == dash.get("title")
+                                               and d["folderUid"] == body.get("folderUid")), None) or uuid.uuid4().hex[:9]
+                prev = st.dashboards.get(uid)
+                version = (prev["version"] + 1) if prev else 1
+                st.dashboards[uid] = {"dashboard": dict(dash, uid=uid, version=version),
+                                      "folderUid": body.get("folderUid"), "version": version}
+            return self._send(200, {"status": "success", "uid": uid, "url": f"/d/{uid}", "version": version})
+        self._send(404, {"message": "not found"})
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients that time out and hang up are expected under load; stay quiet about them.
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+def serve(handler, state, host="127.0.0.1", port=0, latency_ms=0.0, handshake_ms=0.0, error_rate=0.0, seed=0):
+    """Run `handler` in a daemon thread with the injected-latency/error knobs set; returns (server, base_url)."""
+    server = StubServer((host, port), handler)
+    server.state = state
+    server.latency_ms = latency_ms
+    server.handshake_ms = handshake_ms
+    server.error_rate = error_rate
+    server.rng = random.Random(seed)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+def start_stub(host="127.0.0.1", port=0, latency_ms=0.0, handshake_ms=0.0, error_rate=0.0,
+               dashboards=0, panels=0, seed=0):
+    """Start the stub Grafana in a daemon thread; returns (server, base_url)."""
+    state = GrafanaState()
+    state.seed(dashboards, panels)
+    return serve(StubGrafanaHandler, state, host, port, latency_ms, handshake_ms, error_rate, seed)
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Stub Grafana HTTP API")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=3001)
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    ap.add_argument("--handshake-ms", type=float, default=0.0)
+    ap.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    ap.add_argument("--dashboards", type=int, default=0, help="dashboards to pre-load")
+    ap.add_argument("--panels", type=int, default=0, help="panels per pre-loaded dashboard")
+    ap.add_argument("--seed", type=int, default=0)
+    a = ap.parse_args()
+    server, url = start_stub(a.host, a.port, a.latency_ms, a.handshake_ms, a.error_rate, a.dashboards, a.panels,
+                             a.seed)
+    print(f"Stub Grafana listening on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
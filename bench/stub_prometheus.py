@@ -0,0 +1,95 @@
+"""
+Minimal Prometheus (and Alertmanager reload) HTTP API stub for local benchmarks.
+
+    python -m bench.stub_prometheus --port 9091 --latency-ms 5 --series 200
+
+Instant queries answer with `--series` windows_exporter-style series and
+range queries with one point per step for each of them, so response size
+scales like a real fleet. POST /-/reload answers 200, which makes the stub a
+stand-in for Alertmanager's reload endpoint too. `--error-rate` answers that
+fraction of requests with a 503 (seeded, so runs are repeatable).
+"""
+import argparse, threading, time
+from urllib.parse import parse_qs
+from bench.stub_grafana import StubHandler, serve
+
+MAX_POINTS = 11000  # Prometheus' own per-series limit for query_range
+
+class PrometheusState:
+    def __init__(self, series: int):
+        self.lock = threading.Lock()
+        self.series = series
+        self.requests = 0
+        self.connections = 0
+        self.errors = 0
+        self.reloads = 0
+
+    def labels(self, query: str, i: int):
+        return {"instance": f"host{i:05d}:9182", "job": "windows_exporter", "group": f"g{i % 10}",
+                "__query__": query[:40]}
+
+class StubPrometheusHandler(StubHandler):
+    def _params(self, query):
+        if self.command == "POST" and "form" in (self.headers.get("Content-Type") or ""):
+            n = int(self.headers.get("Content-Length") or 0)
+            query = dict(query, **parse_qs(self.rfile.read(n).decode("utf-8")))
+        return {k: v[-1] for k, v in query.items()}
+
+    def _serve(self):
+        begun = self._begin()
+        if begun is None:
+            return
+        st, path, query = begun
+        if path in ("/", "/graph", "/-/healthy", "/-/ready"):
+            # Real Prometheus redirects / to its UI (200 once followed); the app's health probe GETs the base URL
+            return self._send(200, {"status": "ok"})
+        if path == "/-/reload" and self.command == "POST":
+            with st.lock:
+                st.reloads += 1
+            return self._send(200, {})
+        if path == "/api/v1/status/buildinfo":
+            return self._send(200, {"status": "success", "data": {"version": "stub"}})
+        params = self._params(query)
+        if path == "/api/v1/query":
+            now = float(params.get("time") or time.time())
+            result = [{"metric": st.labels(params.get("query", ""), i), "value": [now, str(i % 100)]}
+                      for i in range(st.series)]
+            return self._send(200, {"status": "success", "data": {"resultType": "vector", "result": result}})
+        if path == "/api/v1/query_range":
+            try:
+                start, end = float(params["start"]), float(params["end"])
+                step = float(params.get("step") or 15)
+            except (KeyError, ValueError):
+                return self._send(400, {"status": "error", "errorType": "bad_data", "error": "invalid start/end/step"})
+            points = int((end - start) // step) + 1 if end >= start and step > 0 else 0
+            if points > MAX_POINTS:
+                return self._send(400, {"status": "error", "errorType": "bad_data",
+                                        "error": "exceeded maximum resolution of 11,000 points per timeseries"})
+            result = [{"metric": st.labels(params.get("query", ""), i),
+                       "values": [[start + k * step, str((i + k) % 100)] for k in range(points)]}
+                      for i in range(st.series)]
+            return self._send(200, {"status": "success", "data": {"resultType": "matrix", "result": result}})
+        self._send(404, {"status": "error", "error": "not found"})
+
+    do_GET = _serve
+    do_POST = _serve
+
+def start_stub(host="127.0.0.1", port=0, latency_ms=0.0, error_rate=0.0, series=10, seed=0):
+    """Start the stub Prometheus in a daemon thread; returns (server, base_url)."""
+    return serve(StubPrometheusHandler, PrometheusState(series), host, port, latency_ms, 0.0, error_rate, seed)
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Stub Prometheus HTTP API")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=9091)
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    ap.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    ap.add_argument("--series", type=int, default=10, help="series per query result")
+    ap.add_argument("--seed", type=int, default=0)
+    a = ap.parse_args()
+    server, url = start_stub(a.host, a.port, a.latency_ms, a.error_rate, a.series, a.seed)
+    print(f"Stub Prometheus listening on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
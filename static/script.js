@@ -22,6 +22,25 @@ async function fetchJSON(url, opts = {}) {
   return ct.includes('application/json') ? res.json() : res.text();
 }
 
+// Fill a <tbody> from rows of cell values; text is set with textContent, never parsed as HTML
+function fillTable(body, rows, emptyText) {
+  const trs = rows.map((cells) => {
+    const tr = document.createElement('tr');
+    for (const cell of cells) {
+      const td = document.createElement('td');
+      td.append(cell);
+      tr.appendChild(td);
+    }
+    return tr;
+  });
+  if (!trs.length) {
+    const tr = document.createElement('tr'), td = document.createElement('td');
+    td.colSpan = 3; td.className = 'muted'; td.textContent = emptyText;
+    tr.appendChild(td); trs.push(tr);
+  }
+  body.replaceChildren(...trs);
+}
+
 
 async function refreshStatus() {
   const ps = document.getElementById('prom-status');
@@ -245,9 +264,58 @@ async function saveAlertsAjax() {
   }
 }
 
+// Live status + resource values over Server-Sent Events (one shared server-side poller).
+// Falls back to polling /api/status and /api/metrics/live when EventSource is unavailable or the stream is
+// closed for good (under a WSGI server /api/metrics/stream answers 204: the stream is only served in ASGI mode).
+let liveStarted = false;
+function startLiveUpdates(onStatus, poll) {
+  if (liveStarted) return;
+  liveStarted = true;
+  const pollLive = async () => {
+    const body = document.getElementById('live-metrics');
+    if (!body) return;
+    try {
+      renderLive((await fetchJSON('/api/metrics/live')).values || {});
+    } catch (e) {
+      fillTable(body, [], 'Error: ' + e.message);
+    }
+  };
+  const tick = () => { poll(); pollLive(); };
+  const startPolling = () => { tick(); setInterval(tick, 10000); };
+  if (!window.EventSource) { startPolling(); return; }
+  const values = {};
+  const applyStatus = (s) => { if (s && Object.keys(s).length) onStatus(s); };
+  const es = new EventSource('/api/metrics/stream');
+  es.addEventListener('snapshot', (ev) => {
+    const d = JSON.parse(ev.data);
+    for (const k of Object.keys(values)) delete values[k];
+    Object.assign(values, d.values || {});
+    applyStatus(d.status);
+    renderLive(values);
+  });
+  es.addEventListener('delta', (ev) => {
+    const d = JSON.parse(ev.data);
+    for (const [m, set] of Object.entries(d.set || {})) values[m] = Object.assign(values[m] || {}, set);
+    for (const [m, gone] of Object.entries(d.del || {})) for (const k of gone) if (values[m]) delete values[m][k];
+    applyStatus(d.status);
+    renderLive(values);
+  });
+  es.onerror = () => { if (es.readyState === EventSource.CLOSED) startPolling(); };
+}
+
+function renderLive(values) {
+  const body = document.getElementById('live-metrics');
+  if (!body) return;
+  const rows = [];
+  for (const m of ['cpu', 'memory', 'disk']) {
+    for (const [series, v] of Object.entries(values[m] || {}).sort()) {
+      rows.push([m, series, v === null ? '-' : `${v.toFixed(1)}%`]);
+    }
+  }
+  fillTable(body, rows, 'no data yet');
+}
+
 document.addEventListener('DOMContentLoaded', ()=>{
-  refreshStatus();
-  setInterval(refreshStatus, 10000);
   const p = document.getElementById('btn-provision'); if (p) p.addEventListener('click', provisionDashboard);
   const gi = document.getElementById('btn-graf-info'); if (gi) gi.addEventListener('click', grafInfo);
   const sa = document.getElementById('btn-alert-save-ajax'); if (sa) sa.addEventListener('click', saveAlertsAjax);
@@ -268,7 +336,12 @@ document.addEventListener('DOMContentLoaded', ()=>{
       paintStatus(false, ps); paintStatus(false, gs);
     }
   }
-  refreshStatus(); setInterval(refreshStatus, 10000);
+  if (document.getElementById('prom-status')) {
+    startLiveUpdates((s) => {
+      paintStatus(!!s.prometheus, document.getElementById('prom-status'));
+      paintStatus(!!s.grafana, document.getElementById('graf-status'));
+    }, refreshStatus);
+  }
 
   // Buttons
   const p = document.getElementById('btn-provision');
@@ -291,6 +364,33 @@ document.addEventListener('DOMContentLoaded', ()=>{
   if (sa) sa.addEventListener('click', saveAlertsAjax);
 });
 
+// User portal: latest value of each dashboard query via the cached /api/metrics proxy
+async function loadCurrentValues() {
+  const body = document.getElementById('user-metrics');
+  if (!body) return;
+  try {
+    const queries = await fetchJSON('/api/metrics/queries');
+    const rows = [];
+    for (const ref of Object.keys(queries)) {
+      const res = await fetchJSON('/api/metrics/query?ref=' + encodeURIComponent(ref));
+      for (const s of (res.data && res.data.result) || []) {
+        const labels = document.createElement('code');
+        labels.textContent = Object.entries(s.metric || {}).map(([k, v]) => `${k}="${v}"`).join(', ');
+        const value = Number(s.value && s.value[1]);
+        rows.push([ref, labels, isNaN(value) ? '-' : value.toFixed(2)]);
+      }
+    }
+    fillTable(body, rows, 'no data');
+  } catch (e) {
+    fillTable(body, [], 'Error: ' + e.message);
+  }
+}
+
+document.addEventListener('DOMContentLoaded', () => {
+  loadCurrentValues();
+  if (document.getElementById('user-metrics')) setInterval(loadCurrentValues, 15000);
+});
+
 // Back button logic (works on all pages that include #btn-back)
 document.addEventListener('DOMContentLoaded', () => {
   const back = document.getElementById('btn-back');
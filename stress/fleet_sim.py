@@ -0,0 +1,342 @@
+"""
+Simulated windows_exporter fleet: N virtual Windows hosts served over HTTP in
+windows_exporter's exposition format, so rules.yml and the dashboard can be
+exercised at fleet scale on Linux.
+
+    python -m stress.fleet_sim --hosts 10000 --port 9182 --profile incident --write-sd stress/fleet_sd.json
+    prometheus --config.file=stress/prometheus_fleet.yml
+
+Series per host: windows_cpu_time_total (per core x mode), windows_memory_*
+and windows_logical_disk_* (per volume). All state lives in flat
+array('d') buffers and every series' label prefix is built once at start, so
+a tick is a pass over the arrays and a scrape is a join (cached until the
+next tick). 10k hosts with the defaults are 210k series (21 per host) in one process.
+
+Endpoints:
+    /metrics?shard=i&shards=n   hosts i/n of the fleet, with instance/group labels
+                                (scrape with honor_labels: true)
+    /hosts/<name>/metrics       one host, no instance/group labels (they come from file_sd)
+    /sim/status                 fleet size, tick and render timings
+
+Load profiles are functions profile(fleet, t) that set fleet.cpu, fleet.mem
+(per host) and fleet.disk (per host x volume) to utilisation in [0, 1] at
+t seconds since start. Pick a built-in with --profile steady|diurnal|incident,
+or pass --profile path/to/file.py:function for your own.
+"""
+import argparse, gzip, importlib.util, json, math, os, random, re, threading, time
+from array import array
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+GIB = 1024 ** 3
+CPU_MODES = ("idle", "user", "privileged", "interrupt", "dpc")
+
+class Fleet:
+    """Array-backed state of every virtual host; index h is host h, h * n_volumes + v its volume v."""
+
+    def __init__(self, hosts: int, cores: int = 2, volumes: Sequence[str] = ("C:", "D:"), groups: int = 10,
+                 seed: int = 1, prefix: str = "win"):
+        rng = random.Random(seed)
+        self.n, self.cores, self.volumes = hosts, cores, tuple(volumes)
+        nv = len(self.volumes)
+        self.names = [f"{prefix}-{i:05d}" for i in range(hosts)]
+        self.groups = [f"g{i % groups:02d}" for i in range(hosts)]
+        self.rng = rng
+        # Per-host traits profiles can build on
+        self.base = array("d", (rng.uniform(0.05, 0.35) for _ in range(hosts)))
+        self.phase = array("d", (rng.random() for _ in range(hosts)))
+        # Utilisation inputs in [0, 1], written by the load profile every tick
+        self.cpu = array("d", self.base)
+        self.mem = array("d", (rng.uniform(0.3, 0.6) for _ in range(hosts)))
+        self.disk = array("d", (rng.uniform(0.2, 0.6) for _ in range(hosts * nv)))
+        # Exported state
+        self.mem_total = array("d", (rng.choice((8, 16, 32, 64)) * GIB for _ in range(hosts)))
+        self.mem_available = array("d", bytes(8 * hosts))
+        self.mem_committed = array("d", bytes(8 * hosts))
+        self.disk_size = array("d", (rng.choice((128, 256, 512, 1024, 2048)) * GIB for _ in range(hosts * nv)))
+        self.disk_free = array("d", bytes(8 * hosts * nv))
+        self.disk_read = array("d", bytes(8 * hosts * nv))
+        self.disk_write = array("d", bytes(8 * hosts * nv))
+        self.cpu_time = array("d", bytes(8 * hosts * cores * len(CPU_MODES)))
+        self.t = 0.0
+        self.advance(0.0)
+
+    def advance(self, dt: float):
+        """Move counters forward by dt seconds at the current utilisation and refresh the gauges."""
+        nm, cores = len(CPU_MODES), self.cores
+        ct = self.cpu_time
+        for h in range(self.n):
+            u = min(1.0, max(0.0, self.cpu[h]))
+            busy, idle = dt * u, dt * (1.0 - u)
+            i = h * cores * nm
+            for _ in range(cores):  # busy time splits 70/25/3/2 over user/privileged/interrupt/dpc
+                ct[i] += idle
+                ct[i + 1] += busy * 0.70
+                ct[i + 2] += busy * 0.25
+                ct[i + 3] += busy * 0.03
+                ct[i + 4] += busy * 0.02
+                i += nm
+            m = min(1.0, max(0.0, self.mem[h]))
+            self.mem_available[h] = self.mem_total[h] * (1.0 - m)
+            self.mem_committed[h] = self.mem_total[h] * min(1.5, m * 1.2)
+        for j in range(len(self.disk_size)):
+            d = min(1.0, max(0.0, self.disk[j]))
+            self.disk_free[j] = self.disk_size[j] * (1.0 - d)
+            io = dt * self.cpu[j // len(self.volumes)] * 40e6
+            self.disk_read[j] += io
+            self.disk_write[j] += io * 0.4
+        self.t += dt
+
+# --- Load profiles: profile(fleet, t) sets fleet.cpu / fleet.mem / fleet.disk ---
+
+def steady(fleet: Fleet, t: float):
+    """Each host idles around its own base load with a little noise."""
+    rnd = fleet.rng.random
+    for h in range(fleet.n):
+        fleet.cpu[h] = fleet.base[h] + (rnd() - 0.5) * 0.1
+
+def diurnal(fleet: Fleet, t: float, period: float = 3600.0, amplitude: float = 0.35):
+    """Business-hours wave (one `period` per simulated day), phase-shifted per host."""
+    rnd = fleet.rng.random
+    for h in range(fleet.n):
+        wave = 0.5 + 0.5 * math.sin(2 * math.pi * (t / period + fleet.phase[h]))
+        fleet.cpu[h] = fleet.base[h] + amplitude * wave + (rnd() - 0.5) * 0.05
+        fleet.mem[h] = 0.35 + 0.3 * wave
+
+def incident(fleet: Fleet, t: float, fraction: float = 0.05, burn: float = 360.0):
+    """
+    Steady fleet where, every `burn` seconds, a fresh `fraction` of hosts runs
+    what stress/*.ps1 do to one box: CPU pinned at ~100%, memory climbing to
+    95% over the window and a disk filling to 97%. Enough to fire HighCPU,
+    HighMemory and HighDisk on a known set of hosts.
+    """
+    steady(fleet, t)
+    window, into = divmod(t, burn)
+    chosen = random.Random(int(window)).sample(range(fleet.n), max(1, int(fleet.n * fraction)))
+    ramp = into / burn
+    nv = len(fleet.volumes)
+    for h in chosen:
+        fleet.cpu[h] = 0.97 + fleet.rng.random() * 0.03
+        fleet.mem[h] = max(fleet.mem[h], 0.6 + 0.35 * ramp)
+        fleet.disk[h * nv] = max(fleet.disk[h * nv], 0.7 + 0.27 * ramp)
+
+PROFILES: Dict[str, Callable[[Fleet, float], None]] = {"steady": steady, "diurnal": diurnal, "incident": incident}
+
+def load_profile(spec: str) -> Callable[[Fleet, float], None]:
+    if spec in PROFILES:
+        return PROFILES[spec]
+    path, _, func = spec.partition(":")
+    module_spec = importlib.util.spec_from_file_location("fleet_profile", path)
+    if module_spec is None or not os.path.exists(path):
+        raise SystemExit(f"unknown profile {spec!r}; use {', '.join(PROFILES)} or path/to/file.py:function")
+    module = importlib.util.module_from_spec(module_spec)
+    module_spec.loader.exec_module(module)
+    return getattr(module, func or "profile")
+
+# --- Exposition ---
+
+class Family:
+    """One metric family: HELP/TYPE, per-series label prefixes (host-major) and the array holding the values."""
+    __slots__ = ("name", "help", "type", "prefixes", "values", "per_host", "labels")
+
+    def __init__(self, name: str, help_text: str, mtype: str, values: array, per_host: int,
+                 labels: List[str], fleet: Fleet):
+        self.name, self.help, self.type = name, help_text, mtype
+        self.values, self.per_host, self.labels = values, per_host, labels
+        self.prefixes = [f'{name}{{instance="{fleet.names[i // per_host]}",group="{fleet.groups[i // per_host]}"'
+                         f'{labels[i % per_host]}}} ' for i in range(fleet.n * per_host)]
+
+    def render(self, h0: int, h1: int) -> str:
+        lo, hi = h0 * self.per_host, h1 * self.per_host
+        lines = [p + repr(v) for p, v in zip(self.prefixes[lo:hi], self.values[lo:hi])]
+        return f"# HELP {self.name} {self.help}\n# TYPE {self.name} {self.type}\n" + "\n".join(lines) + "\n"
+
+    def render_host(self, h: int) -> str:
+        lo = h * self.per_host
+        lines = (f"{self.name}{{{self.labels[k][1:]}}} {self.values[lo + k]!r}" if self.labels[k]
+                 else f"{self.name} {self.values[lo + k]!r}" for k in range(self.per_host))
+        return f"# HELP {self.name} {self.help}\n# TYPE {self.name} {self.type}\n" + "\n".join(lines) + "\n"
+
+def families(fleet: Fleet) -> List[Family]:
+    cpu_labels = [f',core="0,{c}",mode="{m}"' for c in range(fleet.cores) for m in CPU_MODES]
+    vol_labels = [f',volume="{v}"' for v in fleet.volumes]
+    return [
+        Family("windows_cpu_time_total", "Time that processor spent in different modes (dpc, idle, interrupt, "
+               "privileged, user)", "counter", fleet.cpu_time, len(cpu_labels), cpu_labels, fleet),
+        Family("windows_memory_available_bytes", "The amount of physical memory immediately available for "
+               "allocation to a process or for system use.", "gauge", fleet.mem_available, 1, [""], fleet),
+        Family("windows_memory_physical_total_bytes", "Total physical memory.", "gauge", fleet.mem_total, 1, [""],
+               fleet),
+        Family("windows_memory_committed_bytes", "Committed virtual memory.", "gauge", fleet.mem_committed, 1, [""],
+               fleet),
+        Family("windows_logical_disk_size_bytes", "Total space in bytes, updates every 10-15 min.", "gauge",
+               fleet.disk_size, len(vol_labels), vol_labels, fleet),
+        Family("windows_logical_disk_free_bytes", "Free space in bytes, updates every 10-15 min.", "gauge",
+               fleet.disk_free, len(vol_labels), vol_labels, fleet),
+        Family("windows_logical_disk_read_bytes_total", "The number of bytes transferred from the disk during "
+               "read operations.", "counter", fleet.disk_read, len(vol_labels), vol_labels, fleet),
+        Family("windows_logical_disk_write_bytes_total", "The number of bytes transferred to the disk during "
+               "write operations.", "counter", fleet.disk_write, len(vol_labels), vol_labels, fleet),
+    ]
+
+class Simulator:
+    """Runs the profile every `tick` seconds and caches rendered (and gzipped) bodies until the next tick."""
+
+    def __init__(self, fleet: Fleet, profile: Callable[[Fleet, float], None], tick: float = 5.0):
+        self.fleet, self.profile, self.tick = fleet, profile, tick
+        self.families = families(fleet)
+        self.index = {name: h for h, name in enumerate(fleet.names)}
+        self.lock = threading.Lock()
+        self.version = 0
+        self._cache: Dict[Tuple[int, int, bool], Tuple[int, bytes]] = {}
+        self.stats = {"ticks": 0, "tick_ms": 0.0, "renders": 0, "render_ms": 0.0, "body_bytes": 0}
+        self.started = time.monotonic()
+        self.profile(fleet, 0.0)
+
+    def run(self):
+        last = time.monotonic()
+        while True:
+            time.sleep(max(0.0, self.tick - (time.monotonic() - last)))
+            now = time.monotonic()
+            t0 = time.perf_counter()
+            with self.lock:
+                self.profile(self.fleet, now - self.started)
+                self.fleet.advance(now - last)
+                self.version += 1
+                self._cache.clear()
+            self.stats["ticks"] += 1
+            self.stats["tick_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+            last = now
+
+    def body(self, shard: int, shards: int, gzipped: bool) -> bytes:
+        key = (shard, shards, gzipped)
+        with self.lock:
+            hit = self._cache.get(key)
+            if hit is not None and hit[0] == self.version:
+                return hit[1]
+            t0 = time.perf_counter()
+            n = self.fleet.n
+            h0, h1 = n * shard // shards, n * (shard + 1) // shards
+            raw = self._cache.get((shard, shards, False))
+            if raw is not None and raw[0] == self.version:
+                data = raw[1]
+            else:
+                data = "".join(f.render(h0, h1) for f in self.families).encode("utf-8")
+                self._cache[(shard, shards, False)] = (self.version, data)
+            if gzipped:
+                data = gzip.compress(data, compresslevel=1)
+                self._cache[key] = (self.version, data)
+            self.stats["renders"] += 1
+            self.stats["render_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+            self.stats["body_bytes"] = len(data)
+            return data
+
+    def host_body(self, name: str) -> Optional[bytes]:
+        h = self.index.get(name)
+        if h is None:
+            return None
+        with self.lock:
+            return "".join(f.render_host(h) for f in self.families).encode("utf-8")
+
+    def status(self) -> Dict[str, object]:
+        series = sum(f.per_host for f in self.families) * self.fleet.n
+        return dict(self.stats, hosts=self.fleet.n, series=series, tick_s=self.tick, version=self.version,
+                    simulated_s=round(self.fleet.t, 1))
+
+_HOST_PATH = re.compile(r"^/hosts/([^/]+)/metrics$")
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _reply(self, code: int, body: bytes, content_type: str, encoding: Optional[str] = None):
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        sim: Simulator = self.server.sim
+        parts = urlsplit(self.path)
+        text = "text/plain; version=0.0.4; charset=utf-8"
+        if parts.path == "/metrics":
+            q = parse_qs(parts.query)
+            try:
+                shards = max(1, int(q.get("shards", ["1"])[0]))
+                shard = int(q.get("shard", ["0"])[0])
+                if not 0 <= shard < shards:
+                    raise ValueError
+            except ValueError:
+                return self._reply(400, b"shard must be in [0, shards)\n", "text/plain")
+            gz = "gzip" in (self.headers.get("Accept-Encoding") or "")
+            return self._reply(200, sim.body(shard, shards, gz), text, "gzip" if gz else None)
+        m = _HOST_PATH.match(parts.path)
+        if m:
+            body = sim.host_body(m.group(1))
+            if body is None:
+                return self._reply(404, b"unknown host\n", "text/plain")
+            return self._reply(200, body, text)
+        if parts.path == "/sim/status":
+            return self._reply(200, json.dumps(sim.status()).encode(), "application/json")
+        self._reply(404, b"not found\n", "text/plain")
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+def file_sd(fleet: Fleet, address: str, mode: str, shards: int = 1) -> List[Dict[str, object]]:
+    """file_sd_configs target groups: one per host (per-host paths) or one per shard (honor_labels)."""
+    if mode == "host":
+        return [{"targets": [address], "labels": {"__metrics_path__": f"/hosts/{name}/metrics", "instance": name,
+                                                  "group": group}}
+                for name, group in zip(fleet.names, fleet.groups)]
+    return [{"targets": [address], "labels": {"__param_shard": str(i), "__param_shards": str(shards),
+                                              "shard": str(i)}} for i in range(shards)]
+
+def start(fleet: Fleet, profile: Callable[[Fleet, float], None], host: str = "127.0.0.1", port: int = 0,
+          tick: float = 5.0) -> Tuple[Server, Simulator, str]:
+    """Start the simulator and its HTTP server in daemon threads; returns (server, simulator, base_url)."""
+    sim = Simulator(fleet, profile, tick)
+    server = Server((host, port), Handler)
+    server.sim = sim
+    threading.Thread(target=sim.run, name="fleet-tick", daemon=True).start()
+    threading.Thread(target=server.serve_forever, name="fleet-http", daemon=True).start()
+    return server, sim, f"http://{host}:{server.server_address[1]}"
+
+def main():
+    ap = argparse.ArgumentParser(description="Simulated windows_exporter fleet")
+    ap.add_argument("--hosts", type=int, default=1000)
+    ap.add_argument("--cores", type=int, default=2, help="CPU cores per host (5 windows_cpu_time_total series each)")
+    ap.add_argument("--volumes", default="C:,D:")
+    ap.add_argument("--groups", type=int, default=10, help="distinct values of the group label")
+    ap.add_argument("--profile", default="diurnal", help=f"{'|'.join(PROFILES)} or path/to/file.py:function")
+    ap.add_argument("--tick", type=float, default=5.0, help="seconds between state updates")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=9182)
+    ap.add_argument("--write-sd", help="write a file_sd target file for Prometheus")
+    ap.add_argument("--sd-mode", choices=("shard", "host"), default="shard")
+    ap.add_argument("--shards", type=int, default=10, help="scrape targets the fleet is split into (--sd-mode shard)")
+    a = ap.parse_args()
+    t0 = time.perf_counter()
+    fleet = Fleet(a.hosts, a.cores, [v for v in a.volumes.split(",") if v], a.groups, a.seed)
+    server, sim, url = start(fleet, load_profile(a.profile), a.host, a.port, a.tick)
+    print(f"{a.hosts} hosts ({sim.status()['series']} series) ready in {time.perf_counter() - t0:.1f}s on {url}")
+    if a.write_sd:
+        tmp = a.write_sd + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(file_sd(fleet, f"{a.host}:{server.server_address[1]}", a.sd_mode, a.shards), f, indent=1)
+        os.replace(tmp, a.write_sd)
+        print(f"file_sd targets written to {a.write_sd} ({a.sd_mode} mode)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()